@@ -0,0 +1,208 @@
+"""
+Admission control for expensive routes.
+
+``AdmissionControlMiddleware`` guards selected routes (the bcrypt-backed
+``/token`` and ``/register``) before they reach the app:
+
+1. Token buckets throttle each client IP and, where the route carries one,
+   each username. An empty bucket gets an immediate 429 with ``Retry-After``.
+2. A per-route concurrency limit with a short bounded queue. Requests that
+   find the queue full, or wait longer than the queue timeout, get an
+   immediate 503 with a jittered ``Retry-After`` so a herd of clients does not
+   come back in lockstep.
+
+Bucket state lives in a ``RateLimitStore``. ``InMemoryRateLimitStore`` keeps it
+per process; ``load_store`` accepts ``"module:Class"`` for a shared backend.
+"""
+
+import asyncio
+import importlib
+import json
+import math
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+# Auth request bodies are tiny; anything larger is rejected before parsing
+MAX_BODY_BYTES = 64 * 1024
+
+
+class Rate:
+    """Token bucket refilled at ``per_minute`` tokens a minute, holding up to ``burst``"""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.per_second = per_minute / 60.0
+        self.burst = burst
+
+
+class RateLimitStore:
+    async def take(self, key: str, rate: Rate) -> float:
+        """Take one token from ``key``'s bucket.
+
+        Returns 0 when a token was available, otherwise the seconds until one
+        will be.
+        """
+        raise NotImplementedError
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """Per-process buckets, least recently used evicted beyond ``max_keys``"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: Rate) -> float:
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (rate.burst, now))
+        tokens = min(rate.burst, tokens + (now - updated) * rate.per_second)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate.per_second
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return wait
+
+
+def load_store(spec: str) -> RateLimitStore:
+    """``"memory"`` or an importable ``"module:Class"`` taking no arguments"""
+    if spec == "memory":
+        return InMemoryRateLimitStore()
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int, max_queue: int, queue_timeout: float):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+
+    async def acquire(self) -> bool:
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+        return True
+
+    def release(self):
+        self.semaphore.release()
+
+
+class RouteLimit:
+    """Admission rules for one route; ``username_rate`` needs a body with a username"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float,
+                 ip_rate: Optional[Rate] = None, username_rate: Optional[Rate] = None):
+        self.limiter = ConcurrencyLimiter(max_concurrency, max_queue, queue_timeout)
+        self.ip_rate = ip_rate
+        self.username_rate = username_rate
+
+
+def _replay(body: bytes, receive):
+    sent = False
+
+    async def replay_receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+    return replay_receive
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _username_from_body(scope, body: bytes) -> Optional[str]:
+    content_type = Request(scope).headers.get("content-type", "")
+    try:
+        if content_type.startswith("application/json"):
+            username = json.loads(body).get("username")
+        else:
+            form = await Request(scope, _replay(body, None)).form()
+            username = form.get("username")
+    except Exception:
+        return None  # malformed bodies are left for the route to reject
+    if not isinstance(username, str) or not username.strip():
+        return None
+    return username.strip().lower()[:128]
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, app, limits: Dict[Tuple[str, str], RouteLimit], store: RateLimitStore,
+                 rejected=None, retry_after: int = 1):
+        self.app = app
+        self.limits = limits
+        self.store = store
+        self.rejected = rejected
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+
+        if limit.ip_rate is not None:
+            client = scope.get("client")
+            wait = await self.store.take(f"{path}|ip|{client[0] if client else '-'}", limit.ip_rate)
+            if wait:
+                await self._reject(scope, receive, send, 429, "Too many requests, slow down", wait, "ip")
+                return
+
+        if limit.username_rate is not None:
+            body = await _read_body(receive)
+            if body is None:
+                await self._reject(scope, receive, send, 413, "Request body too large", None, "body")
+                return
+            receive = _replay(body, receive)
+            username = await _username_from_body(scope, body)
+            if username is not None:
+                wait = await self.store.take(f"{path}|user|{username}", limit.username_rate)
+                if wait:
+                    await self._reject(scope, receive, send, 429, "Too many attempts for this account", wait, "username")
+                    return
+
+        if not await limit.limiter.acquire():
+            # Spread retries out so shed clients do not return all at once
+            wait = self.retry_after * (1 + random.random())
+            await self._reject(scope, receive, send, 503, "Server is busy, please try again shortly", wait, "overloaded")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.limiter.release()
+
+    async def _reject(self, scope, receive, send, status_code, detail, retry_after, reason):
+        if self.rejected is not None:
+            self.rejected.inc(scope["path"], reason)
+        headers = {"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after else None
+        response = JSONResponse({"detail": detail}, status_code=status_code, headers=headers)
+        await response(scope, receive, send)
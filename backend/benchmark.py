@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark suite for the Todo App API.
+
+Boots the backend in a subprocess against a local stand-in database (a fresh
+SQLite file by default, or a local mongod), seeds users and todos, then drives
+a weighted mix of /token, /users/me and /todos CRUD requests from concurrent
+clients. Throughput and p50/p95/p99 latency are recorded per route and can be
+saved as a JSON baseline and compared against a later run.
+
+Usage:
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.15
+    python benchmark.py --backend mongodb --mongodb-url mongodb://localhost:27017
+    python benchmark.py --mix create=1,update=1 --write-batching   # writes/sec with group commit
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loadtest import ApiClient, percentile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MIX = "token=1,me=9,list=40,get=20,create=12,update=12,delete=6"
+
+# Seeded descriptions cycle through these, so searches (--mix ...,search=10)
+# match a known fraction of each user's todos
+SEARCH_WORDS = ["groceries", "report", "dentist", "garden", "invoice", "laundry", "meeting", "flights"]
+SEARCH_PREFIXES = [word[:3] for word in SEARCH_WORDS]
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight)
+    unknown = set(weights) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"❌ Unknown operations in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(args, port, workdir):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_BACKEND": args.backend,
+        "SQLITE_PATH": os.path.join(workdir, "benchmark.db"),
+        "MONGODB_URL": args.mongodb_url,
+        "MONGODB_TLS": "false",
+        "DATABASE_NAME": f"todo_benchmark_{port}",
+        "SECRET_KEY": "benchmark-secret",
+        # Every client logs in from 127.0.0.1, so lift the per-IP and
+        # per-username login limits meant for real traffic
+        "AUTH_IP_RATE_PER_MINUTE": "1000000",
+        "AUTH_IP_BURST": "1000000",
+        "AUTH_USERNAME_RATE_PER_MINUTE": "1000000",
+        "AUTH_USERNAME_BURST": "1000000",
+        "TODOS_WRITE_BATCHING": "true" if args.write_batching else "false",
+        "TODOS_WRITE_BATCH_WINDOW_MS": str(args.write_batch_window_ms),
+    })
+    log = open(os.path.join(workdir, "server.log"), "w")
+    if args.workers > 1:
+        # The supported multi-worker setup (see gunicorn.conf.py)
+        command = [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py",
+                   "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--log-level", "warning"]
+    process = subprocess.Popen(
+        command,
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"❌ Server exited early, see {log.name}")
+        try:
+            status, _ = ApiClient(base_url).request("GET", "/health")
+            if status == 200:
+                return process, base_url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("❌ Server did not become ready within 60s")
+
+
+class Workload:
+    """Seeded users and the todo ids each of them owns.
+
+    Seeded todos are only read and updated; deletes consume todos created
+    during the run, so concurrent clients never race on a deleted id.
+    """
+
+    def __init__(self, base_url, rng):
+        self.base_url = base_url
+        self.rng = rng
+        self.users = []  # (username, password, token)
+        self.todo_ids = {}  # username -> seeded ids
+        self.created_ids = {}  # username -> ids created during the run
+        self.lock = threading.Lock()
+
+    def seed(self, users, todos_per_user):
+        for i in range(users):
+            username = f"bench_user_{i}"
+            password = f"bench-password-{i}"
+            client = ApiClient(self.base_url)
+            client.request("POST", "/register", body={
+                "username": username, "email": f"{username}@example.com", "password": password,
+            })
+            status, data = client.request("POST", "/token", form={"username": username, "password": password})
+            if status != 200:
+                raise SystemExit(f"❌ Could not log in seeded user {username}: {data[:200]!r}")
+            token = json.loads(data)["access_token"]
+            client.token = token
+            ids = []
+            remaining = todos_per_user
+            while remaining > 0:
+                size = min(remaining, 500)
+                status, data = client.request("POST", "/todos/batch", body={
+                    "todos": [{"title": f"Seeded todo {n}", "description": SEARCH_WORDS[n % len(SEARCH_WORDS)]}
+                              for n in range(size)]
+                })
+                if status != 200:
+                    raise SystemExit(f"❌ Seeding todos failed ({status}): {data[:200]!r}")
+                ids.extend(item["id"] for item in json.loads(data)["results"])
+                remaining -= size
+            self.users.append((username, password, token))
+            self.todo_ids[username] = ids
+            self.created_ids[username] = []
+
+    def pick_user(self, rng):
+        return rng.choice(self.users)
+
+    def pick_todo(self, rng, username):
+        ids = self.todo_ids[username]
+        return rng.choice(ids) if ids else None
+
+    def add_created(self, username, todo_id):
+        with self.lock:
+            self.created_ids[username].append(todo_id)
+
+    def take_created(self, username):
+        with self.lock:
+            ids = self.created_ids[username]
+            return ids.pop() if ids else None
+
+
+def op_token(client, workload, rng, user):
+    username, password, _ = user
+    return client.request("POST", "/token", form={"username": username, "password": password})
+
+
+def op_me(client, workload, rng, user):
+    return client.request("GET", "/users/me")
+
+
+def op_list(client, workload, rng, user):
+    return client.request("GET", "/todos?limit=50")
+
+
+def op_search(client, workload, rng, user):
+    return client.request("GET", f"/todos/search?q=seeded+{rng.choice(SEARCH_PREFIXES)}&limit=20")
+
+
+def op_get(client, workload, rng, user):
+    todo_id = workload.pick_todo(rng, user[0])
+    if todo_id is None:
+        return op_list(client, workload, rng, user)
+    return client.request("GET", f"/todos/{todo_id}")
+
+
+def op_create(client, workload, rng, user):
+    status, data = client.request("POST", "/todos", body={"title": "Benchmark todo", "description": "bench"})
+    if status == 200:
+        workload.add_created(user[0], json.loads(data)["id"])
+    return status, data
+
+
+def op_update(client, workload, rng, user):
+    todo_id = workload.pick_todo(rng, user[0])
+    if todo_id is None:
+        return op_create(client, workload, rng, user)
+    return client.request("PUT", f"/todos/{todo_id}", body={"completed": rng.random() < 0.5})
+
+
+def op_delete(client, workload, rng, user):
+    todo_id = workload.take_created(user[0])
+    if todo_id is None:
+        return op_create(client, workload, rng, user)
+    return client.request("DELETE", f"/todos/{todo_id}")
+
+
+OPERATIONS = {
+    "token": ("POST /token", op_token),
+    "me": ("GET /users/me", op_me),
+    "list": ("GET /todos", op_list),
+    "get": ("GET /todos/{id}", op_get),
+    "search": ("GET /todos/search", op_search),
+    "create": ("POST /todos", op_create),
+    "update": ("PUT /todos/{id}", op_update),
+    "delete": ("DELETE /todos/{id}", op_delete),
+}
+
+
+def run_worker(worker_id, base_url, workload, weights, deadline, seed, samples, lock):
+    rng = random.Random(seed + worker_id)
+    names = list(weights)
+    op_weights = list(weights.values())
+    clients = {}
+    local = {}
+    while time.perf_counter() < deadline:
+        op = rng.choices(names, weights=op_weights)[0]
+        route, fn = OPERATIONS[op]
+        user = workload.pick_user(rng)
+        client = clients.get(user[0])
+        if client is None:
+            client = clients[user[0]] = ApiClient(base_url, user[2])
+        started = time.perf_counter()
+        try:
+            status, _ = fn(client, workload, rng, user)
+            error = status >= 400
+        except OSError:
+            clients.pop(user[0], None)
+            error = True
+        elapsed = time.perf_counter() - started
+        latencies, errors = local.setdefault(route, ([], [0]))
+        latencies.append(elapsed)
+        errors[0] += error
+    with lock:
+        for route, (latencies, errors) in local.items():
+            route_latencies, route_errors = samples.setdefault(route, ([], [0]))
+            route_latencies.extend(latencies)
+            route_errors[0] += errors[0]
+
+
+def summarize(samples, elapsed):
+    routes = {}
+    for route, (latencies, errors) in sorted(samples.items()):
+        routes[route] = {
+            "requests": len(latencies),
+            "errors": errors[0],
+            "throughput": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        }
+    all_latencies = [value for latencies, _ in samples.values() for value in latencies]
+    total = {
+        "requests": len(all_latencies),
+        "errors": sum(errors[0] for _, errors in samples.values()),
+        "throughput": round(len(all_latencies) / elapsed, 2),
+        "p50_ms": round(percentile(all_latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(all_latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(all_latencies, 99) * 1000, 3),
+    }
+    return routes, total
+
+
+def compare(result, baseline, threshold):
+    """Return a list of human-readable regressions against the baseline"""
+    regressions = []
+    for route, stats in {**result["routes"], "TOTAL": result["total"]}.items():
+        before = baseline["total"] if route == "TOTAL" else baseline["routes"].get(route)
+        if not before:
+            continue
+        if before["throughput"] and stats["throughput"] < before["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{route}: throughput {before['throughput']:.1f} -> {stats['throughput']:.1f} req/s"
+            )
+        for key in ("p95_ms", "p99_ms"):
+            if before[key] and stats[key] > before[key] * (1 + threshold):
+                regressions.append(f"{route}: {key} {before[key]:.1f} -> {stats[key]:.1f} ms")
+    return regressions
+
+
+def print_report(result):
+    print(f"\n{'route':<22}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for route, stats in {**result["routes"], "TOTAL": result["total"]}.items():
+        print(f"{route:<22}{stats['throughput']:>10.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['errors']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Todo App API")
+    parser.add_argument("--backend", choices=["sqlite", "mongodb"], default="sqlite")
+    parser.add_argument("--mongodb-url", default="mongodb://localhost:27017")
+    parser.add_argument("--url", help="benchmark an already running server instead of booting one")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (gunicorn when > 1)")
+    parser.add_argument("--write-batching", action="store_true",
+                        help="group-commit single-todo writes (TODOS_WRITE_BATCHING)")
+    parser.add_argument("--write-batch-window-ms", type=float, default=2.0)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--todos-per-user", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted operations, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as a JSON baseline to this path")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="relative change that counts as a regression (default 0.15)")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="todo-bench-") as workdir:
+        process = None
+        if args.url:
+            base_url = args.url
+        else:
+            process, base_url = start_server(args, free_port(), workdir)
+        try:
+            print(f"🌱 Seeding {args.users} users x {args.todos_per_user} todos ({args.backend})")
+            workload = Workload(base_url, rng)
+            workload.seed(args.users, args.todos_per_user)
+
+            samples = {}
+            lock = threading.Lock()
+            phases = [("warmup", args.warmup), ("measure", args.duration)]
+            for phase, duration in phases:
+                if duration <= 0:
+                    continue
+                print(f"🚀 {phase}: {args.concurrency} clients for {duration:.0f}s")
+                samples = {}
+                deadline = time.perf_counter() + duration
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    for worker_id in range(args.concurrency):
+                        pool.submit(run_worker, worker_id, base_url, workload, weights,
+                                    deadline, args.seed, samples, lock)
+                elapsed = time.perf_counter() - started
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=10)
+
+    routes, total = summarize(samples, elapsed)
+    result = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "backend": args.backend,
+            "workers": args.workers,
+            "write_batching": args.write_batching,
+            "users": args.users,
+            "todos_per_user": args.todos_per_user,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": weights,
+            "seed": args.seed,
+        },
+        "routes": routes,
+        "total": total,
+    }
+    print_report(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ Regressions vs {args.compare} (threshold {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"\n✅ No regressions vs {args.compare} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+In-process fan-out of todo change events for the server-sent events stream.
+
+Every todo write publishes one event per user, tagged with the user's new
+todos_version. The event is rendered to an SSE frame once and handed to each
+of that user's open streams, so a change costs O(subscribers) regardless of
+how many todos the user has. A short per-user history lets reconnecting
+clients replay what they missed via ``Last-Event-ID``; when the gap is not
+covered, or a slow client's queue overflows, the client is told to resync.
+
+Versions are per user, shared through the database and bumped by one per
+change, so a change published by another worker process shows up here as a
+gap in the version sequence, which the stream also turns into a resync. For
+users with no further change here, the worker reads the stored versions of
+all its subscribed users at once and hands newer ones to ``notify``.
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Set
+
+RESYNC = "resync"
+
+
+def format_event(event_id: int, event_type: str, data: bytes) -> bytes:
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, event_type.encode(), data)
+
+
+class Subscription:
+    """One open stream: a bounded queue of ``(version, frame)`` pairs"""
+
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.lagged = False
+
+    def push(self, version: int, frame: bytes):
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait((version, frame))
+        except asyncio.QueueFull:
+            # Drop the backlog; the stream tells the client to refetch instead
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait((version, None))
+
+    async def get(self):
+        version, frame = await self.queue.get()
+        if frame is None:
+            self.lagged = False
+        return version, frame
+
+
+class TodoEventBroker:
+    def __init__(self, encode: Callable[[dict], bytes], queue_size: int = 256,
+                 history_size: int = 100, history_users: int = 10000):
+        self.encode = encode
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self.history_users = history_users
+        self.subscribers: Dict[str, Set[Subscription]] = {}
+        # user_id -> newest version seen here, for subscribed users
+        self.versions: Dict[str, int] = {}
+        # user_id -> deque of (version, frame), least recently written first
+        self.history: "OrderedDict[str, deque]" = OrderedDict()
+        self.published = 0
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id: str, subscription: Subscription):
+        subscriptions = self.subscribers.get(user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self.subscribers[user_id]
+            self.versions.pop(user_id, None)
+
+    def publish(self, user_id: str, version: int, event_type: str, data: dict):
+        frame = format_event(version, event_type, self.encode({"version": version, **data}))
+        self.published += 1
+
+        history = self.history.get(user_id)
+        if history is None:
+            history = self.history[user_id] = deque(maxlen=self.history_size)
+            if len(self.history) > self.history_users:
+                self.history.popitem(last=False)
+        else:
+            self.history.move_to_end(user_id)
+        history.append((version, frame))
+
+        subscriptions = self.subscribers.get(user_id)
+        if subscriptions:
+            self.versions[user_id] = max(version, self.versions.get(user_id, 0))
+            for subscription in subscriptions:
+                subscription.push(version, frame)
+
+    def notify(self, user_id: str, version: int):
+        """Resync the user's streams if the stored ``version`` is newer than
+        anything published here, i.e. another worker changed their todos"""
+        subscriptions = self.subscribers.get(user_id)
+        if not subscriptions or version <= self.versions.get(user_id, 0):
+            return
+        self.versions[user_id] = version
+        for subscription in subscriptions:
+            subscription.push(version, None)
+
+    def replay(self, user_id: str, last_version: int) -> Optional[List[tuple]]:
+        """Events after ``last_version``, or None if the history has a gap"""
+        history = self.history.get(user_id)
+        if not history:
+            return None
+        oldest = history[0][0]
+        if last_version < oldest - 1:
+            return None
+        missed = [(version, frame) for version, frame in history if version > last_version]
+        # Versions published by other workers are missing from this history
+        if any(version != last_version + i for i, (version, _) in enumerate(missed, 1)):
+            return None
+        return missed
+
+    def resync_frame(self, version: int) -> bytes:
+        return format_event(version, RESYNC, self.encode({"version": version}))
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.subscribers),
+            "streams": sum(len(s) for s in self.subscribers.values()),
+            "published": self.published,
+        }
@@ -0,0 +1,95 @@
+"""
+Group commit for single-todo writes.
+
+Under write-heavy load every ``insert_todo``/``update_todo``/``delete_todo``
+otherwise waits for its own commit: a ``w='majority'`` acknowledgement on
+MongoDB, a transaction on SQLite's single writer thread. ``WriteBatcher``
+queues writes that arrive close together and hands them to the repository's
+``apply_todo_writes`` as one group (one bulk write, or one transaction), then
+resolves each caller with its own result or exception.
+
+A batch is flushed once ``window`` seconds have passed since its first write or
+as soon as it holds ``max_batch`` writes. While a group is being committed the
+next one fills up, so with a window of 0 writes are still coalesced whenever
+the database is the bottleneck.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+
+class WriteBatcher:
+    def __init__(self, apply: Callable[[List[tuple]], Awaitable[list]], window: float, max_batch: int,
+                 batch_sizes=None):
+        self.apply = apply
+        self.window = window
+        self.max_batch = max_batch
+        self.batch_sizes = batch_sizes
+        self.pending: List[Tuple[tuple, asyncio.Future]] = []
+        self.flusher: Optional[asyncio.Task] = None
+        self.full = asyncio.Event()
+
+    async def submit(self, write: tuple):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((write, future))
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._flush_pending())
+        elif len(self.pending) >= self.max_batch:
+            self.full.set()
+        return await future
+
+    async def _flush_pending(self):
+        while self.pending:
+            if self.window and len(self.pending) < self.max_batch:
+                self.full.clear()
+                try:
+                    await asyncio.wait_for(self.full.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            if self.batch_sizes is not None:
+                self.batch_sizes.observe(len(batch))
+            try:
+                results = await self.apply([write for write, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue  # the caller went away; its write still happened
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def drain(self):
+        """Wait until every submitted write has been applied"""
+        if self.flusher is not None:
+            await self.flusher
+
+
+class GroupCommitRepository:
+    """Proxy that routes single-todo writes through a ``WriteBatcher``.
+
+    Everything else, including the bulk and filter-based writes that are
+    already one round trip, is passed straight to the wrapped repository.
+    """
+
+    def __init__(self, repository, window: float, max_batch: int, batch_sizes=None):
+        self._repository = repository
+        self._batcher = WriteBatcher(repository.apply_todo_writes, window, max_batch, batch_sizes)
+
+    def __getattr__(self, name):
+        return getattr(self._repository, name)
+
+    async def insert_todo(self, todo_doc: dict) -> dict:
+        return await self._batcher.submit(("insert", todo_doc))
+
+    async def update_todo(self, user_id: str, todo_id: str, update_data: dict) -> Optional[dict]:
+        return await self._batcher.submit(("update", user_id, todo_id, update_data))
+
+    async def delete_todo(self, user_id: str, todo_id: str) -> bool:
+        return await self._batcher.submit(("delete", user_id, todo_id))
+
+    async def close(self):
+        await self._batcher.drain()
+        await self._repository.close()
@@ -0,0 +1,26 @@
+"""
+Gunicorn settings for running the API with several worker processes:
+
+    gunicorn main:app -c gunicorn.conf.py
+
+Importing main opens no connections or threads (they are created in the app
+lifespan), so the app is preloaded once in the master and forked into
+workers, and every worker still gets its own database clients and pools.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# Async workers, so one per core is enough; WEB_CONCURRENCY overrides
+workers = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+worker_class = "uvicorn_worker.UvicornWorker"
+# Proxies whose X-Forwarded-For is trusted, so per-IP rate limits see real clients
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers periodically to bound memory growth (0 disables)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Report which index each route's queries use.
+
+Connects with the same configuration as the API (MongoDB, or the SQLite
+fallback), which makes sure the declared indexes exist, and prints the query plan
+chosen for every query shape the routes issue.
+
+Usage:
+    python index_report.py
+"""
+
+import asyncio
+import sqlite3
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+import main
+
+SAMPLE_USER_ID = str(ObjectId())
+SAMPLE_TODO_ID = ObjectId()
+SAMPLE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+SAMPLE_AFTER = (SAMPLE_TIME, str(SAMPLE_TODO_ID))
+
+# route -> (table, list_todos arguments). Both backends turn these into
+# queries with the repository's own builders, so the report follows them.
+LIST_SHAPES = [
+    ("GET /todos", "todos", {}),
+    ("GET /todos?cursor=", "todos", {"after": SAMPLE_AFTER}),
+    ("GET /todos?sort=-created_at&cursor=", "todos", {"sort": "-created_at", "after": SAMPLE_AFTER}),
+    ("GET /todos?sort=updated_at", "todos", {"sort": "updated_at"}),
+    ("GET /todos?sort=-updated_at&cursor=", "todos", {"sort": "-updated_at", "after": SAMPLE_AFTER}),
+    ("GET /todos?completed=", "todos", {"completed": False}),
+    ("GET /todos?completed=&sort=-updated_at&cursor=", "todos",
+     {"completed": True, "sort": "-updated_at", "after": SAMPLE_AFTER}),
+    ("GET /todos?created_after=&created_before=", "todos",
+     {"created_after": SAMPLE_TIME, "created_before": datetime(2025, 2, 1, tzinfo=timezone.utc)}),
+    ("GET /todos?tag=", "todos", {"tags": ["work"]}),
+    ("GET /todos?tag=&tag=&cursor=", "todos", {"tags": ["work", "home"], "after": SAMPLE_AFTER}),
+    ("GET /todos?tag=&completed=&sort=updated_at", "todos", {"tags": ["work"], "completed": False, "sort": "updated_at"}),
+    ("GET /todos?tag=&sort=-updated_at&cursor=", "todos", {"tags": ["work"], "sort": "-updated_at", "after": SAMPLE_AFTER}),
+    ("GET /todos?include_archived=true&tag= (archive)", "todos_archive", {"tags": ["work"]}),
+    ("GET /todos/archive?cursor=", "todos_archive", {"after": SAMPLE_AFTER}),
+]
+
+# route -> (collection, filter, sort) for the queries without a builder
+MONGO_ROUTE_QUERIES = [
+    ("POST /token, GET /users/me (user lookup)", "users", {"username": "alice"}, None),
+    ("POST /register (unique username)", "users", {"username": "alice"}, None),
+    ("POST /register (unique email)", "users", {"email": "alice@example.com"}, None),
+    ("GET /todos/{todo_id}, PUT, DELETE", "todos",
+     {"_id": SAMPLE_TODO_ID, "user_id": SAMPLE_USER_ID}, None),
+    ("GET /todos/{todo_id} (archived)", "todos_archive",
+     {"_id": SAMPLE_TODO_ID, "user_id": SAMPLE_USER_ID}, None),
+    ("GET /todos/search", "todos", {"user_id": SAMPLE_USER_ID, "$text": {"$search": '"milk"'}}, None),
+    ("GET /todos/search (prefix completions)", "todos",
+     {"user_id": SAMPLE_USER_ID, "$or": [{"title": {"$regex": r"\bmi", "$options": "i"}},
+                                         {"description": {"$regex": r"\bmi", "$options": "i"}}]},
+     [("created_at", 1), ("_id", 1)]),
+    ("archive job (candidates)", "todos", {"completed": True, "updated_at": {"$lt": SAMPLE_TIME}}, None),
+]
+
+# route -> (sql, params) for the queries without a builder
+SQLITE_ROUTE_QUERIES = [
+    ("POST /token, GET /users/me (user lookup)",
+     "SELECT * FROM users WHERE username = ?", ("alice",)),
+    ("POST /register (unique username)",
+     "SELECT 1 FROM users WHERE username = ?", ("alice",)),
+    ("POST /register (unique email)",
+     "SELECT 1 FROM users WHERE email = ?", ("alice@example.com",)),
+    ("GET /todos/{todo_id}, PUT, DELETE",
+     "SELECT * FROM todos WHERE id = ? AND user_id = ?", ("t", "u")),
+    ("GET /todos/{todo_id} (archived)",
+     "SELECT * FROM todos_archive WHERE id = ? AND user_id = ?", ("t", "u")),
+    ("archive job (candidates)",
+     "SELECT id, user_id FROM todos WHERE completed = 1 AND updated_at < ? ORDER BY updated_at LIMIT ?",
+     ("2025-01-01T00:00:00.000000+00:00", 500)),
+]
+
+
+def split_after(arguments: dict):
+    arguments = dict(arguments)
+    return arguments.pop("after", None), arguments
+
+
+def mongo_queries(repository):
+    queries = list(MONGO_ROUTE_QUERIES)
+    for route, collection_name, arguments in LIST_SHAPES:
+        after, filters = split_after(arguments)
+        queries.append((route, collection_name, *repository._page_query(SAMPLE_USER_ID, after, **filters)))
+    todo_query, tombstone_query = repository._changes_queries(SAMPLE_USER_ID, SAMPLE_AFTER)
+    queries.append(("GET /todos/changes (changed todos)", "todos", todo_query, [("updated_at", 1), ("_id", 1)]))
+    queries.append(
+        ("GET /todos/changes (tombstones)", "todo_tombstones", tombstone_query, [("deleted_at", 1), ("_id", 1)])
+    )
+    return queries
+
+
+def sqlite_queries(repository):
+    queries = list(SQLITE_ROUTE_QUERIES)
+    for route, table, arguments in LIST_SHAPES:
+        after, filters = split_after(arguments)
+        queries.append((route, *repository._page_query(table, None, "u", 101, after, **filters)))
+    todo_sql, tombstone_sql, params = repository._changes_queries("u", 101, SAMPLE_AFTER)
+    queries.append(("GET /todos/changes (changed todos)", todo_sql, params))
+    queries.append(("GET /todos/changes (tombstones)", tombstone_sql, params))
+    if repository.fts:
+        queries.append(("GET /todos/search", *repository._search_query("u", ["buy"], "mi", 51)))
+    return queries
+
+
+def find_stages(plan, found=None):
+    """Collect (stage, indexName) pairs from a MongoDB winning plan"""
+    if found is None:
+        found = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            found.append((plan["stage"], plan.get("indexName")))
+        for value in plan.values():
+            find_stages(value, found)
+    elif isinstance(plan, list):
+        for value in plan:
+            find_stages(value, found)
+    return found
+
+
+async def mongo_report():
+    for route, collection_name, query, sort in mongo_queries(main.repository):
+        cursor = main.db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        stages = find_stages(winning_plan)
+        indexes = [name for stage, name in stages if name]
+        if indexes:
+            print(f"✅ {route}: {', '.join(indexes)}")
+        else:
+            print(f"❌ {route}: {' -> '.join(stage for stage, _ in stages) or 'unknown plan'}")
+
+
+def sqlite_report():
+    conn = sqlite3.connect(main.SQLITE_PATH)
+    for route, sql, params in sqlite_queries(main.repository):
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        details = "; ".join(row[-1] for row in rows)
+        # WITHOUT ROWID tables (the tag tables) are searched by primary key
+        indexed = "INDEX" in details or "PRIMARY KEY" in details
+        # An index that finds the rows but not in order still leaves a sort
+        marker = "❌" if not indexed else "⚠️ " if "TEMP B-TREE" in details else "✅"
+        print(f"{marker} {route}: {details}")
+
+
+async def report():
+    await main.connect_database()
+    try:
+        print(f"📊 Index usage report ({'mongodb' if main.USE_MONGODB else 'sqlite'})")
+        print("=" * 50)
+        if main.USE_MONGODB:
+            await mongo_report()
+        else:
+            sqlite_report()
+    finally:
+        await main.close_database()
+
+
+def main_report():
+    asyncio.run(report())
+
+
+if __name__ == "__main__":
+    main_report()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Simple load test for the Todo App backend.
+
+Registers (or logs in) a test user, seeds a few todos and then hammers the
+read endpoints from many concurrent clients, printing throughput and latency.
+
+Usage:
+    python loadtest.py --url http://localhost:8000 --concurrency 50 --duration 15
+
+Add --token-flood N to run N extra clients that hammer POST /token for the whole
+run; the reported latencies still cover only the read endpoints, so this shows
+whether a login storm leaks into everybody else's /todos latency.
+
+Use --ndjson-items N to instead time a streaming POST /todos/import of N
+generated todos followed by GET /todos/export of the same user.
+"""
+
+import argparse
+import http.client
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlparse
+
+
+class ApiClient:
+    def __init__(self, base_url, token=None):
+        parsed = urlparse(base_url)
+        conn_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self.conn = conn_class(parsed.hostname, parsed.port, timeout=30)
+        self.token = token
+
+    def request(self, method, path, body=None, form=None, headers=None):
+        headers = dict(headers or {})
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        return response.status, data
+
+
+def login(base_url, username, password):
+    client = ApiClient(base_url)
+    client.request("POST", "/register", body={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": password,
+    })
+    status, data = client.request("POST", "/token", form={"username": username, "password": password})
+    if status != 200:
+        raise SystemExit(f"❌ Login failed ({status}): {data[:200]!r}")
+    return json.loads(data)["access_token"]
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_worker(base_url, token, paths, deadline, latencies, errors, lock):
+    client = ApiClient(base_url, token)
+    local_latencies = []
+    local_errors = 0
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            status, _ = client.request("GET", path)
+            if status >= 400:
+                local_errors += 1
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            client = ApiClient(base_url, token)
+            continue
+        local_latencies.append(time.perf_counter() - started)
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+
+def run_token_flood(base_url, username, password, deadline, counts, lock):
+    client = ApiClient(base_url)
+    local_counts = {}
+    while time.perf_counter() < deadline:
+        try:
+            status, _ = client.request("POST", "/token", form={"username": username, "password": password})
+        except (OSError, http.client.HTTPException):
+            status = "error"
+            client = ApiClient(base_url)
+        local_counts[status] = local_counts.get(status, 0) + 1
+    with lock:
+        for key, value in local_counts.items():
+            counts[key] = counts.get(key, 0) + value
+
+
+def run_ndjson_benchmark(base_url, token, items):
+    def generate():
+        chunk = []
+        for i in range(items):
+            chunk.append(json.dumps({"title": f"Imported todo {i}", "description": "x" * 40}) + "\n")
+            if len(chunk) == 1000:
+                yield "".join(chunk).encode()
+                chunk = []
+        if chunk:
+            yield "".join(chunk).encode()
+
+    client = ApiClient(base_url, token)
+    client.conn.timeout = None
+    started = time.perf_counter()
+    client.conn.request("POST", "/todos/import", body=generate(), encode_chunked=True, headers={
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/x-ndjson",
+    })
+    response = client.conn.getresponse()
+    result = json.loads(response.read())
+    elapsed = time.perf_counter() - started
+    print(f"✅ Import: {result.get('imported')} todos in {elapsed:.1f}s "
+          f"({result.get('imported', 0) / elapsed:.0f} todos/s)")
+
+    started = time.perf_counter()
+    client.conn.request("GET", "/todos/export", headers={"Authorization": f"Bearer {token}"})
+    response = client.conn.getresponse()
+    exported = 0
+    while True:
+        chunk = response.read(1 << 16)
+        if not chunk:
+            break
+        exported += chunk.count(b"\n")
+    elapsed = time.perf_counter() - started
+    print(f"✅ Export: {exported} todos in {elapsed:.1f}s ({exported / elapsed:.0f} todos/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Todo App API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--seed-todos", type=int, default=20)
+    parser.add_argument("--token-flood", type=int, default=0,
+                        help="number of extra clients continuously calling POST /token")
+    parser.add_argument("--ndjson-items", type=int, default=0,
+                        help="time an NDJSON import and export of this many todos instead")
+    args = parser.parse_args()
+
+    username = f"loadtest_{uuid.uuid4().hex[:8]}"
+    password = "loadtest-password"
+    token = login(args.url, username, password)
+
+    if args.ndjson_items:
+        run_ndjson_benchmark(args.url, token, args.ndjson_items)
+        return
+
+    seeder = ApiClient(args.url, token)
+    for i in range(args.seed_todos):
+        seeder.request("POST", "/todos", body={"title": f"Load test todo {i}"})
+
+    print(f"🚀 {args.concurrency} clients for {args.duration:.0f}s against {args.url}")
+    latencies = []
+    errors = [0]
+    flood_counts = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency + args.token_flood) as pool:
+        for _ in range(args.token_flood):
+            pool.submit(run_token_flood, args.url, username, password, deadline, flood_counts, lock)
+        for _ in range(args.concurrency):
+            pool.submit(run_worker, args.url, token, ["/todos", "/users/me"],
+                        deadline, latencies, errors, lock)
+    elapsed = time.perf_counter() - started
+
+    print(f"✅ Requests: {len(latencies)}  Errors: {errors[0]}")
+    print(f"   Throughput: {len(latencies) / elapsed:.1f} req/s")
+    print(f"   Latency p50: {percentile(latencies, 50) * 1000:.1f} ms  "
+          f"p95: {percentile(latencies, 95) * 1000:.1f} ms  "
+          f"p99: {percentile(latencies, 99) * 1000:.1f} ms")
+    if args.token_flood:
+        print(f"   /token flood responses by status: {flood_counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Response, Request, Header
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
-from bson import ObjectId
+from fastapi.responses import StreamingResponse
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 import os
 import ssl
-import sqlite3
 import json
-import uuid
+import base64
+import hashlib
+import hmac
+import re
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, field_validator, model_validator, ValidationError
+
+from repository import SQLiteRepository, DuplicateUserError, TODO_FIELDS, change_key
+from events import TodoEventBroker
+from group_commit import GroupCommitRepository
+from todo_cache import load_cache
+from profiling import Profiler, ProfilingMiddleware
+from slow_queries import SlowQueryLog
+from admission import AdmissionControlMiddleware, Rate, RouteLimit, load_store
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -24,12 +45,251 @@ DATABASE_NAME = os.getenv("DATABASE_NAME", "todoapp1")
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# "auto" tries MongoDB and falls back to SQLite; "mongodb" or "sqlite" pin one
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "auto")
+MONGODB_TLS = os.getenv("MONGODB_TLS", "true").lower() == "true"
+# Connections each worker opens at startup, before serving its first request
+DATABASE_WARMUP_CONNECTIONS = int(os.getenv("DATABASE_WARMUP_CONNECTIONS", "4"))
+
+# Password hashing pool: bcrypt is CPU-bound, so it runs off the event loop in a
+# bounded pool ("thread" or "process") and excess work is rejected with a 503.
+PASSWORD_HASH_POOL = os.getenv("PASSWORD_HASH_POOL", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
+# Admission control for /token and /register: token buckets per client IP and
+# per username (429), plus a concurrency cap with a short queue (503). Buckets
+# live in RATE_LIMIT_STORE: "memory" (per worker) or "module:Class".
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+AUTH_IP_RATE_PER_MINUTE = float(os.getenv("AUTH_IP_RATE_PER_MINUTE", "60"))
+AUTH_IP_BURST = int(os.getenv("AUTH_IP_BURST", "20"))
+AUTH_USERNAME_RATE_PER_MINUTE = float(os.getenv("AUTH_USERNAME_RATE_PER_MINUTE", "10"))
+AUTH_USERNAME_BURST = int(os.getenv("AUTH_USERNAME_BURST", "5"))
+AUTH_MAX_CONCURRENCY = int(os.getenv("AUTH_MAX_CONCURRENCY", str(2 * (os.cpu_count() or 1))))
+AUTH_MAX_QUEUE = int(os.getenv("AUTH_MAX_QUEUE", "16"))
+AUTH_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AUTH_QUEUE_TIMEOUT_SECONDS", "2"))
+
+# Authenticated principal cache (verified token -> user), bounded in size and age
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+# Cache of rendered GET /todos pages: "memory" (per worker), "none", or
+# "module:Class" for a shared backend. Bounded by bytes, entries expire after TTL.
+TODOS_CACHE = os.getenv("TODOS_CACHE", "memory")
+TODOS_CACHE_MAX_BYTES = int(os.getenv("TODOS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+TODOS_CACHE_TTL_SECONDS = float(os.getenv("TODOS_CACHE_TTL_SECONDS", "300"))
+
+# Pagination for GET /todos
+TODOS_DEFAULT_PAGE_SIZE = int(os.getenv("TODOS_DEFAULT_PAGE_SIZE", "100"))
+TODOS_MAX_PAGE_SIZE = int(os.getenv("TODOS_MAX_PAGE_SIZE", "500"))
+
+# Full-text search: at most this many terms per query, and results are paged
+# no deeper than TODOS_SEARCH_MAX_RESULTS
+TODOS_SEARCH_MAX_TERMS = int(os.getenv("TODOS_SEARCH_MAX_TERMS", "8"))
+TODOS_SEARCH_MAX_RESULTS = int(os.getenv("TODOS_SEARCH_MAX_RESULTS", "1000"))
+
+# Tags per todo (also the most a GET /todos filter may name) and their length
+TODOS_MAX_TAGS = int(os.getenv("TODOS_MAX_TAGS", "20"))
+TODOS_MAX_TAG_LENGTH = int(os.getenv("TODOS_MAX_TAG_LENGTH", "50"))
+
+# Maximum number of todos a single batch request may touch
+TODOS_MAX_BATCH_SIZE = int(os.getenv("TODOS_MAX_BATCH_SIZE", "1000"))
+
+# Group commit: when enabled, single-todo writes arriving within the window are
+# coalesced into one bulk write (MongoDB) or one transaction (SQLite)
+TODOS_WRITE_BATCHING = os.getenv("TODOS_WRITE_BATCHING", "false").lower() == "true"
+TODOS_WRITE_BATCH_WINDOW_MS = float(os.getenv("TODOS_WRITE_BATCH_WINDOW_MS", "2"))
+TODOS_WRITE_BATCH_MAX = int(os.getenv("TODOS_WRITE_BATCH_MAX", "100"))
+
+# SQLite fallback: WAL mode with a reader thread pool and a single writer
+SQLITE_PATH = os.getenv("SQLITE_PATH", "/tmp/todoapp.db")
+SQLITE_READER_THREADS = int(os.getenv("SQLITE_READER_THREADS", "4"))
+
+# NDJSON export/import of todos
+TODOS_EXPORT_BATCH_SIZE = int(os.getenv("TODOS_EXPORT_BATCH_SIZE", "1000"))
+TODOS_IMPORT_BATCH_SIZE = int(os.getenv("TODOS_IMPORT_BATCH_SIZE", "1000"))
+TODOS_IMPORT_MAX_LINE_BYTES = int(os.getenv("TODOS_IMPORT_MAX_LINE_BYTES", str(64 * 1024)))
+
+# Server-sent events stream of todo changes
+TODO_EVENTS_QUEUE_SIZE = int(os.getenv("TODO_EVENTS_QUEUE_SIZE", "256"))
+TODO_EVENTS_HISTORY_SIZE = int(os.getenv("TODO_EVENTS_HISTORY_SIZE", "100"))
+TODO_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("TODO_EVENTS_HEARTBEAT_SECONDS", "15"))
+# Streams only receive events published by their own worker; with several
+# workers each worker re-reads the todo versions of its streams' users this
+# often, in one query for all of them, and resyncs the streams of users
+# another worker changed (0 turns polling off for a single worker)
+TODO_EVENTS_POLL_SECONDS = float(os.getenv("TODO_EVENTS_POLL_SECONDS", "5"))
+# Browsers open the stream with a ticket from POST /todos/events/ticket in the
+# URL instead of their access token; it is only good for opening streams
+TODO_EVENTS_TICKET_SECONDS = float(os.getenv("TODO_EVENTS_TICKET_SECONDS", "30"))
+
+# Delta sync: deleted todos are remembered as tombstones for this long, so
+# a sync token from before the last prune must do a full resync. Prunes cut
+# at multiples of the prune interval, so every worker agrees on that cutoff
+TODOS_TOMBSTONE_RETENTION_DAYS = float(os.getenv("TODOS_TOMBSTONE_RETENTION_DAYS", "30"))
+TODOS_TOMBSTONE_PRUNE_INTERVAL_SECONDS = float(os.getenv("TODOS_TOMBSTONE_PRUNE_INTERVAL_SECONDS", "3600"))
+# Changes are stamped before they commit, and concurrent writers (other
+# workers, other MongoDB clients) can commit out of stamp order, so sync
+# tokens never point past now - TODOS_SYNC_LAG_SECONDS; newer changes are
+# sent again on the next sync instead of being skipped
+TODOS_SYNC_LAG_SECONDS = float(os.getenv("TODOS_SYNC_LAG_SECONDS", "5"))
+
+# Completed todos untouched for TODOS_ARCHIVE_AFTER_DAYS (0 turns archiving
+# off) are moved to the archive every TODOS_ARCHIVE_INTERVAL_SECONDS, in
+# batches of TODOS_ARCHIVE_BATCH_SIZE
+TODOS_ARCHIVE_AFTER_DAYS = float(os.getenv("TODOS_ARCHIVE_AFTER_DAYS", "30"))
+TODOS_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("TODOS_ARCHIVE_INTERVAL_SECONDS", "3600"))
+TODOS_ARCHIVE_BATCH_SIZE = int(os.getenv("TODOS_ARCHIVE_BATCH_SIZE", "500"))
+
+# Per-user todo counters behind GET /todos/stats are recomputed from the todos
+# this often, correcting any drift
+TODOS_STATS_REPAIR_INTERVAL_SECONDS = float(os.getenv("TODOS_STATS_REPAIR_INTERVAL_SECONDS", "86400"))
+
+# The /admin/ endpoints (request profiles, slow-query report) answer callers
+# sending "X-Admin-Token: <token>". Without a token they are disabled.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+# On-demand request profiling. Requests sent with "X-Profile: <admin token>",
+# plus a random PROFILING_SAMPLE_RATE fraction of traffic, are sampled every
+# PROFILING_INTERVAL_MS; the last PROFILING_MAX_PROFILES are served from
+# /admin/profiles. Without an admin token the header trigger is disabled.
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "20"))
+
+# Slow-query log: database calls slower than SLOW_QUERY_THRESHOLD_MS (0 turns
+# it off) are logged by query shape with their values redacted, and the plan of
+# each new slow shape is captured. The SLOW_QUERY_MAX_SHAPES most recently slow
+# shapes are reported from /admin/slow-queries.
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_MAX_SHAPES = int(os.getenv("SLOW_QUERY_MAX_SHAPES", "200"))
 
 # Environment detection
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 
+async def prune_tombstones_periodically():
+    while True:
+        try:
+            await repository.prune_tombstones(tombstone_cutoff(datetime.now(timezone.utc)))
+        except Exception as e:
+            print(f"⚠️  Could not prune tombstones: {str(e)}")
+        await asyncio.sleep(TODOS_TOMBSTONE_PRUNE_INTERVAL_SECONDS)
+
+async def archive_todos_periodically():
+    while True:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=TODOS_ARCHIVE_AFTER_DAYS)
+        try:
+            while True:
+                archived = await repository.archive_completed_todos(cutoff, TODOS_ARCHIVE_BATCH_SIZE)
+                if not archived:
+                    break
+                for user_id, todo_ids in archived.items():
+                    todos_archived.inc(amount=len(todo_ids))
+                    await todos_changed(user_id, "archived", ids=todo_ids)
+        except Exception as e:
+            print(f"⚠️  Could not archive todos: {str(e)}")
+        await asyncio.sleep(TODOS_ARCHIVE_INTERVAL_SECONDS)
+
+async def poll_todo_versions_periodically():
+    while True:
+        await asyncio.sleep(TODO_EVENTS_POLL_SECONDS)
+        user_ids = list(todo_events.subscribers)
+        try:
+            for start in range(0, len(user_ids), 500):
+                versions = await repository.get_todos_versions(user_ids[start:start + 500])
+                for user_id, version in versions.items():
+                    todo_events.notify(user_id, version)
+        except Exception as e:
+            print(f"⚠️  Could not poll todo versions: {str(e)}")
+
+async def repair_todo_stats_periodically():
+    while True:
+        await asyncio.sleep(TODOS_STATS_REPAIR_INTERVAL_SECONDS)
+        try:
+            repaired = await repository.repair_todo_stats()
+        except Exception as e:
+            print(f"⚠️  Could not repair todo counters: {str(e)}")
+            continue
+        todo_stats_repaired.inc(amount=repaired)
+        if repaired:
+            print(f"🔧 Repaired todo counters of {repaired} users")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connections are opened here rather than at import time, so each worker
+    # process builds its own clients after any fork
+    await connect_database()
+    pruner = asyncio.create_task(prune_tombstones_periodically())
+    stats_repairer = asyncio.create_task(repair_todo_stats_periodically())
+    archiver = asyncio.create_task(archive_todos_periodically()) if TODOS_ARCHIVE_AFTER_DAYS > 0 else None
+    version_poller = asyncio.create_task(poll_todo_versions_periodically()) if TODO_EVENTS_POLL_SECONDS > 0 else None
+    yield
+    pruner.cancel()
+    stats_repairer.cancel()
+    for task in (archiver, version_poller):
+        if task is not None:
+            task.cancel()
+    await close_database()
+    global password_executor
+    if password_executor is not None:
+        password_executor.shutdown(wait=False, cancel_futures=True)
+        password_executor = None  # a restarted app (tests, reloads) builds a new pool
+
 # Initialize FastAPI app
-app = FastAPI(title="Todo App API", version="1.0.0")
+app = FastAPI(title="Todo App API", version="1.0.0", lifespan=lifespan)
+
+# Metrics, served in Prometheus text format from /metrics
+metrics_registry = metrics.Registry()
+request_latency = metrics_registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route and status",
+    ["method", "route", "status"],
+)
+requests_in_flight = metrics_registry.gauge("http_requests_in_flight", "HTTP requests currently being served")
+db_latency = metrics_registry.histogram(
+    "db_operation_duration_seconds", "Data access latency by repository operation", ["operation"],
+)
+db_in_flight = metrics_registry.gauge(
+    "db_operations_in_flight", "Data access calls currently awaiting the database", ["operation"],
+)
+password_hash_latency = metrics_registry.histogram(
+    "password_hash_duration_seconds", "bcrypt hash/verify latency including pool queueing", ["operation"],
+)
+password_hash_rejected = metrics_registry.counter(
+    "password_hash_rejected_total", "bcrypt jobs rejected because the pool queue was full",
+)
+write_batch_size = metrics_registry.histogram(
+    "todo_write_batch_size", "Single-todo writes committed together by group commit",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+todos_archived = metrics_registry.counter(
+    "todos_archived_total", "Completed todos moved to the archive by the archiver",
+)
+todo_stats_repaired = metrics_registry.counter(
+    "todo_stats_repaired_total", "Users whose todo counters the repair job found wrong and recomputed",
+)
+admission_rejected = metrics_registry.counter(
+    "admission_rejected_total", "Requests shed by admission control before reaching a route",
+    ["route", "reason"],
+)
+
+# Admission control for the bcrypt-backed auth routes. Added before CORS so it
+# sits inside it and rejections still carry CORS headers.
+auth_ip_rate = Rate(AUTH_IP_RATE_PER_MINUTE, AUTH_IP_BURST)
+app.add_middleware(
+    AdmissionControlMiddleware,
+    limits={
+        ("POST", "/token"): RouteLimit(
+            AUTH_MAX_CONCURRENCY, AUTH_MAX_QUEUE, AUTH_QUEUE_TIMEOUT_SECONDS,
+            ip_rate=auth_ip_rate,
+            username_rate=Rate(AUTH_USERNAME_RATE_PER_MINUTE, AUTH_USERNAME_BURST),
+        ),
+        ("POST", "/register"): RouteLimit(
+            AUTH_MAX_CONCURRENCY, AUTH_MAX_QUEUE, AUTH_QUEUE_TIMEOUT_SECONDS, ip_rate=auth_ip_rate,
+        ),
+    },
+    store=load_store(RATE_LIMIT_STORE),
+    rejected=admission_rejected,
+)
 
 # CORS middleware - Updated for production
 allowed_origins = [
@@ -54,127 +314,293 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After"],
 )
 
-# Database configuration and connection
-USE_MONGODB = True
+profiler = Profiler(PROFILING_INTERVAL_MS / 1000, PROFILING_MAX_PROFILES)
+if ADMIN_TOKEN or PROFILING_SAMPLE_RATE > 0:
+    app.add_middleware(
+        ProfilingMiddleware, profiler=profiler, token=ADMIN_TOKEN, sample_rate=PROFILING_SAMPLE_RATE,
+    )
+
+app.add_middleware(metrics.RequestMetricsMiddleware, histogram=request_latency, in_flight=requests_in_flight)
+
+slow_query_log = (
+    SlowQueryLog(SLOW_QUERY_THRESHOLD_MS / 1000, SLOW_QUERY_MAX_SHAPES) if SLOW_QUERY_THRESHOLD_MS > 0 else None
+)
+
+# Database connection, set up by connect_database() in the lifespan
+USE_MONGODB = DATABASE_BACKEND != "sqlite"
 USE_SQLITE = False
+client = None
+db = None
+repository = None
+mongo_pool_listener = None
 
 # Database adapter functions (defined first)
-def get_user_by_username(username: str):
-    if USE_MONGODB:
-        user = users_collection.find_one({"username": username})
-        if user:
-            user["_id"] = str(user["_id"])
-            return user
-        return None
-    else:
-        cursor = sqlite_conn.execute('SELECT * FROM users WHERE username = ?', (username,))
-        row = cursor.fetchone()
-        if row:
-            return {
-                "_id": row[0],
-                "username": row[1],
-                "email": row[2],
-                "hashed_password": row[3],
-                "created_at": row[4]
-            }
-        return None
+async def get_user_by_username(username: str):
+    return await repository.get_user_by_username(username)
 
-def create_user(user_data: dict):
-    user_id = str(uuid.uuid4())
-    
-    if USE_MONGODB:
-        user_data["_id"] = ObjectId()
-        result = users_collection.insert_one(user_data)
-        user_data["_id"] = str(result.inserted_id)
-        return user_data
+async def create_user(user_data: dict):
+    principal_cache.invalidate_user(user_data["username"])
+    return await repository.create_user(user_data)
+
+async def check_user_exists(username: str = None, email: str = None):
+    return await repository.check_user_exists(username=username, email=email)
+
+# Per-user todo version: bumped after every todo write and used as the ETag
+# source, so conditional GETs can answer 304 without reading any todos.
+async def get_todos_version(user_id: str) -> int:
+    return await repository.get_todos_version(user_id)
+
+async def bump_todos_version(user_id: str) -> int:
+    return await repository.bump_todos_version(user_id)
+
+async def todos_changed(user_id: str, event_type: str, todos=None, ids=None):
+    """Bump the user's todo version and push the change to their open streams.
+
+    Changes that are not listed todo by todo (filter-based batches, imports)
+    are published as a resync, telling clients to refetch.
+    """
+    version = await bump_todos_version(user_id)
+    if todo_list_cache is not None:
+        await todo_list_cache.invalidate(user_id)
+    if todos is not None:
+        data = {"todos": [render_todo(todo) for todo in todos]}
+    elif ids is not None:
+        data = {"ids": ids}
     else:
-        sqlite_conn.execute(
-            'INSERT INTO users (id, username, email, hashed_password, created_at) VALUES (?, ?, ?, ?, ?)',
-            (user_id, user_data["username"], user_data["email"], user_data["hashed_password"], 
-             user_data["created_at"].isoformat())
+        event_type, data = "resync", {}
+    todo_events.publish(user_id, version, event_type, data)
+
+MONGO_CLIENT_OPTIONS = dict(
+    tls=MONGODB_TLS,  # Use tls instead of ssl
+    tlsAllowInvalidCertificates=True,  # Allow invalid certificates
+    serverSelectionTimeoutMS=5000,
+    connectTimeoutMS=5000,
+    socketTimeoutMS=5000,
+    maxPoolSize=int(os.getenv("MONGODB_MAX_POOL_SIZE", "100")),
+    retryWrites=True,
+    w='majority'
+)
+
+async def connect_mongodb():
+    global client, db, mongo_pool_listener
+    # Imported here so SQLite deployments never load the MongoDB driver
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from mongo_repository import MongoRepository, PoolMetricsListener, SlowQueryListener
+
+    listener = PoolMetricsListener()
+    slow_listener = SlowQueryListener(slow_query_log, asyncio.get_running_loop()) if slow_query_log else None
+    listeners = [listener] if slow_listener is None else [listener, slow_listener]
+    mongo_client = AsyncIOMotorClient(MONGODB_URL, **MONGO_CLIENT_OPTIONS, event_listeners=listeners)
+    try:
+        await mongo_client.admin.command('ping')
+    except Exception:
+        mongo_client.close()
+        raise
+    if slow_listener is not None:
+        slow_listener.client = mongo_client  # runs the explains of new slow shapes
+    client, mongo_pool_listener = mongo_client, listener
+    mongo_repository = MongoRepository(client, DATABASE_NAME)
+    db = mongo_repository.db
+    return mongo_repository
+
+async def connect_database():
+    """Pick the backend (MongoDB first, unless DATABASE_BACKEND pins one), then
+    warm up its connections and make sure the indexes exist."""
+    global USE_MONGODB, USE_SQLITE, repository
+    backend = None
+    if DATABASE_BACKEND != "sqlite":
+        try:
+            backend = await connect_mongodb()
+            print("✅ Connected to MongoDB Atlas successfully!")
+        except Exception as e:
+            if DATABASE_BACKEND == "mongodb":
+                raise
+            print(f"❌ MongoDB connection failed: {str(e)}")
+            print("🔄 Falling back to SQLite database...")
+
+    if backend is None:
+        backend = SQLiteRepository(
+            SQLITE_PATH, reader_threads=SQLITE_READER_THREADS, slow_query_log=slow_query_log,
         )
-        sqlite_conn.commit()
-        user_data["_id"] = user_id
-        return user_data
-
-def check_user_exists(username: str = None, email: str = None):
-    if USE_MONGODB:
-        if username and users_collection.find_one({"username": username}):
-            return True
-        if email and users_collection.find_one({"email": email}):
-            return True
-        return False
-    else:
-        if username:
-            cursor = sqlite_conn.execute('SELECT 1 FROM users WHERE username = ?', (username,))
-            if cursor.fetchone():
-                return True
-        if email:
-            cursor = sqlite_conn.execute('SELECT 1 FROM users WHERE email = ?', (email,))
-            if cursor.fetchone():
-                return True
-        return False
+        print("✅ SQLite database initialized successfully!")
+    USE_MONGODB = backend.name == "mongodb"
+    USE_SQLITE = not USE_MONGODB
 
-# Try MongoDB first
-try:
-    client = MongoClient(
-        MONGODB_URL,
-        tls=True,  # Use tls instead of ssl
-        tlsAllowInvalidCertificates=True,  # Allow invalid certificates
-        serverSelectionTimeoutMS=5000,
-        connectTimeoutMS=5000,
-        socketTimeoutMS=5000,
-        maxPoolSize=10,
-        retryWrites=True,
-        w='majority'
-    )
-    db = client[DATABASE_NAME]
-    users_collection = db.users
-    todos_collection = db.todos
-    
-    # Test connection
-    client.admin.command('ping')
-    print(f"✅ Connected to MongoDB Atlas successfully!")
-    USE_MONGODB = True
-    
-except Exception as e:
-    print(f"❌ MongoDB connection failed: {str(e)}")
-    print("🔄 Falling back to SQLite database...")
-    
-    # Fallback to SQLite
-    USE_MONGODB = False
-    USE_SQLITE = True
-    
-    # Create SQLite database
-    sqlite_conn = sqlite3.connect('/tmp/todoapp.db', check_same_thread=False)
-    sqlite_conn.execute('''CREATE TABLE IF NOT EXISTS users (
-        id TEXT PRIMARY KEY,
-        username TEXT UNIQUE NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        hashed_password TEXT NOT NULL,
-        created_at TEXT NOT NULL
-    )''')
-    
-    sqlite_conn.execute('''CREATE TABLE IF NOT EXISTS todos (
-        id TEXT PRIMARY KEY,
-        title TEXT NOT NULL,
-        description TEXT,
-        completed BOOLEAN DEFAULT FALSE,
-        created_at TEXT NOT NULL,
-        user_id TEXT NOT NULL,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )''')
-    
-    sqlite_conn.commit()
-    print("✅ SQLite database initialized successfully!")
+    if TODOS_WRITE_BATCHING:
+        backend = GroupCommitRepository(
+            backend, TODOS_WRITE_BATCH_WINDOW_MS / 1000, TODOS_WRITE_BATCH_MAX, batch_sizes=write_batch_size,
+        )
+    repository = metrics.TimedRepository(backend, db_latency, db_in_flight)
+    await repository.warm_up(DATABASE_WARMUP_CONNECTIONS)
+    await ensure_indexes()
+
+async def close_database():
+    global repository
+    if repository is not None:
+        await repository.close()
+        repository = None
+
+async def ensure_indexes():
+    await repository.ensure_indexes()
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+password_executor = None
+password_jobs_in_flight = 0
+
+def get_password_executor():
+    global password_executor
+    if password_executor is None:
+        if PASSWORD_HASH_POOL == "process":
+            password_executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            password_executor = ThreadPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+            )
+    return password_executor
+
+async def run_password_job(fn, *args):
+    """Run a bcrypt call in the password pool, shedding load once the queue is full"""
+    global password_jobs_in_flight
+    if password_jobs_in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        password_hash_rejected.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    password_jobs_in_flight += 1
+    try:
+        with password_hash_latency.time(fn.__name__):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_password_executor(), partial(fn, *args))
+    finally:
+        password_jobs_in_flight -= 1
+
+class PrincipalCache:
+    """LRU + TTL cache of verified access tokens to the user they belong to.
+
+    Entries never outlive the token's own ``exp`` claim, and every token of a
+    user can be dropped at once with ``invalidate_user`` when that user changes.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # token -> (expires_at, user)
+        self.tokens_by_username = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str):
+        entry = self.entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            self._remove(token)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def put(self, token: str, user: dict, token_exp: Optional[float] = None):
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+        if ttl <= 0:
+            return
+        if token in self.entries:
+            self._remove(token)
+        self.entries[token] = (time.monotonic() + ttl, user)
+        self.tokens_by_username.setdefault(user["username"], set()).add(token)
+        while len(self.entries) > self.max_size:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate_user(self, username: str):
+        for token in list(self.tokens_by_username.get(username, ())):
+            self._remove(token)
+
+    def clear(self):
+        self.entries.clear()
+        self.tokens_by_username.clear()
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, token: str):
+        _, user = self.entries.pop(token)
+        tokens = self.tokens_by_username.get(user["username"])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self.tokens_by_username[user["username"]]
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+todo_list_cache = load_cache(TODOS_CACHE, TODOS_CACHE_MAX_BYTES, TODOS_CACHE_TTL_SECONDS)
+
+metrics_registry.gauge(
+    "password_hash_jobs_in_flight", "bcrypt jobs running or queued in the password pool",
+    callback=lambda: password_jobs_in_flight,
+)
+metrics_registry.gauge(
+    "principal_cache_entries", "Verified tokens held in the principal cache",
+    callback=lambda: len(principal_cache.entries),
+)
+metrics_registry.counter(
+    "principal_cache_lookups_total", "Principal cache lookups by result", ["result"],
+    callback=lambda: {("hit",): principal_cache.hits, ("miss",): principal_cache.misses},
+)
+metrics_registry.gauge(
+    "todo_list_cache_bytes", "Bytes of GET /todos pages held in the todo list cache",
+    callback=lambda: todo_list_cache.stats().get("bytes", 0) if todo_list_cache else 0,
+)
+metrics_registry.counter(
+    "todo_list_cache_lookups_total", "Todo list cache lookups by result", ["result"],
+    callback=lambda: {
+        ("hit",): todo_list_cache.stats().get("hits", 0),
+        ("miss",): todo_list_cache.stats().get("misses", 0),
+    } if todo_list_cache else {},
+)
+metrics_registry.gauge(
+    "mongodb_pool_connections", "MongoDB driver connections by state", ["state"],
+    callback=lambda: {
+        ("open",): mongo_pool_listener.open,
+        ("checked_out",): mongo_pool_listener.checked_out,
+    } if mongo_pool_listener else {},
+)
+
+metrics_registry.counter(
+    "slow_queries_total", "Database calls slower than SLOW_QUERY_THRESHOLD_MS",
+    callback=lambda: slow_query_log.slow_count if slow_query_log else 0,
+)
+
+metrics_registry.gauge(
+    "todo_event_streams", "Open server-sent event streams",
+    callback=lambda: todo_events.stats()["streams"],
+)
+
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# EventSource cannot send headers, so the event stream also accepts a ?ticket=
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -191,42 +617,306 @@ class TodoCreate(BaseModel):
     title: str
     description: Optional[str] = None
     completed: bool = False
+    tags: List[str] = []
+
+    @field_validator("tags")
+    @classmethod
+    def check_tags(cls, tags):
+        return normalize_tags(tags)
 
 class TodoUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
     completed: Optional[bool] = None
+    tags: Optional[List[str]] = None
+
+    @field_validator("tags")
+    @classmethod
+    def check_tags(cls, tags):
+        return None if tags is None else normalize_tags(tags)
 
 class TodoResponse(BaseModel):
     id: str
     title: str
     description: Optional[str] = None
     completed: bool
+    tags: List[str] = []
     created_at: datetime
+    updated_at: Optional[datetime] = None
     user_id: str
 
+class TodoListItem(BaseModel):
+    id: str
+    title: Optional[str] = None
+    description: Optional[str] = None
+    completed: Optional[bool] = None
+    tags: Optional[List[str]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    user_id: Optional[str] = None
+
+class ArchivedTodo(TodoResponse):
+    archived_at: datetime
+
+class TodoSearchResult(TodoResponse):
+    score: float
+
+class TodoImport(TodoCreate):
+    created_at: Optional[datetime] = None
+
+class TodoImportError(BaseModel):
+    line: int
+    error: str
+
+class TodoImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[TodoImportError]
+
+class TodoChanges(BaseModel):
+    changed: List[TodoResponse]
+    deleted: List[str]
+    sync_token: Optional[str] = None
+    has_more: bool
+
+class TodoStats(BaseModel):
+    total: int
+    completed: int
+    pending: int
+
+class TodoFilter(BaseModel):
+    completed: Optional[bool] = None
+
+class TodoBatchCreate(BaseModel):
+    todos: List[TodoCreate] = Field(..., min_length=1, max_length=TODOS_MAX_BATCH_SIZE)
+
+class TodoBatchSelection(BaseModel):
+    """Selects todos either by explicit ids or by filter (an empty filter selects all)"""
+    ids: Optional[List[str]] = Field(None, min_length=1, max_length=TODOS_MAX_BATCH_SIZE)
+    filter: Optional[TodoFilter] = None
+
+    @model_validator(mode="after")
+    def check_selection(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Provide exactly one of 'ids' or 'filter'")
+        return self
+
+class TodoBatchUpdate(TodoBatchSelection):
+    update: TodoUpdate
+
+class TodoBatchDelete(TodoBatchSelection):
+    pass
+
+class TodoBatchItemResult(BaseModel):
+    id: str
+    status: str  # created, updated, deleted, not_found or invalid_id
+    todo: Optional[TodoResponse] = None
+
+class TodoBatchResult(BaseModel):
+    matched: int
+    modified: int
+    results: List[TodoBatchItemResult]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
 
+class StreamTicket(BaseModel):
+    ticket: str
+    expires_in: int
+
 class TokenData(BaseModel):
     username: Optional[str] = None
 
 # Helper functions
+def encode_cursor(created_at: datetime, todo_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), todo_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, todo_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(created_at, str) or not isinstance(todo_id, str):
+            raise TypeError("cursor must hold an ISO timestamp and an id")
+        return as_utc(datetime.fromisoformat(created_at)), todo_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def tombstone_cutoff(at: datetime) -> datetime:
+    """The newest cutoff tombstones can have been pruned to by ``at``"""
+    cutoff = (at - timedelta(days=TODOS_TOMBSTONE_RETENTION_DAYS)).timestamp()
+    if TODOS_TOMBSTONE_PRUNE_INTERVAL_SECONDS > 0:
+        cutoff -= cutoff % TODOS_TOMBSTONE_PRUNE_INTERVAL_SECONDS
+    return datetime.fromtimestamp(cutoff, timezone.utc)
+
+def encode_sync_token(changed_at: datetime, todo_id: str, synced_to: datetime) -> str:
+    """A sync key plus the time the client is known to have every tombstone up to"""
+    raw = json.dumps([changed_at.isoformat(), todo_id, synced_to.isoformat()]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_sync_token(token: str):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        changed_at, todo_id, *synced_to = json.loads(base64.urlsafe_b64decode(padded))
+        # Tokens issued before synced_to was added only vouch for their key
+        synced_to = synced_to or [changed_at]
+        if len(synced_to) != 1 or not all(isinstance(value, str) for value in (changed_at, todo_id, *synced_to)):
+            raise TypeError("sync token must hold two ISO timestamps and an id")
+        return as_utc(datetime.fromisoformat(changed_at)), todo_id, as_utc(datetime.fromisoformat(synced_to[0]))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+def encode_offset_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode().rstrip("=")
+
+def decode_offset_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        offset = json.loads(base64.urlsafe_b64decode(padded))["offset"]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
+
+def parse_search_query(q: str):
+    """Split a search query into whole words and a trailing prefix.
+
+    The last term is matched as a prefix so results update as the user types.
+    """
+    terms = list(dict.fromkeys(re.findall(r"\w+", q.lower())))
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query has no searchable terms")
+    if len(terms) > TODOS_SEARCH_MAX_TERMS:
+        raise HTTPException(status_code=400, detail=f"At most {TODOS_SEARCH_MAX_TERMS} search terms are allowed")
+    return terms[:-1], terms[-1]
+
+def normalize_tags(tags: List[str]) -> List[str]:
+    """Tags match exactly, so they are kept trimmed, lowercased and without duplicates"""
+    tags = list(dict.fromkeys(tag.strip().lower() for tag in tags if tag.strip()))
+    if len(tags) > TODOS_MAX_TAGS:
+        raise ValueError(f"At most {TODOS_MAX_TAGS} tags are allowed")
+    if any(len(tag) > TODOS_MAX_TAG_LENGTH for tag in tags):
+        raise ValueError(f"Tags are limited to {TODOS_MAX_TAG_LENGTH} characters")
+    return tags
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Stored timestamps are UTC; naive query values are taken to be UTC too
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+def parse_todo_fields(fields: Optional[str]):
+    if not fields:
+        return TODO_FIELDS
+    requested = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in requested if f not in TODO_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+def todo_selection(selection: TodoBatchSelection):
+    """Split a batch selection into ``(ids, completed, invalid_ids)``.
+
+    ``ids`` is None when selecting by filter; otherwise it holds the unique
+    well-formed ids, and malformed ones are returned in ``invalid_ids``.
+    """
+    if selection.ids is None:
+        return None, selection.filter.completed, []
+    ids = list(dict.fromkeys(i for i in selection.ids if repository.is_valid_todo_id(i)))
+    invalid_ids = [i for i in selection.ids if not repository.is_valid_todo_id(i)]
+    return ids, None, invalid_ids
+
+def check_todo_id(todo_id: str):
+    if not repository.is_valid_todo_id(todo_id):
+        raise HTTPException(status_code=400, detail="Invalid todo ID")
+
+def make_etag(version: int, *parts: str) -> str:
+    digest = hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+async def todos_etag(request: Request, user_id: str) -> str:
+    version = await get_todos_version(user_id)
+    return make_etag(version, user_id, request.url.path, request.url.query)
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+# Fast response path: todos coming back from the repository are already
+# trusted and API-shaped, so they are rendered straight to JSON bytes instead
+# of being validated into TodoResponse models and re-encoded by FastAPI.
+if orjson is not None:
+    def dumps_json(content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+else:
+    def dumps_json(content) -> bytes:
+        return json.dumps(content, separators=(",", ":"), default=datetime.isoformat).encode()
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+def render_todo(todo: dict, fields=TODO_FIELDS) -> dict:
+    item = {"id": todo["id"]}
+    for field in fields:
+        item[field] = todo.get(field)
+    return item
+
+def todo_to_ndjson(todo: dict) -> str:
+    return json.dumps({
+        "id": todo["id"],
+        "title": todo["title"],
+        "description": todo.get("description"),
+        "completed": todo["completed"],
+        "tags": todo.get("tags", []),
+        "created_at": todo["created_at"].isoformat(),
+        "updated_at": todo["updated_at"].isoformat() if todo.get("updated_at") else None,
+        "user_id": todo["user_id"],
+    }) + "\n"
+
+todo_events = TodoEventBroker(
+    dumps_json, queue_size=TODO_EVENTS_QUEUE_SIZE, history_size=TODO_EVENTS_HISTORY_SIZE,
+)
+
+async def read_ndjson_lines(request: Request):
+    """Yield the lines of an NDJSON request body as they arrive"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > TODOS_IMPORT_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail="NDJSON line too long")
+    if buffer:
+        yield buffer
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def get_user(username: str):
-    return get_user_by_username(username)
+async def get_user(username: str):
+    return await get_user_by_username(username)
 
-def authenticate_user(username: str, password: str):
-    user = get_user(username)
+async def authenticate_user(username: str, password: str):
+    user = await get_user(username)
     if not user:
         return False
-    if not verify_password(password, user["hashed_password"]):
+    if not await run_password_job(verify_password, password, user["hashed_password"]):
         return False
     return user
 
@@ -246,38 +936,65 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    user = principal_cache.get(token)
+    if user is not None:
+        return user
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        # Stream tickets only open /todos/events
+        if username is None or payload.get("use") is not None:
             raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(username=token_data.username)
+    user = await get_user(username=token_data.username)
     if user is None:
         raise credentials_exception
+    principal_cache.put(token, user, payload.get("exp"))
     return user
 
+async def get_stream_principal(
+    token: Optional[str] = Depends(oauth2_scheme_optional),
+    ticket: Optional[str] = Query(None),
+):
+    """The user opening an event stream and when (epoch seconds) their
+    session, and so the stream, ends.
+
+    Takes a bearer token or a stream ticket, never an access token in the
+    URL, where it would end up in access logs.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    if ticket:
+        try:
+            payload = jwt.decode(ticket, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise credentials_exception
+        if payload.get("use") != "stream" or payload.get("sub") is None:
+            raise credentials_exception
+        user = await get_user(username=payload["sub"])
+        if user is None:
+            raise credentials_exception
+        return user, payload["session_exp"]
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await get_current_user(token)
+    return user, jwt.get_unverified_claims(token)["exp"]
+
 # Routes
 @app.post("/register", response_model=UserResponse)
 async def register_user(user: UserCreate):
     try:
-        # Check if user already exists
-        if check_user_exists(username=user.username):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Username already registered"
-            )
-        
-        if check_user_exists(email=user.email):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-        
         # Hash password and create user
-        hashed_password = get_password_hash(user.password)
+        hashed_password = await run_password_job(get_password_hash, user.password)
         user_doc = {
             "username": user.username,
             "email": user.email,
@@ -285,7 +1002,14 @@ async def register_user(user: UserCreate):
             "created_at": datetime.now(timezone.utc)
         }
         
-        created_user = create_user(user_doc)
+        # A single insert; the unique indexes reject duplicate usernames/emails
+        try:
+            created_user = await create_user(user_doc)
+        except DuplicateUserError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{e.field.capitalize()} already registered"
+            )
         created_user["id"] = created_user["_id"]
         
         return UserResponse(**created_user)
@@ -302,7 +1026,7 @@ async def register_user(user: UserCreate):
 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -328,39 +1052,457 @@ async def create_todo(todo: TodoCreate, current_user: dict = Depends(get_current
         "title": todo.title,
         "description": todo.description,
         "completed": todo.completed,
+        "tags": todo.tags,
         "created_at": datetime.now(timezone.utc),
         "user_id": current_user["_id"]
     }
     
-    result = todos_collection.insert_one(todo_doc)
-    todo_doc["id"] = str(result.inserted_id)
-    del todo_doc["_id"]  # Remove _id field
+    created_todo = await repository.insert_todo(todo_doc)
+    await todos_changed(current_user["_id"], "created", todos=[created_todo])
     
-    return TodoResponse(**todo_doc)
+    return FastJSONResponse(render_todo(created_todo))
 
-@app.get("/todos", response_model=List[TodoResponse])
-async def get_todos(current_user: dict = Depends(get_current_user)):
-    todos = list(todos_collection.find({"user_id": current_user["_id"]}))
-    for todo in todos:
-        todo["id"] = str(todo["_id"])
-        del todo["_id"]
-    return [TodoResponse(**todo) for todo in todos]
+@app.get("/todos", response_model=List[TodoListItem], response_model_exclude_unset=True)
+async def get_todos(
+    request: Request,
+    limit: int = Query(TODOS_DEFAULT_PAGE_SIZE, ge=1, le=TODOS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. title,completed"),
+    include_archived: bool = False,
+    completed: Optional[bool] = None,
+    tag: Optional[List[str]] = Query(None, description="Only todos with this tag; repeat to require several"),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    sort: str = Query("created_at", pattern="^-?(created_at|updated_at)$",
+                      description="created_at or updated_at; prefix with - for newest first"),
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """List active todos (oldest first by default), one page at a time.
 
-@app.get("/todos/{todo_id}", response_model=TodoResponse)
-async def get_todo(todo_id: str, current_user: dict = Depends(get_current_user)):
+    ``completed``, ``tag`` and the ``created_after``/``created_before`` range
+    filter the list and ``sort`` orders it; both are applied by the database
+    from compound indexes, so a filtered view reads only matching todos.
+    ``include_archived`` merges archived todos in. The cursor for the next page
+    is returned in the ``X-Next-Cursor`` header and is absent on the last page. Responses carry an ETag derived from the user's
+    todo version, and a matching ``If-None-Match`` gets a 304. Rendered pages
+    are cached per user and todo version.
+    """
+    user_id = current_user["_id"]
+    version = await get_todos_version(user_id)
+    etag = make_etag(version, user_id, request.url.path, request.url.query)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    selected = parse_todo_fields(fields)
     try:
-        todo = todos_collection.find_one({
-            "_id": ObjectId(todo_id),
+        tags = normalize_tags(tag or [])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    created_after, created_before = as_utc(created_after), as_utc(created_before)
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if not repository.is_valid_todo_id(after[1]):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    page_key = "|".join(map(str, (
+        limit, cursor or "", ",".join(selected), int(include_archived),
+        completed, ",".join(tags), created_after, created_before, sort,
+    )))
+    if todo_list_cache is not None:
+        cached = await todo_list_cache.get(user_id, version, page_key)
+        if cached is not None:
+            body, next_cursor = cached
+            if next_cursor:
+                headers["X-Next-Cursor"] = next_cursor
+            return Response(body, media_type="application/json", headers=headers)
+
+    todos = await repository.list_todos(
+        user_id, limit + 1, after=after, fields=selected, include_archived=include_archived, sort=sort,
+        completed=completed, tags=tags, created_after=created_after, created_before=created_before,
+    )
+    next_cursor = None
+    if len(todos) > limit:
+        todos = todos[:limit]
+        last = todos[-1]
+        next_cursor = headers["X-Next-Cursor"] = encode_cursor(last[sort.lstrip("-")], last["id"])
+
+    body = dumps_json([render_todo(todo, selected) for todo in todos])
+    if todo_list_cache is not None:
+        await todo_list_cache.put(user_id, version, page_key, body, next_cursor)
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.get("/todos/search", response_model=List[TodoSearchResult])
+async def search_todos(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(TODOS_DEFAULT_PAGE_SIZE, ge=1, le=TODOS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Search titles and descriptions, best match first.
+
+    Every term must match; the last one also matches as a word prefix. The
+    cursor for the next page is returned in the ``X-Next-Cursor`` header.
+    """
+    words, prefix = parse_search_query(q)
+    offset = decode_offset_cursor(cursor) if cursor else 0
+    limit = min(limit, TODOS_SEARCH_MAX_RESULTS - offset)
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="Search results are limited to "
+                            f"the first {TODOS_SEARCH_MAX_RESULTS} matches")
+
+    etag = await todos_etag(request, current_user["_id"])
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    todos = await repository.search_todos(current_user["_id"], words, prefix, limit + 1, offset)
+    if len(todos) > limit:
+        todos = todos[:limit]
+        if offset + limit < TODOS_SEARCH_MAX_RESULTS:
+            headers["X-Next-Cursor"] = encode_offset_cursor(offset + limit)
+
+    return FastJSONResponse(
+        [{**render_todo(todo), "score": todo["score"]} for todo in todos], headers=headers
+    )
+
+@app.get("/todos/changes", response_model=TodoChanges)
+async def get_todo_changes(
+    request: Request,
+    since: Optional[str] = Query(None, description="sync_token from the previous response"),
+    limit: int = Query(TODOS_DEFAULT_PAGE_SIZE, ge=1, le=TODOS_MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Todos changed and deleted since a sync token, oldest change first.
+
+    Without ``since`` every todo (and every retained tombstone) is returned.
+    Keep calling with the returned ``sync_token`` while ``has_more`` is true.
+    A token gets a 410, and the client must refetch everything, only when
+    tombstones it has not seen may have been pruned since it was issued; a
+    client that syncs within the retention window keeps its token however
+    long ago its todos last changed. Changes from the last
+    ``TODOS_SYNC_LAG_SECONDS`` are returned but stay after the token, so
+    they come again on the next sync; applying them is idempotent.
+    """
+    now = datetime.now(timezone.utc)
+    after = None
+    if since:
+        changed_at, todo_id, synced_to = decode_sync_token(since)
+        if not repository.is_valid_todo_id(todo_id):
+            raise HTTPException(status_code=400, detail="Invalid sync token")
+        if max(changed_at, synced_to) < tombstone_cutoff(now):
+            raise HTTPException(status_code=410, detail="Sync token expired, refetch all todos")
+        after = (changed_at, todo_id)
+
+    etag = await todos_etag(request, current_user["_id"])
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    entries = await repository.list_changes(current_user["_id"], limit + 1, after=after)
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    changed = [render_todo(entry) for entry in entries if "deleted_at" not in entry]
+    deleted = [entry["id"] for entry in entries if "deleted_at" in entry]
+    settled_before = now - timedelta(seconds=TODOS_SYNC_LAG_SECONDS)
+    settled = [entry for entry in entries if as_utc(change_key(entry)[0]) <= settled_before]
+    if settled:
+        key = change_key(settled[-1])
+    elif has_more:
+        # A full page of unsettled changes: move on rather than loop on it
+        key = change_key(entries[-1])
+    else:
+        key = after
+    # Passing the check above means nothing unseen was pruned by now; once the
+    # last page is out the client also has every tombstone up to the lag
+    synced_to = tombstone_cutoff(now) if has_more else max(settled_before, tombstone_cutoff(now))
+    sync_token = encode_sync_token(as_utc(key[0]), key[1], synced_to) if key else None
+
+    return FastJSONResponse(
+        {"changed": changed, "deleted": deleted, "sync_token": sync_token, "has_more": has_more},
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
+
+@app.get("/todos/stats", response_model=TodoStats)
+async def get_todo_stats(current_user: dict = Depends(get_current_user)):
+    """Todo counts from the user's maintained counters, without reading any todos.
+
+    On SQLite the counters change in the same transaction as the todos. On
+    MongoDB they are updated right after the write, so a failure in between
+    leaves them off until the periodic repair job recomputes them.
+    """
+    stats = await repository.get_todo_stats(current_user["_id"])
+    return {**stats, "pending": stats["total"] - stats["completed"]}
+
+@app.get("/todos/archive", response_model=List[ArchivedTodo])
+async def get_archived_todos(
+    request: Request,
+    limit: int = Query(TODOS_DEFAULT_PAGE_SIZE, ge=1, le=TODOS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """List archived todos oldest first; the next page's cursor is in ``X-Next-Cursor``.
+
+    Updating or deleting an archived todo through the usual endpoints moves it
+    back to the active list first.
+    """
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if not repository.is_valid_todo_id(after[1]):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    etag = await todos_etag(request, current_user["_id"])
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    todos = await repository.list_archived_todos(current_user["_id"], limit + 1, after=after)
+    if len(todos) > limit:
+        todos = todos[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(todos[-1]["created_at"], todos[-1]["id"])
+    return FastJSONResponse(
+        [{**render_todo(todo), "archived_at": todo["archived_at"]} for todo in todos], headers=headers,
+    )
+
+@app.post("/todos/batch", response_model=TodoBatchResult)
+async def create_todos_batch(batch: TodoBatchCreate, current_user: dict = Depends(get_current_user)):
+    now = datetime.now(timezone.utc)
+    todo_docs = [
+        {
+            "title": todo.title,
+            "description": todo.description,
+            "completed": todo.completed,
+            "tags": todo.tags,
+            "created_at": now,
             "user_id": current_user["_id"]
-        })
-        if not todo:
-            raise HTTPException(status_code=404, detail="Todo not found")
-        
-        todo["id"] = str(todo["_id"])
-        del todo["_id"]
-        return TodoResponse(**todo)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid todo ID")
+        }
+        for todo in batch.todos
+    ]
+    created_todos = await repository.insert_todos(todo_docs)
+    await todos_changed(current_user["_id"], "created", todos=created_todos)
+    results = [
+        TodoBatchItemResult(id=todo["id"], status="created", todo=TodoResponse(**todo))
+        for todo in created_todos
+    ]
+    return TodoBatchResult(matched=0, modified=len(results), results=results)
+
+@app.put("/todos/batch", response_model=TodoBatchResult)
+async def update_todos_batch(batch: TodoBatchUpdate, current_user: dict = Depends(get_current_user)):
+    update_data = batch.update.model_dump(exclude_none=True)
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+
+    ids, completed, invalid_ids = todo_selection(batch)
+    matched, modified, updated_todos = await repository.update_todos(
+        current_user["_id"], update_data, ids=ids, completed=completed
+    )
+    if modified:
+        await todos_changed(current_user["_id"], "updated", todos=updated_todos if ids is not None else None)
+
+    results = [TodoBatchItemResult(id=i, status="invalid_id") for i in invalid_ids]
+    if ids is not None:
+        updated = {todo["id"]: todo for todo in updated_todos}
+        for todo_id in ids:
+            todo = updated.get(todo_id)
+            if todo is None:
+                results.append(TodoBatchItemResult(id=todo_id, status="not_found"))
+            else:
+                results.append(TodoBatchItemResult(id=todo_id, status="updated", todo=TodoResponse(**todo)))
+    return TodoBatchResult(matched=matched, modified=modified, results=results)
+
+@app.delete("/todos/batch", response_model=TodoBatchResult)
+async def delete_todos_batch(batch: TodoBatchDelete, current_user: dict = Depends(get_current_user)):
+    ids, completed, invalid_ids = todo_selection(batch)
+    deleted, deleted_ids = await repository.delete_todos(current_user["_id"], ids=ids, completed=completed)
+    if deleted:
+        await todos_changed(current_user["_id"], "deleted", ids=deleted_ids)
+
+    results = [TodoBatchItemResult(id=i, status="invalid_id") for i in invalid_ids]
+    if ids is not None:
+        deleted_set = set(deleted_ids)
+        results.extend(
+            TodoBatchItemResult(id=i, status="deleted" if i in deleted_set else "not_found")
+            for i in ids
+        )
+    return TodoBatchResult(matched=deleted, modified=deleted, results=results)
+
+@app.get("/todos/export")
+async def export_todos(current_user: dict = Depends(get_current_user)):
+    """Stream all of the user's todos, archived ones included, as NDJSON, one todo per line"""
+    async def generate():
+        lines = []
+        todos = repository.iter_todos(current_user["_id"], batch_size=TODOS_EXPORT_BATCH_SIZE, include_archived=True)
+        async for todo in todos:
+            lines.append(todo_to_ndjson(todo))
+            if len(lines) >= TODOS_EXPORT_BATCH_SIZE:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="todos.ndjson"'},
+    )
+
+@app.post("/todos/events/ticket", response_model=StreamTicket)
+async def create_stream_ticket(
+    token: str = Depends(oauth2_scheme),
+    current_user: dict = Depends(get_current_user)
+):
+    """A short-lived ticket for opening ``GET /todos/events?ticket=``.
+
+    ``EventSource`` cannot send an Authorization header. The ticket can go in
+    the URL because it expires after ``TODO_EVENTS_TICKET_SECONDS``, is
+    refused everywhere else, and streams opened with it still end when the
+    access token expires.
+    """
+    ticket = create_access_token(
+        {"sub": current_user["username"], "use": "stream", "session_exp": jwt.get_unverified_claims(token)["exp"]},
+        expires_delta=timedelta(seconds=TODO_EVENTS_TICKET_SECONDS),
+    )
+    return {"ticket": ticket, "expires_in": int(TODO_EVENTS_TICKET_SECONDS)}
+
+@app.get("/todos/events")
+async def stream_todo_events(
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    principal: tuple = Depends(get_stream_principal)
+):
+    """Server-sent events stream of the user's todo changes.
+
+    Events are ``created`` and ``updated`` (with the changed todos),
+    ``deleted`` (with their ids), ``archived`` (with their ids) and ``resync``
+    (refetch with GET /todos). Each event id is the user's todo version;
+    reconnecting with ``Last-Event-ID`` replays missed events, or sends a
+    resync if they are no longer held. Changes made through other workers
+    arrive as a resync. The stream ends when the access token expires.
+    """
+    current_user, session_exp = principal
+    user_id = current_user["_id"]
+
+    async def generate():
+        # Read before subscribing: a change in between then shows up as a
+        # version gap rather than being skipped
+        current = await get_todos_version(user_id)
+        subscription = todo_events.subscribe(user_id)
+        try:
+            yield b"retry: 3000\n\n"
+            sent = current
+            if last_event_id is not None:
+                try:
+                    sent = int(last_event_id)
+                except ValueError:
+                    sent = -1
+                missed = todo_events.replay(user_id, sent)
+                if missed is None or (missed[-1][0] if missed else sent) < current:
+                    sent = current
+                    yield todo_events.resync_frame(sent)
+                else:
+                    for version, frame in missed:
+                        sent = version
+                        yield frame
+            while True:
+                remaining = session_exp - time.time()
+                if remaining <= 0:
+                    return
+                try:
+                    version, frame = await asyncio.wait_for(
+                        subscription.get(), min(TODO_EVENTS_HEARTBEAT_SECONDS, remaining),
+                    )
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if version <= sent:
+                    continue  # already replayed or covered by a resync
+                # A skipped version, or one without a frame (an overflowed
+                # queue or the version poll), was changed elsewhere
+                gap = version > sent + 1
+                sent = version
+                yield frame if frame is not None and not gap else todo_events.resync_frame(version)
+        finally:
+            todo_events.unsubscribe(user_id, subscription)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/todos/import", response_model=TodoImportResult)
+async def import_todos(request: Request, current_user: dict = Depends(get_current_user)):
+    """Import todos from an NDJSON request body.
+
+    Each line is a todo (title, description, completed, tags and optionally
+    created_at); ids are assigned on import. Lines are validated and inserted
+    in batches as the body streams in; invalid lines are skipped and reported.
+    """
+    imported = 0
+    failed = 0
+    errors = []
+    batch = []
+
+    async def flush():
+        nonlocal imported, batch
+        if batch:
+            await repository.insert_todos(batch)
+            imported += len(batch)
+            batch = []
+
+    line_number = 0
+    try:
+        async for line in read_ndjson_lines(request):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                todo = TodoImport.model_validate_json(line)
+            except ValidationError as e:
+                failed += 1
+                if len(errors) < 100:
+                    errors.append(TodoImportError(line=line_number, error=e.errors()[0]["msg"]))
+                continue
+            # Stored in UTC so SQLite's text ordering matches time order
+            created_at = as_utc(todo.created_at) or datetime.now(timezone.utc)
+            batch.append({
+                "title": todo.title,
+                "description": todo.description,
+                "completed": todo.completed,
+                "tags": todo.tags,
+                "created_at": created_at,
+                "user_id": current_user["_id"]
+            })
+            if len(batch) >= TODOS_IMPORT_BATCH_SIZE:
+                await flush()
+        await flush()
+    finally:
+        # Batches already flushed stay imported even when the body fails later
+        if imported:
+            await todos_changed(current_user["_id"], "resync")
+    return TodoImportResult(imported=imported, failed=failed, errors=errors)
+
+@app.get("/todos/{todo_id}", response_model=TodoResponse)
+async def get_todo(
+    todo_id: str,
+    request: Request,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    check_todo_id(todo_id)
+    etag = await todos_etag(request, current_user["_id"])
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    todo = await repository.get_todo(current_user["_id"], todo_id)
+    if not todo:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    return FastJSONResponse(render_todo(todo), headers={"ETag": etag, "Cache-Control": "private, no-cache"})
 
 @app.put("/todos/{todo_id}", response_model=TodoResponse)
 async def update_todo(
@@ -368,91 +1510,93 @@ async def update_todo(
     todo_update: TodoUpdate, 
     current_user: dict = Depends(get_current_user)
 ):
-    try:
-        update_data = {k: v for k, v in todo_update.dict().items() if v is not None}
-        
-        if not update_data:
-            raise HTTPException(status_code=400, detail="No fields to update")
-        
-        result = todos_collection.update_one(
-            {"_id": ObjectId(todo_id), "user_id": current_user["_id"]},
-            {"$set": update_data}
-        )
-        
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="Todo not found")
-        
-        updated_todo = todos_collection.find_one({
-            "_id": ObjectId(todo_id),
-            "user_id": current_user["_id"]
-        })
-        updated_todo["id"] = str(updated_todo["_id"])
-        del updated_todo["_id"]
-        
-        return TodoResponse(**updated_todo)
-    except Exception as e:
-        if "Todo not found" in str(e):
-            raise e
-        raise HTTPException(status_code=400, detail="Invalid todo ID")
+    check_todo_id(todo_id)
+    update_data = {k: v for k, v in todo_update.dict().items() if v is not None}
+    
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    
+    updated_todo = await repository.update_todo(current_user["_id"], todo_id, update_data)
+    if updated_todo is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    await todos_changed(current_user["_id"], "updated", todos=[updated_todo])
+    
+    return TodoResponse(**updated_todo)
 
 @app.delete("/todos/{todo_id}")
 async def delete_todo(todo_id: str, current_user: dict = Depends(get_current_user)):
-    try:
-        result = todos_collection.delete_one({
-            "_id": ObjectId(todo_id),
-            "user_id": current_user["_id"]
-        })
-        
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="Todo not found")
-        
-        return {"message": "Todo deleted successfully"}
-    except Exception as e:
-        if "Todo not found" in str(e):
-            raise e
-        raise HTTPException(status_code=400, detail="Invalid todo ID")
+    check_todo_id(todo_id)
+    if not await repository.delete_todo(current_user["_id"], todo_id):
+        raise HTTPException(status_code=404, detail="Todo not found")
+    await todos_changed(current_user["_id"], "deleted", ids=[todo_id])
+    
+    return {"message": "Todo deleted successfully"}
 
 @app.get("/")
 async def root():
     return {"message": "Todo App API is running!"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics_registry.render(), media_type=metrics.CONTENT_TYPE)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Without a configured token the admin endpoints do not exist
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/profiles", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """Summaries of the most recent request profiles, newest first"""
+    return [profile.summary() for profile in reversed(profiler.profiles)]
+
+@app.get("/admin/profiles/{profile_id}", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: int, format: str = Query("speedscope", pattern="^(speedscope|collapsed)$")):
+    """One profile as speedscope JSON (open at speedscope.app) or folded stacks"""
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return Response(profile.to_collapsed(), media_type="text/plain")
+    return FastJSONResponse(
+        profile.to_speedscope(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.speedscope.json"'},
+    )
+
+@app.get("/admin/slow-queries", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def slow_queries_report(limit: int = Query(20, ge=1, le=200)):
+    """The slow query shapes that took the most total time, with their captured plans"""
+    if slow_query_log is None:
+        raise HTTPException(status_code=404, detail="Slow-query log is disabled")
+    return FastJSONResponse(slow_query_log.report(limit))
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint to test database connectivity"""
+    database_name = DATABASE_NAME if USE_MONGODB else os.path.basename(SQLITE_PATH)
     try:
-        if USE_MONGODB:
-            # Test MongoDB connection
-            client.admin.command('ping')
-            db_stats = db.command("dbstats")
-            
-            return {
-                "status": "healthy",
-                "database": "mongodb",
-                "connected": True,
-                "database_name": DATABASE_NAME,
-                "environment": ENVIRONMENT,
-                "collections": db_stats.get("collections", 0)
-            }
-        else:
-            # Test SQLite connection
-            cursor = sqlite_conn.execute('SELECT COUNT(*) FROM users')
-            user_count = cursor.fetchone()[0]
-            
-            return {
-                "status": "healthy", 
-                "database": "sqlite",
-                "connected": True,
-                "database_name": "todoapp.db",
-                "environment": ENVIRONMENT,
-                "user_count": user_count
-            }
+        details = await repository.health()
+        return {
+            "status": "healthy",
+            "database": repository.name,
+            "connected": True,
+            "database_name": database_name,
+            "environment": ENVIRONMENT,
+            **details,
+            "principal_cache": principal_cache.stats(),
+            "todo_list_cache": todo_list_cache.stats() if todo_list_cache else None,
+            "todo_events": todo_events.stats()
+        }
     except Exception as e:
         return {
             "status": "unhealthy",
-            "database": "mongodb" if USE_MONGODB else "sqlite",
+            "database": repository.name,
             "connected": False,
             "error": str(e),
-            "database_name": DATABASE_NAME if USE_MONGODB else "todoapp.db",
+            "database_name": database_name,
             "environment": ENVIRONMENT
         }
 
@@ -0,0 +1,867 @@
+"""
+MongoDB implementation of the ``Repository`` interface.
+
+Kept apart from ``repository`` so the driver (pymongo, bson, motor) is only
+imported by processes that actually talk to MongoDB.
+"""
+
+import asyncio
+import logging
+import re
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo import (
+    ASCENDING, DESCENDING, TEXT, DeleteOne, IndexModel, InsertOne, ReplaceOne, ReturnDocument, UpdateOne, monitoring,
+)
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from repository import (
+    SEARCH_TITLE_WEIGHT, TODO_FIELDS, DuplicateUserError, Repository, merge_changes, utcnow,
+)
+from slow_queries import redact, shape_key
+
+logger = logging.getLogger(__name__)
+
+# Indexes every query in this module relies on. Creation is idempotent, so they
+# are (re)declared on every startup. Username/email uniqueness doubles as the
+# duplicate check for registration.
+MONGO_INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "todos": [
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_created_at",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_updated_at",
+        ),
+        # GET /todos?completed= in either sort order
+        IndexModel(
+            [("user_id", ASCENDING), ("completed", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_completed_created_at",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("completed", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_completed_updated_at",
+        ),
+        # Multikey: one entry per tag, so a tag filter reads only its todos
+        IndexModel(
+            [("user_id", ASCENDING), ("tags", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_tags_created_at",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("tags", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_tags_updated_at",
+        ),
+        # Archiver candidates; partial, so writes to open todos never touch it
+        IndexModel(
+            [("updated_at", ASCENDING)], name="completed_updated_at", partialFilterExpression={"completed": True},
+        ),
+        # user_id prefix keeps text searches scoped to one user's entries;
+        # no stemming, so matching agrees with the SQLite FTS5 tokenizer
+        IndexModel(
+            [("user_id", ASCENDING), ("title", TEXT), ("description", TEXT)],
+            name="user_id_text",
+            weights={"title": SEARCH_TITLE_WEIGHT, "description": 1},
+            default_language="none",
+        ),
+    ],
+    # _id is the deleted todo's id
+    "todo_tombstones": [
+        IndexModel(
+            [("user_id", ASCENDING), ("deleted_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_deleted_at",
+        ),
+        IndexModel([("deleted_at", ASCENDING)], name="deleted_at"),
+    ],
+    # _id is the archived todo's id
+    "todos_archive": [
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_created_at",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_updated_at",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("tags", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_tags_created_at",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("tags", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_tags_updated_at",
+        ),
+    ],
+}
+
+
+class MongoRepository(Repository):
+    name = "mongodb"
+
+    def __init__(self, client, database_name: str):
+        self.client = client
+        self.db = client[database_name]
+        self.users = self.db.users
+        self.todos = self.db.todos
+        self.tombstones = self.db.todo_tombstones
+        self.archive = self.db.todos_archive
+        self.meta = self.db.meta
+
+    @staticmethod
+    def _todo_from_doc(doc: dict) -> dict:
+        doc["id"] = str(doc.pop("_id"))
+        return doc
+
+    @staticmethod
+    def _after_query(field: str, after: Tuple[datetime, str], descending: bool = False) -> dict:
+        after_value, after_id = after
+        beyond = "$lt" if descending else "$gt"
+        return {"$or": [
+            {field: {beyond: after_value}},
+            {field: after_value, "_id": {beyond: ObjectId(after_id)}},
+        ]}
+
+    def _selection_query(self, user_id: str, ids: Optional[List[str]], completed: Optional[bool]):
+        query = {"user_id": user_id}
+        if ids is not None:
+            query["_id"] = {"$in": [ObjectId(i) for i in ids]}
+        elif completed is not None:
+            query["completed"] = completed
+        return query
+
+    async def get_user_by_username(self, username: str) -> Optional[dict]:
+        user = await self.users.find_one({"username": username})
+        if user:
+            user["_id"] = str(user["_id"])
+        return user
+
+    async def create_user(self, user_data: dict) -> dict:
+        user_data["_id"] = ObjectId()
+        try:
+            result = await self.users.insert_one(user_data)
+        except DuplicateKeyError as e:
+            key_pattern = (e.details or {}).get("keyPattern", {})
+            raise DuplicateUserError("email" if "email" in key_pattern else "username")
+        user_data["_id"] = str(result.inserted_id)
+        return user_data
+
+    async def create_users(self, users_data: List[dict]) -> list:
+        for user_data in users_data:
+            user_data["_id"] = ObjectId()
+        failed = {}
+        try:
+            await self.users.insert_many(users_data, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                if error["code"] == 11000:
+                    key_pattern = error.get("keyPattern", {})
+                    failed[error["index"]] = DuplicateUserError("email" if "email" in key_pattern else "username")
+                else:
+                    failed[error["index"]] = OperationFailure(error["errmsg"], error["code"], error)
+        for user_data in users_data:
+            user_data["_id"] = str(user_data["_id"])
+        return [failed.get(index, user_data) for index, user_data in enumerate(users_data)]
+
+    async def check_user_exists(self, username: str = None, email: str = None) -> bool:
+        if username and await self.users.find_one({"username": username}, {"_id": 1}):
+            return True
+        if email and await self.users.find_one({"email": email}, {"_id": 1}):
+            return True
+        return False
+
+    async def get_todos_version(self, user_id: str) -> int:
+        user = await self.users.find_one({"_id": ObjectId(user_id)}, {"todos_version": 1})
+        return user.get("todos_version", 0) if user else 0
+
+    async def get_todos_versions(self, user_ids: List[str]) -> Dict[str, int]:
+        cursor = self.users.find({"_id": {"$in": [ObjectId(user_id) for user_id in user_ids]}}, {"todos_version": 1})
+        return {str(user["_id"]): user.get("todos_version", 0) async for user in cursor}
+
+    async def bump_todos_version(self, user_id: str) -> int:
+        user = await self.users.find_one_and_update(
+            {"_id": ObjectId(user_id)},
+            {"$inc": {"todos_version": 1}},
+            projection={"todos_version": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return user["todos_version"] if user else 0
+
+    def is_valid_todo_id(self, todo_id: str) -> bool:
+        return ObjectId.is_valid(todo_id)
+
+    async def _adjust_stats(self, deltas: Dict[str, Tuple[int, int]]):
+        """Apply ``user_id -> (total, completed)`` deltas to the users' counters.
+
+        Atomic per user but not transactional with the todo write, which has
+        already succeeded: multi-document transactions need a replica set and
+        would put a second round trip on every write. A failure here is logged
+        and the drift is left for ``repair_todo_stats`` to correct, so the
+        counters are eventually consistent.
+        """
+        try:
+            requests = [
+                UpdateOne({"_id": ObjectId(user_id)}, {"$inc": {"todos_total": total, "todos_completed": completed}})
+                for user_id, (total, completed) in deltas.items() if total or completed
+            ]
+            if requests:
+                await self.users.bulk_write(requests, ordered=False)
+        except Exception as e:
+            logger.warning("Could not update todo counters of users %s: %s", list(deltas), e)
+
+    @staticmethod
+    def _count_inserts(todo_docs: List[dict]) -> Dict[str, Tuple[int, int]]:
+        deltas = {}
+        for doc in todo_docs:
+            total, completed = deltas.get(doc["user_id"], (0, 0))
+            deltas[doc["user_id"]] = (total + 1, completed + bool(doc["completed"]))
+        return deltas
+
+    async def insert_todo(self, todo_doc: dict) -> dict:
+        todo_doc["updated_at"] = utcnow()
+        todo_doc.setdefault("tags", [])
+        await self.todos.insert_one(todo_doc)
+        await self._adjust_stats(self._count_inserts([todo_doc]))
+        return self._todo_from_doc(todo_doc)
+
+    async def insert_todos(self, todo_docs: List[dict]) -> List[dict]:
+        now = utcnow()
+        for doc in todo_docs:
+            doc["updated_at"] = now
+            doc.setdefault("tags", [])
+        await self.todos.insert_many(todo_docs)
+        await self._adjust_stats(self._count_inserts(todo_docs))
+        return [self._todo_from_doc(doc) for doc in todo_docs]
+
+    def _page_query(
+        self, user_id: str, after, sort: str = "created_at",
+        completed: Optional[bool] = None, tags: Sequence[str] = (),
+        created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+    ) -> Tuple[dict, list]:
+        """Filter and sort of a ``list_todos`` page; shared with index_report"""
+        key = sort.lstrip("-")
+        descending = sort.startswith("-")
+        # Equality on user_id and completed or tags, then the sort key: the
+        # prefix of one of the compound indexes above
+        query = {"user_id": user_id}
+        if completed is not None:
+            query["completed"] = completed
+        if tags:
+            query["tags"] = tags[0] if len(tags) == 1 else {"$all": list(tags)}
+        created = {}
+        if created_after is not None:
+            created["$gt"] = created_after
+        if created_before is not None:
+            created["$lt"] = created_before
+        if created:
+            query["created_at"] = created
+        if after is not None:
+            query.update(self._after_query(key, after, descending))
+        direction = DESCENDING if descending else ASCENDING
+        return query, [(key, direction), ("_id", direction)]
+
+    def _page(self, collection, user_id: str, limit: int, after, projection=None, sort: str = "created_at",
+              **filters):
+        query, order = self._page_query(user_id, after, sort, **filters)
+        return collection.find(query, projection).sort(order).limit(limit).to_list(length=limit)
+
+    async def list_todos(self, user_id, limit, after=None, fields=TODO_FIELDS, include_archived=False,
+                         sort="created_at", **filters):
+        projection = {field: 1 for field in fields}
+        projection["created_at"] = 1
+        projection[sort.lstrip("-")] = 1
+        docs = await self._page(self.todos, user_id, limit, after, projection, sort, **filters)
+        # Archived todos are all completed
+        if include_archived and filters.get("completed") is not False:
+            archived = await self._page(self.archive, user_id, limit, after, projection, sort, **filters)
+            key = sort.lstrip("-")
+            docs = sorted(
+                docs + archived, key=lambda doc: (doc[key], doc["_id"]), reverse=sort.startswith("-"),
+            )[:limit]
+        return [self._todo_from_doc(doc) for doc in docs]
+
+    async def list_archived_todos(self, user_id, limit, after=None):
+        return [self._todo_from_doc(doc) for doc in await self._page(self.archive, user_id, limit, after)]
+
+    async def iter_todos(
+        self, user_id: str, batch_size: int = 1000, include_archived: bool = False,
+    ) -> AsyncIterator[dict]:
+        collections = [self.todos, self.archive] if include_archived else [self.todos]
+        # One sorted cursor per collection, merged as they stream
+        order = [("created_at", 1), ("_id", 1)]
+        cursors = [
+            aiter(collection.find({"user_id": user_id}).sort(order).batch_size(batch_size)) for collection in collections
+        ]
+        heads = [await anext(cursor, None) for cursor in cursors]
+        while any(head is not None for head in heads):
+            i = min(
+                (i for i, head in enumerate(heads) if head is not None),
+                key=lambda i: (heads[i]["created_at"], heads[i]["_id"]),
+            )
+            yield self._todo_from_doc(heads[i])
+            heads[i] = await anext(cursors[i], None)
+
+    async def get_todo(self, user_id: str, todo_id: str) -> Optional[dict]:
+        query = {"_id": ObjectId(todo_id), "user_id": user_id}
+        todo = await self.todos.find_one(query) or await self.archive.find_one(query)
+        return self._todo_from_doc(todo) if todo else None
+
+    async def update_todo(self, user_id: str, todo_id: str, update_data: dict) -> Optional[dict]:
+        changes = {**update_data, "updated_at": utcnow()}
+        # The document before the update tells whether completed flipped; the
+        # updated todo is that plus the $set fields
+        update = partial(
+            self.todos.find_one_and_update, {"_id": ObjectId(todo_id), "user_id": user_id}, {"$set": changes},
+            return_document=ReturnDocument.BEFORE,
+        )
+        todo = await update()
+        if todo is None and await self._unarchive(user_id, [ObjectId(todo_id)]):
+            todo = await update()
+        if todo is None:
+            return None
+        if "completed" in update_data and bool(update_data["completed"]) != bool(todo.get("completed")):
+            await self._adjust_stats({user_id: (0, 1 if update_data["completed"] else -1)})
+        todo.update(changes)
+        return self._todo_from_doc(todo)
+
+    async def update_todos(self, user_id, update_data, ids=None, completed=None):
+        query = self._selection_query(user_id, ids, completed)
+        restored = await self._unarchive(user_id, query["_id"]["$in"]) if ids is not None else []
+        now = utcnow()
+        update = {"$set": {**update_data, "updated_at": now}}
+        if "completed" in update_data:
+            # Update the todos that flip separately, so their count is known;
+            # the others go first so the flipped ones are not matched twice.
+            # A selection by completed falls entirely in one of the groups.
+            target = bool(update_data["completed"])
+            rest = {field: value for field, value in update_data.items() if field != "completed"}
+            matched = modified = count = 0
+            if "completed" not in query or query["completed"] == target:
+                unchanged_query = {"$and": [query, {"completed": target}]}
+                if rest:
+                    unchanged = await self.todos.update_many(unchanged_query, {"$set": {**rest, "updated_at": now}})
+                    matched, modified = unchanged.matched_count, unchanged.modified_count
+                else:
+                    # Nothing to change, so their updated_at stays put; those
+                    # that just left the archive have changed all the same
+                    matched = await self.todos.count_documents(unchanged_query)
+                    if restored:
+                        modified = await self.todos.count_documents(
+                            {"$and": [unchanged_query, {"_id": {"$in": restored}}]},
+                        )
+            if "completed" not in query or query["completed"] != target:
+                flipped = await self.todos.update_many({"$and": [query, {"completed": {"$ne": target}}]}, update)
+                count = flipped.modified_count
+                matched += flipped.matched_count
+                modified += flipped.modified_count
+            await self._adjust_stats({user_id: (0, count if target else -count)})
+        else:
+            result = await self.todos.update_many(query, update)
+            matched, modified = result.matched_count, result.modified_count
+        todos = []
+        if ids is not None:
+            todos = [self._todo_from_doc(doc) for doc in await self.todos.find(query).to_list(length=len(ids))]
+        return matched, modified, todos
+
+    async def _add_tombstones(self, user_id: str, object_ids: List[ObjectId]):
+        deleted_at = utcnow()
+        try:
+            await self.tombstones.insert_many(
+                [{"_id": object_id, "user_id": user_id, "deleted_at": deleted_at} for object_id in object_ids],
+                ordered=False,
+            )
+        except BulkWriteError:
+            pass  # a concurrent delete already recorded some of them
+
+    async def delete_todo(self, user_id: str, todo_id: str) -> bool:
+        delete = partial(
+            self.todos.find_one_and_delete, {"_id": ObjectId(todo_id), "user_id": user_id}, projection={"completed": 1},
+        )
+        todo = await delete()
+        if todo is None and await self._unarchive(user_id, [ObjectId(todo_id)]):
+            todo = await delete()
+        if todo is None:
+            return False
+        await self._add_tombstones(user_id, [ObjectId(todo_id)])
+        await self._adjust_stats({user_id: (-1, -bool(todo.get("completed")))})
+        return True
+
+    async def delete_todos(self, user_id, ids=None, completed=None):
+        query = self._selection_query(user_id, ids, completed)
+        if ids is not None:
+            await self._unarchive(user_id, query["_id"]["$in"])
+        # Resolve the ids first so exactly those todos are deleted and tombstoned
+        docs = await self.todos.find(query, {"completed": 1}).to_list(length=None)
+        if not docs:
+            return 0, []
+        object_ids = [doc["_id"] for doc in docs]
+        result = await self.todos.delete_many({"_id": {"$in": object_ids}, "user_id": user_id})
+        await self._add_tombstones(user_id, object_ids)
+        await self._adjust_stats({user_id: (-len(docs), -sum(bool(doc.get("completed")) for doc in docs))})
+        return result.deleted_count, [str(object_id) for object_id in object_ids]
+
+    async def apply_todo_writes(self, writes: List[tuple]) -> list:
+        # The whole group goes out as one ordered bulk write, so it waits for
+        # a single write-concern acknowledgement instead of one per todo, and
+        # writes to the same todo apply in the order they were submitted
+        now = utcnow()
+        results = [None] * len(writes)
+        requests, deletes, updates = [], {}, {}
+        for index, (kind, *args) in enumerate(writes):
+            if kind == "insert":
+                todo_doc = args[0]
+                todo_doc.update(_id=ObjectId(), updated_at=now)
+                todo_doc.setdefault("tags", [])
+                requests.append(InsertOne(todo_doc))
+            elif kind == "update":
+                user_id, todo_id, update_data = args
+                updates[index] = (ObjectId(todo_id), user_id)
+                requests.append(UpdateOne(
+                    {"_id": ObjectId(todo_id), "user_id": user_id}, {"$set": {**update_data, "updated_at": now}},
+                ))
+            else:
+                user_id, todo_id = args
+                deletes[index] = (ObjectId(todo_id), user_id)
+                requests.append(DeleteOne({"_id": ObjectId(todo_id), "user_id": user_id}))
+
+        # Bulk results carry no per-operation counts, so the addressed todos
+        # are read beforehand and the group is replayed on them, in order, for
+        # the results and the counters
+        state = {}
+        if deletes or updates:
+            object_ids = [object_id for object_id, _ in (*deletes.values(), *updates.values())]
+            state = {doc["_id"]: doc async for doc in self.todos.find({"_id": {"$in": object_ids}})}
+            # Archived todos are moved back before the group addresses them
+            missing = {}
+            for object_id, user_id in (*deletes.values(), *updates.values()):
+                if object_id not in state:
+                    missing.setdefault(user_id, []).append(object_id)
+            if missing:
+                for user_id, missing_ids in missing.items():
+                    await self._unarchive(user_id, missing_ids)
+                query = {"_id": {"$in": [object_id for ids in missing.values() for object_id in ids]}}
+                state.update({doc["_id"]: doc async for doc in self.todos.find(query)})
+        # An ordered bulk write stops at the first error; the rest of the group
+        # is sent again, so one bad write does not hold back the others
+        failed = {}
+        start = 0
+        while start < len(requests):
+            try:
+                await self.todos.bulk_write(requests[start:], ordered=True)
+                break
+            except BulkWriteError as e:
+                error = e.details["writeErrors"][0]
+                index = start + error["index"]
+                failed[index] = OperationFailure(error["errmsg"], error["code"], error)
+                start = index + 1
+
+        deltas = {}
+
+        def count(user_id, total, completed):
+            previous_total, previous_completed = deltas.get(user_id, (0, 0))
+            deltas[user_id] = (previous_total + total, previous_completed + completed)
+
+        def current(object_id, user_id):
+            doc = state.get(object_id)
+            return doc if doc is not None and doc["user_id"] == user_id else None
+
+        tombstones = []
+        for index, (kind, *args) in enumerate(writes):
+            if index in failed:
+                results[index] = failed[index]
+            elif kind == "insert":
+                count(args[0]["user_id"], 1, bool(args[0]["completed"]))
+                results[index] = self._todo_from_doc(args[0])
+            elif kind == "update":
+                doc = current(*updates[index])
+                if doc is None:
+                    continue
+                user_id, _, update_data = args
+                if "completed" in update_data and bool(update_data["completed"]) != bool(doc.get("completed")):
+                    count(user_id, 0, 1 if update_data["completed"] else -1)
+                doc.update(update_data, updated_at=now)
+                results[index] = self._todo_from_doc(dict(doc))
+            else:
+                object_id, user_id = deletes[index]
+                doc = current(object_id, user_id)
+                # Only the first delete of a todo in the group reports it deleted
+                results[index] = doc is not None
+                if doc is not None:
+                    del state[object_id]
+                    count(user_id, -1, -bool(doc.get("completed")))
+                    tombstones.append({"_id": object_id, "user_id": user_id, "deleted_at": now})
+        if tombstones:
+            try:
+                await self.tombstones.insert_many(tombstones, ordered=False)
+            except BulkWriteError:
+                pass  # a concurrent delete already recorded some of them
+        await self._adjust_stats(deltas)
+        return results
+
+    async def _unarchive(self, user_id: str, object_ids: List[ObjectId]) -> List[ObjectId]:
+        """Move archived todos back ahead of a write that addresses them.
+
+        They are stamped as changed, so delta sync brings back what it saw as
+        deleted. Returns the ids that were moved.
+        """
+        docs = await self.archive.find({"_id": {"$in": object_ids}, "user_id": user_id}).to_list(length=None)
+        if not docs:
+            return []
+        now = utcnow()
+        for doc in docs:
+            doc.pop("archived_at", None)
+            doc["updated_at"] = now
+        failed = set()
+        try:
+            await self.todos.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details["writeErrors"]}  # moved back concurrently
+        restored = [doc for index, doc in enumerate(docs) if index not in failed]
+        moved_ids = [doc["_id"] for doc in docs]
+        await self.archive.delete_many({"_id": {"$in": moved_ids}})
+        await self.tombstones.delete_many({"_id": {"$in": moved_ids}})
+        await self._adjust_stats({user_id: (len(restored), sum(bool(doc.get("completed")) for doc in restored))})
+        return moved_ids
+
+    async def archive_completed_todos(self, before, batch_size):
+        candidates = {"completed": True, "updated_at": {"$lt": before}}
+        docs = await self.todos.find(candidates, {"_id": 1}).limit(batch_size).to_list(length=batch_size)
+        # Removed one by one, and only if still a candidate, so every todo is
+        # archived by exactly one archiver even with several workers, and a
+        # todo updated or deleted since it was read is left alone. Only what
+        # was actually removed is copied, so no copy can outlive a deleted todo.
+        removed = await asyncio.gather(*(
+            self.todos.find_one_and_delete({"_id": doc["_id"], **candidates}) for doc in docs
+        ))
+        removed = [doc for doc in removed if doc is not None]
+        if not removed:
+            return {}
+        archived_at = utcnow()
+        # Replaced, so a copy left by an older interrupted run cannot win
+        await self.archive.bulk_write(
+            [ReplaceOne({"_id": doc["_id"]}, {**doc, "archived_at": archived_at}, upsert=True) for doc in removed],
+            ordered=False,
+        )
+        archived = {}
+        for doc in removed:
+            archived.setdefault(doc["user_id"], []).append(doc["_id"])
+        for user_id, object_ids in archived.items():
+            await self._add_tombstones(user_id, object_ids)
+        await self._adjust_stats({user_id: (-len(ids), -len(ids)) for user_id, ids in archived.items()})
+        return {user_id: [str(object_id) for object_id in ids] for user_id, ids in archived.items()}
+
+    async def get_todo_stats(self, user_id: str) -> dict:
+        user = await self.users.find_one({"_id": ObjectId(user_id)}, {"todos_total": 1, "todos_completed": 1})
+        user = user or {}
+        return {"total": user.get("todos_total", 0), "completed": user.get("todos_completed", 0)}
+
+    async def repair_todo_stats(self, user_ids=None, batch_size: int = 1000) -> int:
+        query = {} if user_ids is None else {"_id": {"$in": [ObjectId(user_id) for user_id in user_ids]}}
+        cursor = self.users.find(query, {"todos_total": 1, "todos_completed": 1}).batch_size(batch_size)
+        repaired = 0
+        batch = []
+        async for user in cursor:
+            batch.append(user)
+            if len(batch) == batch_size:
+                repaired += await self._repair_stats_batch(batch)
+                batch = []
+        if batch:
+            repaired += await self._repair_stats_batch(batch)
+        return repaired
+
+    async def _repair_stats_batch(self, users: List[dict]) -> int:
+        # One aggregation per batch of users, answered from the user_id index
+        pipeline = [
+            {"$match": {"user_id": {"$in": [str(user["_id"]) for user in users]}}},
+            {"$group": {
+                "_id": "$user_id",
+                "total": {"$sum": 1},
+                "completed": {"$sum": {"$cond": ["$completed", 1, 0]}},
+            }},
+        ]
+        counts = {doc["_id"]: doc async for doc in self.todos.aggregate(pipeline)}
+        requests = []
+        for user in users:
+            actual = counts.get(str(user["_id"]), {"total": 0, "completed": 0})
+            if (user.get("todos_total"), user.get("todos_completed")) != (actual["total"], actual["completed"]):
+                requests.append(UpdateOne(
+                    {"_id": user["_id"]},
+                    {"$set": {"todos_total": actual["total"], "todos_completed": actual["completed"]}},
+                ))
+        if requests:
+            await self.users.bulk_write(requests, ordered=False)
+        return len(requests)
+
+    def _changes_queries(self, user_id: str, after) -> Tuple[dict, dict]:
+        """Filters of the changed todos and of the tombstones after a sync key"""
+        todo_query = {"user_id": user_id}
+        tombstone_query = {"user_id": user_id}
+        if after is not None:
+            todo_query.update(self._after_query("updated_at", after))
+            tombstone_query.update(self._after_query("deleted_at", after))
+        return todo_query, tombstone_query
+
+    async def list_changes(self, user_id, limit, after=None):
+        todo_query, tombstone_query = self._changes_queries(user_id, after)
+        todos = await self.todos.find(todo_query).sort([("updated_at", 1), ("_id", 1)]).to_list(length=limit)
+        tombstones = await self.tombstones.find(tombstone_query, {"user_id": 0}).sort(
+            [("deleted_at", 1), ("_id", 1)]
+        ).to_list(length=limit)
+        return merge_changes(
+            [self._todo_from_doc(doc) for doc in todos],
+            [self._todo_from_doc(doc) for doc in tombstones],
+            limit,
+        )
+
+    async def prune_tombstones(self, before: datetime) -> int:
+        result = await self.tombstones.delete_many({"deleted_at": {"$lt": before}})
+        return result.deleted_count
+
+    def _text_search(self, query: dict, terms: List[str]):
+        # Quoted terms are ANDed by $text; the user_id_text index serves it
+        query = {**query, "$text": {"$search": " ".join(f'"{term}"' for term in terms)}}
+        return self.todos.find(query, {"score": {"$meta": "textScore"}}).sort(
+            [("score", {"$meta": "textScore"}), ("_id", 1)]
+        )
+
+    async def search_todos(self, user_id, words, prefix, limit, offset=0):
+        query = {"user_id": user_id}
+        if prefix:
+            # The text index has no prefix matching, so the last term is checked
+            # with a regex on the documents the other conditions select
+            pattern = {"$regex": r"\b" + re.escape(prefix), "$options": "i"}
+            query["$or"] = [{"title": pattern}, {"description": pattern}]
+        if words:
+            todos = await self._text_search(query, words).skip(offset).limit(limit).to_list(length=limit)
+        else:
+            # A lone prefix is often a whole word already: todos containing it
+            # come first, ranked by the text index, then the ones where it only
+            # starts a longer word, oldest first
+            ranked = await self._text_search(query, [prefix]).limit(offset + limit).to_list(length=offset + limit)
+            todos = ranked[offset:]
+            if len(ranked) < offset + limit:
+                rest = {**query, "_id": {"$nin": [todo["_id"] for todo in ranked]}}
+                cursor = self.todos.find(rest).sort([("created_at", 1), ("_id", 1)])
+                todos += await cursor.skip(max(0, offset - len(ranked))).limit(limit - len(todos)).to_list(
+                    length=limit - len(todos)
+                )
+        for todo in todos:
+            todo.setdefault("score", 0.0)
+        return [self._todo_from_doc(todo) for todo in todos]
+
+    async def ensure_indexes(self):
+        for collection_name, indexes in MONGO_INDEXES.items():
+            try:
+                await self.db[collection_name].create_indexes(indexes)
+            except Exception as e:
+                print(f"⚠️  Could not create indexes on {collection_name}: {str(e)}")
+        await self.run_backfills()
+
+    async def _backfill_updated_at(self):
+        # Todos written before updated_at existed start out at created_at
+        await self.todos.update_many({"updated_at": {"$exists": False}}, [{"$set": {"updated_at": "$created_at"}}])
+
+    async def _backfill_tags(self):
+        # Todos written before tags existed have none
+        for collection in (self.todos, self.archive):
+            await collection.update_many({"tags": {"$exists": False}}, {"$set": {"tags": []}})
+
+    async def _backfill_todo_counters(self):
+        # Users from before the todo counters existed get them computed once
+        await self.repair_todo_stats(
+            [str(user["_id"]) async for user in self.users.find({"todos_total": {"$exists": False}}, {"_id": 1})]
+        )
+
+    # Fix-ups of documents written by older releases, in release order. Each
+    # scans a whole collection, so the number applied is recorded in the meta
+    # collection and later startups skip them; append new ones at the end.
+    BACKFILLS = ("_backfill_updated_at", "_backfill_tags", "_backfill_todo_counters")
+
+    async def run_backfills(self) -> int:
+        """Run the backfills not yet recorded as applied; returns how many ran"""
+        marker = await self.meta.find_one({"_id": "schema"}) or {}
+        applied = marker.get("backfills", 0)
+        for version, name in enumerate(self.BACKFILLS[applied:], applied + 1):
+            try:
+                await getattr(self, name)()
+            except Exception as e:
+                # Later backfills may rely on this one; retried on next startup
+                print(f"⚠️  Could not run {name}: {str(e)}")
+                return version - applied - 1
+            await self.meta.update_one({"_id": "schema"}, {"$max": {"backfills": version}}, upsert=True)
+        return len(self.BACKFILLS) - applied
+
+    async def warm_up(self, connections: int):
+        # Concurrent pings each check out a connection, filling the pool
+        await asyncio.gather(*(self.client.admin.command('ping') for _ in range(connections)))
+
+    async def close(self):
+        self.client.close()
+
+    async def health(self) -> dict:
+        await self.client.admin.command('ping')
+        db_stats = await self.db.command("dbstats")
+        return {"collections": db_stats.get("collections", 0)}
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Tracks MongoDB connection pool usage for the pool gauges"""
+
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.open -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+
+# Commands the slow-query log times, and the parts of them that make a shape
+SLOW_QUERY_COMMANDS = {"find", "aggregate", "count", "distinct", "insert", "update", "delete", "findAndModify"}
+EXPLAINABLE_COMMANDS = SLOW_QUERY_COMMANDS - {"insert"}
+_SHAPE_FIELDS = ("filter", "query", "pipeline", "sort", "projection", "hint", "key", "updates", "deletes",
+                 "update", "remove", "fields")
+# Session and cluster bookkeeping the driver adds, which explain does not accept
+_DRIVER_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "writeConcern", "readConcern"}
+_PLAN_FIELDS = ("stage", "indexName", "keyPattern", "direction", "isMultiKey")
+
+
+def _command_shape(command_name: str, command) -> dict:
+    # The command's own field holds the collection name, not a value to redact
+    fields = {field: command[field] for field in _SHAPE_FIELDS if field in command and field != command_name}
+    return {command_name: command[command_name], **redact(fields)}
+
+
+def _find_winning_plan(explain):
+    if isinstance(explain, dict):
+        if "winningPlan" in explain:
+            plan = explain["winningPlan"]
+            return plan.get("queryPlan", plan)  # slot-based engine nests the classic tree
+        children = explain.values()
+    elif isinstance(explain, list):
+        children = explain
+    else:
+        return None
+    return next((plan for plan in map(_find_winning_plan, children) if plan is not None), None)
+
+
+def _plan_tree(stage: dict) -> dict:
+    """Stage names, indexes and redacted filters of a winning plan; index bounds
+    are dropped because they spell out the query's values"""
+    node = {field: stage[field] for field in _PLAN_FIELDS if field in stage}
+    if "filter" in stage:
+        node["filter"] = redact(stage["filter"])
+    if "inputStage" in stage:
+        node["inputStage"] = _plan_tree(stage["inputStage"])
+    if "inputStages" in stage:
+        node["inputStages"] = [_plan_tree(child) for child in stage["inputStages"]]
+    return node
+
+
+def _plan_summary(stage: dict) -> str:
+    name = stage.get("stage", "?")
+    if "indexName" in stage:
+        name = f"{name} {stage['indexName']}"
+    children = [stage["inputStage"]] if "inputStage" in stage else stage.get("inputStages", [])
+    if not children:
+        return name
+    inner = ", ".join(_plan_summary(child) for child in children)
+    return f"{name} <- {inner}" if len(children) == 1 else f"{name} <- [{inner}]"
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Reports commands slower than the slow-query log's threshold.
+
+    Driver callbacks run on whichever thread issued the command, so the
+    ``explain`` of a new slow shape is scheduled on the event loop. ``client``
+    is set once the Motor client exists.
+    """
+
+    def __init__(self, slow_query_log, loop: asyncio.AbstractEventLoop):
+        self.slow_query_log = slow_query_log
+        self.threshold_micros = slow_query_log.threshold * 1_000_000
+        self.loop = loop
+        self.client = None
+        # (connection, request id) -> command, until the reply arrives
+        self.commands: Dict[tuple, dict] = {}
+
+    def started(self, event):
+        if event.command_name in SLOW_QUERY_COMMANDS:
+            self.commands[(event.connection_id, event.request_id)] = event.command
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        command = self.commands.pop((event.connection_id, event.request_id), None)
+        if command is None or event.duration_micros < self.threshold_micros:
+            return
+        shape = _command_shape(event.command_name, command)
+        key = shape_key(shape)
+        new = self.slow_query_log.record("mongodb", key, shape, event.duration_micros / 1_000_000)
+        if new and event.command_name in EXPLAINABLE_COMMANDS and self.client is not None:
+            explained = {field: value for field, value in command.items()
+                         if field not in _DRIVER_FIELDS and not field.startswith("$")}
+            # explain takes one statement; the first stands in for the batch
+            for field in ("updates", "deletes"):
+                if field in explained:
+                    explained[field] = explained[field][:1]
+            try:
+                asyncio.run_coroutine_threadsafe(self._explain(event.database_name, explained, key), self.loop)
+            except RuntimeError:
+                pass  # the loop is shutting down
+
+    async def _explain(self, database_name: str, command: dict, key: str):
+        try:
+            explain = await self.client[database_name].command(
+                {"explain": command, "verbosity": "queryPlanner"}
+            )
+            winning_plan = _find_winning_plan(explain)
+        except Exception as e:
+            self.slow_query_log.set_plan("mongodb", key, None, f"explain failed: {e}")
+            return
+        if winning_plan is None:
+            self.slow_query_log.set_plan("mongodb", key, None, None)
+            return
+        plan = _plan_tree(winning_plan)
+        self.slow_query_log.set_plan("mongodb", key, plan, _plan_summary(plan))
@@ -0,0 +1,220 @@
+"""
+On-demand statistical profiling of individual requests.
+
+``ProfilingMiddleware`` picks requests to profile (an ``X-Profile`` header
+carrying the admin token, or a random sample of traffic) and registers the
+asyncio task serving each one with the ``Profiler``. A sampler thread wakes
+every ``interval`` seconds and records the task's stack: the live Python stack
+when the task is running on the event loop, or the chain of awaiting coroutines
+plus a ``(waiting)`` leaf when it is suspended on the database, the password
+pool or anything else. Samples are weighted by wall-clock time, so a profile
+shows where a request's latency went, middleware and dependency resolution
+(``get_current_user``) included.
+
+The most recent profiles are kept in a bounded buffer and exported as
+speedscope JSON or folded stacks for flame-graph tools.
+"""
+
+import asyncio
+import hmac
+import itertools
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+WAITING = ("(waiting)", "", 0)
+
+Frame = Tuple[str, str, int]
+
+
+def _frame_key(frame) -> Frame:
+    code = frame.f_code
+    return getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno
+
+
+class RequestProfile:
+    def __init__(self, profile_id: int, method: str, path: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.started_at = time.time()
+        self.duration = None
+        self.sample_count = 0
+        # stack (outermost frame first) -> seconds spent in it
+        self.stacks: Dict[Tuple[Frame, ...], float] = {}
+
+    def add(self, stack: Tuple[Frame, ...], seconds: float):
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + seconds
+        self.sample_count += 1
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "samples": self.sample_count,
+        }
+
+    def to_speedscope(self) -> dict:
+        frames: Dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, seconds in self.stacks.items():
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+            weights.append(seconds)
+        name = f"{self.method} {self.route or self.path} #{self.id}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "todo-app-api",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [
+                {"name": frame_name, "file": file, "line": line} if file else {"name": frame_name}
+                for frame_name, file, line in frames
+            ]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration or sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def to_collapsed(self) -> str:
+        """Folded stacks (``outer;inner microseconds``) for flamegraph.pl and similar"""
+        lines = []
+        for stack, seconds in sorted(self.stacks.items()):
+            names = ";".join(name if not file else f"{name} ({file}:{line})" for name, file, line in stack)
+            lines.append(f"{names} {max(1, round(seconds * 1_000_000))}")
+        return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    def __init__(self, interval: float, max_profiles: int):
+        self.interval = interval
+        self.profiles: "deque[RequestProfile]" = deque(maxlen=max_profiles)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        # task -> (profile, event loop thread id)
+        self.active: Dict[asyncio.Task, Tuple[RequestProfile, int]] = {}
+        self.sampler: Optional[threading.Thread] = None
+
+    def start(self, method: str, path: str) -> RequestProfile:
+        profile = RequestProfile(next(self.ids), method, path)
+        with self.lock:
+            self.active[asyncio.current_task()] = (profile, threading.get_ident())
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+                self.sampler.start()
+        return profile
+
+    def stop(self, profile: RequestProfile):
+        profile.duration = time.time() - profile.started_at
+        with self.lock:
+            self.active.pop(asyncio.current_task(), None)
+        self.profiles.append(profile)
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        return next((profile for profile in self.profiles if profile.id == profile_id), None)
+
+    def _sample(self):
+        last = time.perf_counter()
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.active:
+                    self.sampler = None
+                    return
+                active = list(self.active.items())
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            current_frames = sys._current_frames()
+            for task, (profile, thread_id) in active:
+                try:
+                    stack = self._task_stack(task, current_frames.get(thread_id))
+                except Exception:
+                    continue  # the task moved on while its stack was being read
+                if stack:
+                    profile.add(stack, elapsed)
+
+    @staticmethod
+    def _task_stack(task: asyncio.Task, thread_frame) -> Tuple[Frame, ...]:
+        coro_frame = getattr(task.get_coro(), "cr_frame", None)
+        if coro_frame is None:
+            return ()
+        # Running: the loop thread's stack, cut down to the task's own frames
+        frames: List = []
+        frame = thread_frame
+        while frame is not None:
+            frames.append(frame)
+            if frame is coro_frame:
+                return tuple(_frame_key(f) for f in reversed(frames))
+            frame = frame.f_back
+        # Suspended: follow the chain of awaits down to whatever it waits on
+        stack = []
+        awaitable = task.get_coro()
+        while awaitable is not None:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                break
+            stack.append(_frame_key(frame))
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+        return (*stack, WAITING)
+
+
+class ProfilingMiddleware:
+    """Profiles requests sent with ``X-Profile: <token>`` or sampled at ``sample_rate``.
+
+    Profiled responses carry an ``X-Profile-Id`` header naming the profile.
+    Paths under ``exclude_prefix`` (the profile endpoints themselves) are
+    never profiled.
+    """
+
+    def __init__(self, app, profiler: Profiler, token: Optional[str], sample_rate: float = 0.0,
+                 exclude_prefix: str = "/admin/"):
+        self.app = app
+        self.profiler = profiler
+        self.token = token.encode() if token else None
+        self.sample_rate = sample_rate
+        self.exclude_prefix = exclude_prefix
+
+    def _wanted(self, scope) -> bool:
+        if scope["path"].startswith(self.exclude_prefix):
+            return False
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == b"x-profile":
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.start(scope["method"], scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-id", str(profile.id).encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            profile.route = getattr(route, "path", None)
+            self.profiler.stop(profile)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Bulk provisioning of users and their todos.
+
+Streams users (username, email, password) and todos (username, title,
+description, completed, tags, created_at) from CSV or NDJSON files in batches,
+hashes each batch's passwords across a process pool while the previous batch
+is written, and writes every batch with one bulk insert (``create_users`` /
+``insert_todos``). Connects with the same configuration as the API.
+
+Rows are validated like ``POST /register`` and ``POST /todos/import`` do.
+Invalid rows, duplicate usernames/emails and todos of unknown users are
+skipped and reported; ``--conflicts`` writes the full list to a CSV file.
+
+Usage:
+    python provision.py --users users.csv
+    python provision.py --users users.ndjson --todos todos.ndjson --workers 8
+    python provision.py --todos todos.csv --conflicts conflicts.csv
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+import main
+from repository import DuplicateUserError
+
+PROGRESS_INTERVAL_SECONDS = 5
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    # Runs in the pool's worker processes
+    return [main.get_password_hash(password) for password in passwords]
+
+
+def read_rows(path: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Yield ``(line, row, error)`` for every record of a CSV or NDJSON file.
+
+    Empty CSV cells are left out of the row so optional fields take their
+    defaults.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as f:
+        if extension == ".csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, {key: value for key, value in row.items() if key and value != ""}, None
+        elif extension in (".ndjson", ".jsonl"):
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f"not JSON ({e})"
+                    continue
+                if isinstance(row, dict):
+                    yield line_number, row, None
+                else:
+                    yield line_number, None, "not a JSON object"
+        else:
+            raise SystemExit(f"❌ {path}: expected a .csv, .ndjson or .jsonl file")
+
+
+def validation_error(e: ValidationError) -> str:
+    error = e.errors()[0]
+    return f"{'.'.join(map(str, error['loc']))} {error['msg'].lower()}" if error["loc"] else error["msg"]
+
+
+def batches(rows: Iterator, size: int) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Report:
+    """Row counts, throughput and conflicts of one input file"""
+
+    def __init__(self, kind: str, conflicts_writer=None):
+        self.kind = kind
+        self.conflicts_writer = conflicts_writer
+        self.started = time.perf_counter()
+        self.last_progress = self.started
+        self.rows = 0
+        self.written = 0
+        self.conflicts: Dict[str, int] = {}
+        self.examples: List[str] = []
+
+    def conflict(self, line: int, reason: str, username: Optional[str] = None):
+        key = reason.split(":")[0]
+        self.conflicts[key] = self.conflicts.get(key, 0) + 1
+        if self.conflicts_writer is not None:
+            self.conflicts_writer.writerow([self.kind, line, username or "", reason])
+        elif len(self.examples) < 10:
+            self.examples.append(f"line {line}: {reason}" + (f" ({username})" if username else ""))
+
+    def progress(self):
+        now = time.perf_counter()
+        if now - self.last_progress >= PROGRESS_INTERVAL_SECONDS:
+            self.last_progress = now
+            print(f"   {self.kind}: {self.rows} rows, {self.rows / (now - self.started):.0f} rows/s")
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        skipped = ", ".join(f"{count} {reason}" for reason, count in sorted(self.conflicts.items()))
+        print(f"📦 {self.kind.capitalize()}: {self.rows} rows in {elapsed:.1f}s "
+              f"({self.rows / elapsed if elapsed else 0:.0f} rows/s), {self.written} written"
+              + (f", skipped {skipped}" if skipped else ""))
+        for example in self.examples:
+            print(f"   ⚠️  {example}")
+
+
+async def provision_users(path: str, args, pool: ProcessPoolExecutor, report: Report,
+                          user_ids: Optional[Dict[str, str]]):
+    loop = asyncio.get_running_loop()
+    repository = main.repository
+
+    async def hash_batch(users: List[Tuple[int, main.UserCreate]]) -> List[str]:
+        # Several chunks per worker keep the pool busy when hash times vary
+        passwords = [user.password for _, user in users]
+        chunk = max(1, -(-len(passwords) // (args.workers * 4)))
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(pool, hash_passwords, passwords[i:i + chunk])
+            for i in range(0, len(passwords), chunk)
+        ))
+        return [hashed for part in parts for hashed in part]
+
+    async def write_batch(users: List[Tuple[int, main.UserCreate]], hashing: asyncio.Task):
+        hashed_passwords = await hashing
+        now = datetime.now(timezone.utc)
+        user_docs = [
+            {"username": user.username, "email": user.email, "hashed_password": hashed, "created_at": now}
+            for (_, user), hashed in zip(users, hashed_passwords)
+        ]
+        for (line, user), result in zip(users, await repository.create_users(user_docs)):
+            if isinstance(result, DuplicateUserError):
+                report.conflict(line, f"duplicate {result.field}", user.username)
+            elif isinstance(result, Exception):
+                report.conflict(line, f"error: {result}", user.username)
+            else:
+                report.written += 1
+                if user_ids is not None:
+                    user_ids[user.username] = result["_id"]
+
+    pending = None
+    for rows in batches(read_rows(path), args.batch_size):
+        users = []
+        for line, row, error in rows:
+            report.rows += 1
+            if error is None:
+                try:
+                    users.append((line, main.UserCreate.model_validate(row)))
+                    continue
+                except ValidationError as e:
+                    error = validation_error(e)
+            report.conflict(line, f"invalid: {error}")
+        # The next batch hashes while the previous one is written
+        hashing = asyncio.create_task(hash_batch(users))
+        if pending is not None:
+            await write_batch(*pending)
+            report.progress()
+        pending = (users, hashing)
+    if pending is not None:
+        await write_batch(*pending)
+
+
+async def provision_todos(path: str, args, report: Report, user_ids: Dict[str, str]):
+    repository = main.repository
+
+    async def resolve(username: str) -> Optional[str]:
+        if username not in user_ids:
+            user = await repository.get_user_by_username(username)
+            user_ids[username] = user["_id"] if user else None
+        return user_ids[username]
+
+    for rows in batches(read_rows(path), args.batch_size):
+        todo_docs = []
+        for line, row, error in rows:
+            report.rows += 1
+            if error is None:
+                username = row.get("username")
+                if isinstance(row.get("tags"), str):
+                    row["tags"] = row["tags"].split(",")  # a CSV cell
+                try:
+                    todo = main.TodoImport.model_validate(row)
+                except ValidationError as e:
+                    error = validation_error(e)
+                else:
+                    user_id = await resolve(username) if isinstance(username, str) else None
+                    if user_id is None:
+                        report.conflict(line, "unknown user", username if isinstance(username, str) else None)
+                        continue
+                    created_at = main.as_utc(todo.created_at) or datetime.now(timezone.utc)
+                    todo_docs.append({
+                        "title": todo.title,
+                        "description": todo.description,
+                        "completed": todo.completed,
+                        "tags": todo.tags,
+                        "created_at": created_at,
+                        "user_id": user_id,
+                    })
+                    continue
+            report.conflict(line, f"invalid: {error}")
+        if todo_docs:
+            await repository.insert_todos(todo_docs)
+            report.written += len(todo_docs)
+            # Running servers key their ETags and cached pages on the version
+            for user_id in {doc["user_id"] for doc in todo_docs}:
+                await repository.bump_todos_version(user_id)
+        report.progress()
+
+
+async def provision(args, conflicts_writer):
+    await main.connect_database()
+    try:
+        print(f"🚚 Provisioning into {main.repository.name} "
+              f"({args.workers} hashing workers, batches of {args.batch_size})")
+        user_ids: Dict[str, str] = {}
+        if args.users:
+            report = Report("users", conflicts_writer)
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                await provision_users(args.users, args, pool, report, user_ids if args.todos else None)
+            report.summary()
+        if args.todos:
+            report = Report("todos", conflicts_writer)
+            await provision_todos(args.todos, args, report, user_ids)
+            report.summary()
+    finally:
+        await main.close_database()
+
+
+def main_provision():
+    parser = argparse.ArgumentParser(description="Bulk-load users and todos from CSV or NDJSON files")
+    parser.add_argument("--users", help="users file: username, email, password")
+    parser.add_argument("--todos", help="todos file: username, title, description, completed, tags, created_at")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per bulk insert")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="password hashing processes")
+    parser.add_argument("--conflicts", help="write every skipped row to this CSV file")
+    args = parser.parse_args()
+    if not args.users and not args.todos:
+        parser.error("give --users, --todos or both")
+
+    if args.conflicts:
+        with open(args.conflicts, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["file", "line", "username", "reason"])
+            asyncio.run(provision(args, writer))
+    else:
+        asyncio.run(provision(args, None))
+
+
+if __name__ == "__main__":
+    main_provision()
@@ -0,0 +1,1132 @@
+"""
+Data access for the Todo App API.
+
+``Repository`` is the interface the routes in ``main.py`` talk to. There is
+one implementation per storage backend:
+
+- ``MongoRepository`` (in ``mongo_repository``, imported only when MongoDB
+  is used) talks to Motor, so every call is a non-blocking round trip.
+- ``SQLiteRepository`` runs in WAL mode with a pool of reader threads (one
+  connection per thread) and a single writer thread, so reads never queue
+  behind each other and writes are serialized without a global lock.
+
+Users are returned as dicts with a string ``_id``; todos are returned in API
+shape (``id``, ``title``, ``description``, ``completed``, ``tags``,
+``created_at``, ``updated_at``, ``user_id``).
+
+``list_todos`` pushes its filters (completed, tags, created_at range) and sort
+order down to the database, each combination backed by a compound index:
+(user_id, completed, created_at/updated_at) for status views, a multikey
+(user_id, tags, created_at) index in MongoDB and a tag table with the same key,
+kept in sync by triggers, in SQLite.
+
+Each user row carries ``todos_total`` and ``todos_completed`` counters, updated
+by every todo write so ``get_todo_stats`` is a single-row read;
+``repair_todo_stats`` recomputes them from the todos.
+
+``updated_at`` is stamped here on every insert and update, and every delete
+leaves a tombstone (todo id, user id, ``deleted_at``), so ``list_changes`` can
+answer delta-sync queries from indexes.
+
+``archive_completed_todos`` moves completed todos that have not been touched
+for a while into a separate archive table/collection, so the active set (and
+its indexes) only holds todos in use. To the active list, delta sync and the
+counters an archived todo is gone (it leaves a tombstone); any write that
+addresses an archived todo by id moves it back first.
+
+Given a ``SlowQueryLog``, both backends time every statement or command and
+report the slow ones by shape, with the plan captured for each new shape.
+
+Full-text search over titles and descriptions uses a per-user compound text
+index in MongoDB and an FTS5 table kept in sync by triggers in SQLite.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from slow_queries import sql_shape
+
+TODO_FIELDS = ("title", "description", "completed", "tags", "created_at", "updated_at", "user_id")
+
+# Title matches rank above description matches
+SEARCH_TITLE_WEIGHT = 3
+
+# Schema, migrations and indexes are idempotent and applied on every startup.
+# Username/email uniqueness doubles as the duplicate check for registration.
+SQLITE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS users (
+        id TEXT PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        hashed_password TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        todos_version INTEGER NOT NULL DEFAULT 0,
+        todos_total INTEGER NOT NULL DEFAULT 0,
+        todos_completed INTEGER NOT NULL DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS todos (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT,
+        completed BOOLEAN DEFAULT FALSE,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        tags TEXT NOT NULL DEFAULT '[]',
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS todo_tombstones (
+        todo_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        deleted_at TEXT NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS todos_archive (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT,
+        completed BOOLEAN DEFAULT FALSE,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        archived_at TEXT NOT NULL,
+        tags TEXT NOT NULL DEFAULT '[]'
+    )''',
+]
+
+# Columns copied between todos and todos_archive
+SQLITE_TODO_COLUMNS = "id, title, description, completed, created_at, updated_at, user_id, tags"
+
+# Columns added after the first release; added to older databases on startup.
+# A column maps to one statement or a sequence of statements.
+SQLITE_MIGRATIONS = {
+    "users": {
+        "todos_version": "ALTER TABLE users ADD COLUMN todos_version INTEGER NOT NULL DEFAULT 0",
+        "todos_total": (
+            "ALTER TABLE users ADD COLUMN todos_total INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE users ADD COLUMN todos_completed INTEGER NOT NULL DEFAULT 0",
+            "UPDATE users SET todos_total = (SELECT COUNT(*) FROM todos WHERE user_id = users.id), "
+            "todos_completed = (SELECT COUNT(*) FROM todos WHERE user_id = users.id AND completed)",
+        ),
+    },
+    "todos": {
+        "updated_at": (
+            "ALTER TABLE todos ADD COLUMN updated_at TEXT",
+            "UPDATE todos SET updated_at = created_at",
+        ),
+        "tags": "ALTER TABLE todos ADD COLUMN tags TEXT NOT NULL DEFAULT '[]'",
+    },
+    "todos_archive": {
+        "tags": "ALTER TABLE todos_archive ADD COLUMN tags TEXT NOT NULL DEFAULT '[]'",
+    },
+}
+
+# Tags are stored as a JSON array, and indexed through a tag table per todo
+# table holding one (user_id, tag, created_at, updated_at, todo_id) row per
+# tag, keyed by created_at and indexed by updated_at, so a tag filter seeks
+# straight to its todos in either page order. Triggers keep the tag tables in
+# sync with every write, archive moves included; as every write stamps
+# updated_at, a todo update rewrites its tag rows. Applied after the
+# migrations that add the tags columns.
+SQLITE_TAG_TABLES = {"todos": "todo_tags", "todos_archive": "todo_archive_tags"}
+SQLITE_TAG_SCHEMA = [
+    statement
+    for table, tag_table in SQLITE_TAG_TABLES.items()
+    for statement in (
+        f'''CREATE TABLE IF NOT EXISTS {tag_table} (
+            user_id TEXT NOT NULL,
+            tag TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            todo_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, tag, created_at, todo_id)
+        ) WITHOUT ROWID''',
+        f'CREATE INDEX IF NOT EXISTS idx_{tag_table}_user_id_tag_updated_at '
+        f'ON {tag_table} (user_id, tag, updated_at, todo_id)',
+        f'''CREATE TRIGGER IF NOT EXISTS {tag_table}_insert AFTER INSERT ON {table} BEGIN
+            INSERT OR IGNORE INTO {tag_table} (user_id, tag, created_at, updated_at, todo_id)
+            SELECT new.user_id, value, new.created_at, new.updated_at, new.id FROM json_each(new.tags);
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {tag_table}_delete AFTER DELETE ON {table} BEGIN
+            DELETE FROM {tag_table} WHERE user_id = old.user_id AND tag IN (SELECT value FROM json_each(old.tags))
+                AND created_at = old.created_at AND todo_id = old.id;
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS {tag_table}_update AFTER UPDATE OF tags, updated_at ON {table} BEGIN
+            DELETE FROM {tag_table} WHERE user_id = old.user_id AND tag IN (SELECT value FROM json_each(old.tags))
+                AND created_at = old.created_at AND todo_id = old.id;
+            INSERT OR IGNORE INTO {tag_table} (user_id, tag, created_at, updated_at, todo_id)
+            SELECT new.user_id, value, new.created_at, new.updated_at, new.id FROM json_each(new.tags);
+        END''',
+    )
+]
+
+# Tag tables of releases before the updated_at column; dropped on startup and
+# refilled from their todo tables once SQLITE_TAG_SCHEMA has recreated them
+SQLITE_TAG_LEGACY = {
+    tag_table: (
+        f"DROP TRIGGER IF EXISTS {tag_table}_insert",
+        f"DROP TRIGGER IF EXISTS {tag_table}_delete",
+        f"DROP TRIGGER IF EXISTS {tag_table}_update",
+        f"DROP TABLE {tag_table}",
+    )
+    for tag_table in SQLITE_TAG_TABLES.values()
+}
+SQLITE_TAG_REFILL = {
+    tag_table: f'''INSERT OR IGNORE INTO {tag_table} (user_id, tag, created_at, updated_at, todo_id)
+        SELECT {table}.user_id, value, {table}.created_at, {table}.updated_at, {table}.id
+        FROM {table}, json_each({table}.tags)'''
+    for table, tag_table in SQLITE_TAG_TABLES.items()
+}
+
+# users.username and users.email are covered by the UNIQUE column constraints
+SQLITE_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_todos_user_id_created_at ON todos (user_id, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_todos_user_id_updated_at ON todos (user_id, updated_at, id)',
+    # GET /todos?completed= in either sort order
+    'CREATE INDEX IF NOT EXISTS idx_todos_user_id_completed_created_at ON todos (user_id, completed, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_todos_user_id_completed_updated_at ON todos (user_id, completed, updated_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_todo_tombstones_user_id_deleted_at '
+    'ON todo_tombstones (user_id, deleted_at, todo_id)',
+    'CREATE INDEX IF NOT EXISTS idx_todo_tombstones_deleted_at ON todo_tombstones (deleted_at)',
+    # Archiver candidates; partial, so writes to open todos never touch it
+    'CREATE INDEX IF NOT EXISTS idx_todos_completed_updated_at ON todos (updated_at) WHERE completed = 1',
+    'CREATE INDEX IF NOT EXISTS idx_todos_archive_user_id_created_at ON todos_archive (user_id, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS idx_todos_archive_user_id_updated_at ON todos_archive (user_id, updated_at, id)',
+]
+
+# External-content FTS5 index over todos, keyed by the todos rowid. The app
+# never VACUUMs (which may renumber rowids); after a manual VACUUM run
+# INSERT INTO todos_fts(todos_fts) VALUES ('rebuild').
+# The owner column holds the hex of user_id as a single token, so a search
+# intersects the user's posting list in the index instead of matching every
+# user's todos and filtering afterwards. Its content comes from a view.
+SQLITE_FTS_SCHEMA = [
+    '''CREATE VIEW IF NOT EXISTS todos_fts_content AS
+        SELECT rowid AS todo_rowid, title, description, hex(user_id) AS owner FROM todos''',
+    '''CREATE VIRTUAL TABLE todos_fts USING fts5(
+        title, description, owner,
+        content='todos_fts_content', content_rowid='todo_rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS todos_fts_insert AFTER INSERT ON todos BEGIN
+        INSERT INTO todos_fts (rowid, title, description, owner)
+        VALUES (new.rowid, new.title, new.description, hex(new.user_id));
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS todos_fts_delete AFTER DELETE ON todos BEGIN
+        INSERT INTO todos_fts (todos_fts, rowid, title, description, owner)
+        VALUES ('delete', old.rowid, old.title, old.description, hex(old.user_id));
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS todos_fts_update AFTER UPDATE OF title, description ON todos BEGIN
+        INSERT INTO todos_fts (todos_fts, rowid, title, description, owner)
+        VALUES ('delete', old.rowid, old.title, old.description, hex(old.user_id));
+        INSERT INTO todos_fts (rowid, title, description, owner)
+        VALUES (new.rowid, new.title, new.description, hex(new.user_id));
+    END''',
+    "INSERT INTO todos_fts (todos_fts) VALUES ('rebuild')",
+]
+
+# Index of releases before the owner column; dropped and rebuilt on startup
+SQLITE_FTS_LEGACY = [
+    "DROP TRIGGER IF EXISTS todos_fts_insert",
+    "DROP TRIGGER IF EXISTS todos_fts_delete",
+    "DROP TRIGGER IF EXISTS todos_fts_update",
+    "DROP TABLE todos_fts",
+]
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class DuplicateUserError(Exception):
+    """Raised by create_user when the username or email is already taken"""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field} already registered")
+        self.field = field
+
+
+class Repository:
+    """Storage interface used by the API routes"""
+
+    name = "unknown"
+
+    # Users
+    async def get_user_by_username(self, username: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def create_user(self, user_data: dict) -> dict:
+        raise NotImplementedError
+
+    async def create_users(self, users_data: List[dict]) -> list:
+        """Insert many users at once. Returns one entry per user: the created
+        user, or the ``DuplicateUserError`` its username or email ran into."""
+        results = []
+        for user_data in users_data:
+            try:
+                results.append(await self.create_user(user_data))
+            except DuplicateUserError as e:
+                results.append(e)
+        return results
+
+    async def check_user_exists(self, username: str = None, email: str = None) -> bool:
+        raise NotImplementedError
+
+    async def get_todos_version(self, user_id: str) -> int:
+        raise NotImplementedError
+
+    async def get_todos_versions(self, user_ids: List[str]) -> Dict[str, int]:
+        """Todo versions of several users in one read; unknown users are left out"""
+        raise NotImplementedError
+
+    async def bump_todos_version(self, user_id: str) -> int:
+        """Increment the user's todo version and return the new value"""
+        raise NotImplementedError
+
+    # Todos
+    def is_valid_todo_id(self, todo_id: str) -> bool:
+        raise NotImplementedError
+
+    async def insert_todo(self, todo_doc: dict) -> dict:
+        raise NotImplementedError
+
+    async def insert_todos(self, todo_docs: List[dict]) -> List[dict]:
+        raise NotImplementedError
+
+    async def list_todos(
+        self,
+        user_id: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None,
+        fields: Sequence[str] = TODO_FIELDS,
+        include_archived: bool = False,
+        sort: str = "created_at",
+        completed: Optional[bool] = None,
+        tags: Sequence[str] = (),
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> List[dict]:
+        """Todos ordered by (``sort``, id), starting after the ``after`` key.
+
+        ``sort`` is ``created_at`` or ``updated_at``, prefixed with ``-`` for
+        descending order, and ``after`` holds that field's value. Only todos
+        matching ``completed``, carrying every tag in ``tags`` and created
+        strictly between ``created_after`` and ``created_before`` are returned.
+
+        ``id``, ``created_at`` and the sort field are always included so
+        callers can build the next cursor; the other keys are limited to
+        ``fields``. With ``include_archived`` archived todos are merged in.
+        """
+        raise NotImplementedError
+
+    async def list_archived_todos(
+        self, user_id: str, limit: int, after: Optional[Tuple[datetime, str]] = None,
+    ) -> List[dict]:
+        """Archived todos (with ``archived_at``) ordered by (created_at, id)"""
+        raise NotImplementedError
+
+    async def iter_todos(
+        self, user_id: str, batch_size: int = 1000, include_archived: bool = False,
+    ) -> AsyncIterator[dict]:
+        """Yield every todo of a user in (created_at, id) order, archived ones
+        included if asked.
+
+        Only one batch is held in memory at a time. The default walks the
+        keyset pages of ``list_todos``; backends with server-side cursors
+        override it.
+        """
+        after = None
+        while True:
+            page = await self.list_todos(user_id, batch_size, after=after, include_archived=include_archived)
+            for todo in page:
+                yield todo
+            if len(page) < batch_size:
+                return
+            after = (page[-1]["created_at"], page[-1]["id"])
+
+    async def get_todo(self, user_id: str, todo_id: str) -> Optional[dict]:
+        """The todo, active or archived, or None"""
+        raise NotImplementedError
+
+    async def update_todo(self, user_id: str, todo_id: str, update_data: dict) -> Optional[dict]:
+        """Apply ``update_data`` (unarchiving the todo first if needed) and
+        return the updated todo, or None if not found"""
+        raise NotImplementedError
+
+    async def update_todos(
+        self, user_id: str, update_data: dict, ids: Optional[List[str]] = None,
+        completed: Optional[bool] = None,
+    ) -> Tuple[int, int, List[dict]]:
+        """Update todos selected by ``ids`` or by filter.
+
+        Returns ``(matched, modified, todos)`` where ``todos`` holds the updated
+        todos when selecting by ids and is empty otherwise.
+        """
+        raise NotImplementedError
+
+    async def delete_todo(self, user_id: str, todo_id: str) -> bool:
+        raise NotImplementedError
+
+    async def delete_todos(
+        self, user_id: str, ids: Optional[List[str]] = None, completed: Optional[bool] = None,
+    ) -> Tuple[int, List[str]]:
+        """Delete todos selected by ``ids`` or by filter.
+
+        Returns ``(deleted, deleted_ids)``. A tombstone is recorded for every
+        deleted todo.
+        """
+        raise NotImplementedError
+
+    async def apply_todo_writes(self, writes: List[tuple]) -> list:
+        """Apply a group of single-todo writes together.
+
+        Each write is ``("insert", todo_doc)``, ``("update", user_id, todo_id,
+        update_data)`` or ``("delete", user_id, todo_id)``. Returns one entry per
+        write: what ``insert_todo``/``update_todo``/``delete_todo`` would have
+        returned, or the exception that write raised. Backends override this to
+        commit the group in as few round trips as they can.
+        """
+        methods = {"insert": self.insert_todo, "update": self.update_todo, "delete": self.delete_todo}
+        results = []
+        for kind, *args in writes:
+            try:
+                results.append(await methods[kind](*args))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def archive_completed_todos(self, before: datetime, batch_size: int) -> Dict[str, List[str]]:
+        """Move up to ``batch_size`` completed todos last updated before
+        ``before`` into the archive. Returns the archived ids by user id."""
+        raise NotImplementedError
+
+    async def get_todo_stats(self, user_id: str) -> dict:
+        """``{"total": ..., "completed": ...}`` of active todos, from the user's counters"""
+        raise NotImplementedError
+
+    async def repair_todo_stats(self, user_ids: Optional[List[str]] = None) -> int:
+        """Recompute the counters of ``user_ids`` (default: every user) from
+        their todos. Returns how many users' counters were wrong."""
+        raise NotImplementedError
+
+    async def list_changes(
+        self, user_id: str, limit: int, after: Optional[Tuple[datetime, str]] = None,
+    ) -> List[dict]:
+        """Todos written and todos deleted after the ``after`` key.
+
+        Changed todos (keyed by ``updated_at``) and tombstones (``id`` and
+        ``deleted_at``) are merged in (timestamp, id) order and cut to ``limit``.
+        """
+        raise NotImplementedError
+
+    async def prune_tombstones(self, before: datetime) -> int:
+        """Drop tombstones older than ``before``; returns how many were removed"""
+        raise NotImplementedError
+
+    async def search_todos(
+        self, user_id: str, words: List[str], prefix: Optional[str], limit: int, offset: int = 0,
+    ) -> List[dict]:
+        """Todos whose title or description contains every word in ``words``
+        and a word starting with ``prefix``, best match first.
+
+        Each todo carries a ``score`` (higher is better; 0 when the backend
+        cannot rank the query).
+        """
+        raise NotImplementedError
+
+    # Maintenance
+    async def ensure_indexes(self):
+        raise NotImplementedError
+
+    async def warm_up(self, connections: int):
+        """Open up to ``connections`` database connections ahead of the first request"""
+
+    async def close(self):
+        """Release connections and worker threads"""
+
+    async def health(self) -> dict:
+        raise NotImplementedError
+
+
+def change_key(entry: dict) -> Tuple[datetime, str]:
+    """Sort key of a ``list_changes`` entry"""
+    return entry.get("updated_at") or entry["deleted_at"], entry["id"]
+
+
+def merge_changes(todos: List[dict], tombstones: List[dict], limit: int) -> List[dict]:
+    return sorted(todos + tombstones, key=change_key)[:limit]
+
+
+class _TimedConnection(sqlite3.Connection):
+    """Connection that reports statements slower than the slow-query threshold.
+
+    ``execute`` runs the statement up to its first row, which covers writes,
+    sorts and aggregates completely and scans up to their first match; rows
+    fetched afterwards are not timed.
+    """
+
+    slow_query_log = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        duration = time.perf_counter() - start
+        if duration >= self.slow_query_log.threshold:
+            self._slow(sql, parameters, duration)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        duration = time.perf_counter() - start
+        if duration >= self.slow_query_log.threshold:
+            self._slow(sql, seq_of_parameters[0] if seq_of_parameters else (), duration)
+        return cursor
+
+    def _slow(self, sql, parameters, duration):
+        shape = sql_shape(sql)
+        if not self.slow_query_log.record("sqlite", shape, shape, duration):
+            return
+        if not shape.upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            return  # schema changes and pragmas have no query plan
+        try:
+            plan = [row[3] for row in super().execute(f"EXPLAIN QUERY PLAN {sql}", parameters)]
+        except sqlite3.Error as e:
+            plan, summary = None, f"explain failed: {e}"
+        else:
+            summary = "; ".join(plan) or None
+        self.slow_query_log.set_plan("sqlite", shape, plan, summary)
+
+
+class SQLiteRepository(Repository):
+    name = "sqlite"
+
+    def __init__(self, path: str, reader_threads: int = 4, slow_query_log=None):
+        self.path = path
+        self.reader_threads = reader_threads
+        self.slow_query_log = slow_query_log
+        self._local = threading.local()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self.readers = ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix="sqlite-reader")
+        self.fts = self.writer.submit(self._run_write, self._init_schema).result()
+
+    # Connection handling
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 keeps a per-connection cache of prepared statements keyed by
+        # SQL text, so every query below is a constant string with ? parameters.
+        if self.slow_query_log is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, cached_statements=256)
+        else:
+            conn = sqlite3.connect(self.path, timeout=5.0, cached_statements=256, factory=_TimedConnection)
+            conn.slow_query_log = self.slow_query_log
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _run_read(self, fn, *args):
+        return fn(self._connection(), *args)
+
+    def _run_write(self, fn, *args):
+        conn = self._connection()
+        with conn:  # commits on success, rolls back on error
+            return fn(conn, *args)
+
+    async def _read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.readers, partial(self._run_read, fn, *args))
+
+    async def _write(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.writer, partial(self._run_write, fn, *args))
+
+    @staticmethod
+    def _init_schema(conn):
+        # Take the write lock up front so workers starting together migrate once
+        conn.execute('BEGIN IMMEDIATE')
+        for statement in SQLITE_SCHEMA:
+            conn.execute(statement)
+        for table, columns in SQLITE_MIGRATIONS.items():
+            existing = {row["name"] for row in conn.execute(f'PRAGMA table_info({table})')}
+            for column, statements in columns.items():
+                if column not in existing:
+                    for statement in [statements] if isinstance(statements, str) else statements:
+                        conn.execute(statement)
+        legacy = []
+        for tag_table in SQLITE_TAG_TABLES.values():
+            columns = {row["name"] for row in conn.execute(f'PRAGMA table_info({tag_table})')}
+            if columns and "updated_at" not in columns:
+                legacy.append(tag_table)
+        for tag_table in legacy:
+            for statement in SQLITE_TAG_LEGACY[tag_table]:
+                conn.execute(statement)
+        for statement in SQLITE_TAG_SCHEMA:
+            conn.execute(statement)
+        for tag_table in legacy:
+            conn.execute(SQLITE_TAG_REFILL[tag_table])
+        for statement in SQLITE_INDEXES:
+            conn.execute(statement)
+        return SQLiteRepository._init_fts(conn)
+
+    @staticmethod
+    def _init_fts(conn) -> bool:
+        """Create (and on first run, populate) the FTS5 index; False if FTS5 is unavailable"""
+        existing = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'todos_fts'").fetchone()
+        if existing and "owner" in existing["sql"]:
+            return True
+        try:
+            if existing:
+                for statement in SQLITE_FTS_LEGACY:
+                    conn.execute(statement)
+            for statement in SQLITE_FTS_SCHEMA:
+                conn.execute(statement)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️  SQLite FTS5 unavailable, search will scan todos: {str(e)}")
+            return False
+        return True
+
+    # Row conversion
+    @staticmethod
+    def _format_timestamp(value: datetime) -> str:
+        # Fixed-width ISO timestamps sort correctly as text
+        return value.isoformat(timespec="microseconds")
+
+    @staticmethod
+    def _todo_from_row(row: sqlite3.Row) -> dict:
+        todo = dict(row)
+        if "completed" in todo:
+            todo["completed"] = bool(todo["completed"])
+        if "tags" in todo:
+            todo["tags"] = json.loads(todo["tags"])
+        for field in ("created_at", "updated_at", "deleted_at", "archived_at"):
+            if todo.get(field) is not None:
+                todo[field] = datetime.fromisoformat(todo[field])
+        return todo
+
+    @staticmethod
+    def _selection_clause(user_id: str, ids: Optional[List[str]], completed: Optional[bool]):
+        clause, params = 'user_id = ?', [user_id]
+        if ids is not None:
+            clause += f' AND id IN ({",".join("?" * len(ids))})'
+            params.extend(ids)
+        elif completed is not None:
+            clause += ' AND completed = ?'
+            params.append(completed)
+        return clause, params
+
+    # Users
+    async def get_user_by_username(self, username: str) -> Optional[dict]:
+        def query(conn):
+            row = conn.execute(
+                'SELECT id, username, email, hashed_password, created_at FROM users WHERE username = ?',
+                (username,),
+            ).fetchone()
+            if row is None:
+                return None
+            user = dict(row)
+            user["_id"] = user.pop("id")
+            return user
+        return await self._read(query)
+
+    @staticmethod
+    def _insert_user(conn, user_data: dict):
+        user_id = str(uuid.uuid4())
+        try:
+            conn.execute(
+                'INSERT INTO users (id, username, email, hashed_password, created_at) VALUES (?, ?, ?, ?, ?)',
+                (user_id, user_data["username"], user_data["email"], user_data["hashed_password"],
+                 user_data["created_at"].isoformat()),
+            )
+        except sqlite3.IntegrityError as e:
+            # e.g. "UNIQUE constraint failed: users.email"
+            raise DuplicateUserError("email" if "users.email" in str(e) else "username")
+        user_data["_id"] = user_id
+        return user_data
+
+    async def create_user(self, user_data: dict) -> dict:
+        return await self._write(self._insert_user, user_data)
+
+    async def create_users(self, users_data: List[dict]) -> list:
+        def insert(conn):
+            # One transaction; a rejected row only undoes its own statement
+            results = []
+            for user_data in users_data:
+                try:
+                    results.append(self._insert_user(conn, user_data))
+                except DuplicateUserError as e:
+                    results.append(e)
+            return results
+        return await self._write(insert)
+
+    async def check_user_exists(self, username: str = None, email: str = None) -> bool:
+        def query(conn):
+            if username and conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone():
+                return True
+            if email and conn.execute('SELECT 1 FROM users WHERE email = ?', (email,)).fetchone():
+                return True
+            return False
+        return await self._read(query)
+
+    async def get_todos_version(self, user_id: str) -> int:
+        def query(conn):
+            row = conn.execute('SELECT todos_version FROM users WHERE id = ?', (user_id,)).fetchone()
+            return row[0] if row else 0
+        return await self._read(query)
+
+    async def get_todos_versions(self, user_ids):
+        placeholders = ",".join("?" * len(user_ids))
+
+        def query(conn):
+            rows = conn.execute(f'SELECT id, todos_version FROM users WHERE id IN ({placeholders})', user_ids)
+            return {row["id"]: row["todos_version"] for row in rows}
+        return await self._read(query)
+
+    async def bump_todos_version(self, user_id: str) -> int:
+        def update(conn):
+            conn.execute('UPDATE users SET todos_version = todos_version + 1 WHERE id = ?', (user_id,))
+            row = conn.execute('SELECT todos_version FROM users WHERE id = ?', (user_id,)).fetchone()
+            return row[0] if row else 0
+        return await self._write(update)
+
+    # Todos
+    def is_valid_todo_id(self, todo_id: str) -> bool:
+        try:
+            uuid.UUID(todo_id)
+        except (ValueError, TypeError, AttributeError):
+            return False
+        return True
+
+    def _todo_row(self, todo_doc: dict) -> tuple:
+        todo_doc["id"] = str(uuid.uuid4())
+        return (
+            todo_doc["id"], todo_doc["title"], todo_doc["description"], todo_doc["completed"],
+            self._format_timestamp(todo_doc["created_at"]), todo_doc["user_id"],
+            json.dumps(todo_doc.setdefault("tags", [])),
+        )
+
+    def _update_values(self, update_data: dict) -> tuple:
+        return tuple(
+            self._format_timestamp(v) if isinstance(v, datetime) else json.dumps(v) if isinstance(v, list) else v
+            for v in update_data.values()
+        )
+
+    async def insert_todo(self, todo_doc: dict) -> dict:
+        return (await self.insert_todos([todo_doc]))[0]
+
+    async def insert_todos(self, todo_docs: List[dict]) -> List[dict]:
+        rows = [self._todo_row(doc) for doc in todo_docs]
+        await self._write(self._insert_rows, rows, todo_docs)
+        return todo_docs
+
+    def _insert_rows(self, conn, rows: List[tuple], todo_docs: List[dict]):
+        # Stamped on the writer thread, so within one process updated_at order
+        # matches commit order; /todos/changes covers other workers' writes
+        now = utcnow()
+        conn.executemany(
+            'INSERT INTO todos (id, title, description, completed, created_at, user_id, tags, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(*row, self._format_timestamp(now)) for row in rows],
+        )
+        for doc in todo_docs:
+            doc["updated_at"] = now
+        counts = {}
+        for row in rows:
+            total, completed = counts.get(row[5], (0, 0))
+            counts[row[5]] = (total + 1, completed + bool(row[3]))
+        for user_id, (total, completed) in counts.items():
+            self._adjust_stats(conn, user_id, total, completed)
+
+    @staticmethod
+    def _adjust_stats(conn, user_id: str, total: int, completed: int):
+        # Runs in the same transaction as the todo write it accounts for
+        if total or completed:
+            conn.execute(
+                'UPDATE users SET todos_total = todos_total + ?, todos_completed = todos_completed + ? WHERE id = ?',
+                (total, completed, user_id),
+            )
+
+    def _page_query(
+        self, table: str, columns: Optional[Sequence[str]], user_id: str, limit: int, after,
+        sort: str = "created_at", completed: Optional[bool] = None, tags: Sequence[str] = (),
+        created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+    ) -> Tuple[str, list]:
+        """SQL of a ``list_todos`` page; shared with index_report"""
+        key = sort.lstrip("-")
+        direction, beyond = ("DESC", "<") if sort.startswith("-") else ("ASC", ">")
+        selected = f'{table}.*' if columns is None else ", ".join(f'{table}.{column}' for column in columns)
+        if tags:
+            # Driven by the first tag's (user_id, tag, <key>, todo_id) entries,
+            # in page order; further tags are primary key lookups
+            tag_table = SQLITE_TAG_TABLES[table]
+            source = f'{tag_table} AS tagged JOIN {table} ON {table}.id = tagged.todo_id'
+            conditions, params = ['tagged.user_id = ? AND tagged.tag = ?'], [user_id, tags[0]]
+            for tag in tags[1:]:
+                conditions.append(
+                    f'EXISTS (SELECT 1 FROM {tag_table} AS other WHERE other.user_id = ? AND other.tag = ? '
+                    f'AND other.created_at = {table}.created_at AND other.todo_id = {table}.id)'
+                )
+                params.extend([user_id, tag])
+            created_column = 'tagged.created_at'
+            order = (f'tagged.{key}', 'tagged.todo_id')
+        else:
+            # (user_id, completed, <key>, id) with a status filter, else (user_id, <key>, id)
+            source = table
+            conditions, params = [f'{table}.user_id = ?'], [user_id]
+            created_column = f'{table}.created_at'
+            order = (f'{table}.{key}', f'{table}.id')
+        if completed is not None:
+            conditions.append(f'{table}.completed = ?')
+            params.append(completed)
+        if created_after is not None:
+            conditions.append(f'{created_column} > ?')
+            params.append(self._format_timestamp(created_after))
+        if created_before is not None:
+            conditions.append(f'{created_column} < ?')
+            params.append(self._format_timestamp(created_before))
+        if after is not None:
+            conditions.append(f'({order[0]}, {order[1]}) {beyond} (?, ?)')
+            params.extend([self._format_timestamp(after[0]), after[1]])
+        sql = (f'SELECT {selected} FROM {source} WHERE {" AND ".join(conditions)} '
+               f'ORDER BY {order[0]} {direction}, {order[1]} {direction} LIMIT ?')
+        params.append(limit)
+        return sql, params
+
+    async def list_todos(self, user_id, limit, after=None, fields=TODO_FIELDS, include_archived=False,
+                         sort="created_at", **filters):
+        # fields are validated against TODO_FIELDS and sort by the caller
+        columns = tuple(dict.fromkeys(("id", "created_at", sort.lstrip("-"), *fields)))
+        sql, params = self._page_query('todos', columns, user_id, limit, after, sort, **filters)
+        # Archived todos are all completed
+        if include_archived and filters.get("completed") is not False:
+            # Each side is read from its own indexes
+            archived_sql, archived_params = self._page_query(
+                'todos_archive', columns, user_id, limit, after, sort, **filters,
+            )
+            direction = "DESC" if sort.startswith("-") else "ASC"
+            sql = (f'SELECT * FROM ({sql}) UNION ALL SELECT * FROM ({archived_sql}) '
+                   f'ORDER BY {sort.lstrip("-")} {direction}, id {direction} LIMIT ?')
+            params = [*params, *archived_params, limit]
+
+        def query(conn):
+            return [self._todo_from_row(row) for row in conn.execute(sql, params)]
+        return await self._read(query)
+
+    async def list_archived_todos(self, user_id, limit, after=None):
+        sql, params = self._page_query('todos_archive', None, user_id, limit, after)
+
+        def query(conn):
+            return [self._todo_from_row(row) for row in conn.execute(sql, params)]
+        return await self._read(query)
+
+    async def get_todo(self, user_id: str, todo_id: str) -> Optional[dict]:
+        def query(conn):
+            row = conn.execute('SELECT * FROM todos WHERE id = ? AND user_id = ?', (todo_id, user_id)).fetchone()
+            if row is None:
+                row = conn.execute(
+                    'SELECT * FROM todos_archive WHERE id = ? AND user_id = ?', (todo_id, user_id),
+                ).fetchone()
+            return self._todo_from_row(row) if row else None
+        return await self._read(query)
+
+    async def update_todo(self, user_id: str, todo_id: str, update_data: dict) -> Optional[dict]:
+        return await self._write(self._update_todo, user_id, todo_id, update_data)
+
+    def _update_todo(self, conn, user_id: str, todo_id: str, update_data: dict) -> Optional[dict]:
+        # update_data keys come from the TodoUpdate model, never from raw input
+        before = conn.execute('SELECT completed FROM todos WHERE id = ? AND user_id = ?', (todo_id, user_id)).fetchone()
+        if before is None:
+            if not self._unarchive(conn, user_id, [todo_id]):
+                return None
+            before = conn.execute('SELECT completed FROM todos WHERE id = ?', (todo_id,)).fetchone()
+        assignments = ", ".join(f"{field} = ?" for field in (*update_data, "updated_at"))
+        conn.execute(
+            f'UPDATE todos SET {assignments} WHERE id = ?',
+            (*self._update_values(update_data), self._format_timestamp(utcnow()), todo_id),
+        )
+        if "completed" in update_data and bool(update_data["completed"]) != bool(before["completed"]):
+            self._adjust_stats(conn, user_id, 0, 1 if update_data["completed"] else -1)
+        row = conn.execute('SELECT * FROM todos WHERE id = ?', (todo_id,)).fetchone()
+        return self._todo_from_row(row)
+
+    async def update_todos(self, user_id, update_data, ids=None, completed=None):
+        assignments = ", ".join(f"{field} = ?" for field in (*update_data, "updated_at"))
+        values = self._update_values(update_data)
+        clause, params = self._selection_clause(user_id, ids, completed)
+
+        def update(conn):
+            restored = self._unarchive(conn, user_id, ids) if ids is not None else []
+            matched = None
+            flipped = 0
+            where, where_params = clause, params
+            if "completed" in update_data:
+                matched, flipped = conn.execute(
+                    f'SELECT COUNT(*), COALESCE(SUM(completed != ?), 0) FROM todos WHERE {clause}',
+                    (update_data["completed"], *params),
+                ).fetchone()
+                if len(update_data) == 1:
+                    # Todos already in that state have nothing to change and
+                    # keep their updated_at, unless they just left the archive
+                    placeholders = ",".join("?" * len(restored))
+                    where = f'{clause} AND (completed != ? OR id IN ({placeholders}))'
+                    where_params = (*params, update_data["completed"], *restored)
+            cursor = conn.execute(
+                f'UPDATE todos SET {assignments} WHERE {where}',
+                (*values, self._format_timestamp(utcnow()), *where_params),
+            )
+            self._adjust_stats(conn, user_id, 0, flipped if update_data.get("completed") else -flipped)
+            todos = []
+            if ids is not None:
+                todos = [self._todo_from_row(row) for row in conn.execute(f'SELECT * FROM todos WHERE {clause}', params)]
+            return cursor.rowcount if matched is None else matched, cursor.rowcount, todos
+        return await self._write(update)
+
+    def _add_tombstones(self, conn, user_id: str, todo_ids: List[str]):
+        deleted_at = self._format_timestamp(utcnow())
+        conn.executemany(
+            'INSERT OR REPLACE INTO todo_tombstones (todo_id, user_id, deleted_at) VALUES (?, ?, ?)',
+            [(todo_id, user_id, deleted_at) for todo_id in todo_ids],
+        )
+
+    async def delete_todo(self, user_id: str, todo_id: str) -> bool:
+        return await self._write(self._delete_todo, user_id, todo_id)
+
+    def _delete_todo(self, conn, user_id: str, todo_id: str) -> bool:
+        row = conn.execute('SELECT completed FROM todos WHERE id = ? AND user_id = ?', (todo_id, user_id)).fetchone()
+        if row is None:
+            if not self._unarchive(conn, user_id, [todo_id]):
+                return False
+            row = conn.execute('SELECT completed FROM todos WHERE id = ?', (todo_id,)).fetchone()
+        conn.execute('DELETE FROM todos WHERE id = ?', (todo_id,))
+        self._add_tombstones(conn, user_id, [todo_id])
+        self._adjust_stats(conn, user_id, -1, -bool(row["completed"]))
+        return True
+
+    async def delete_todos(self, user_id, ids=None, completed=None):
+        clause, params = self._selection_clause(user_id, ids, completed)
+
+        def delete(conn):
+            if ids is not None:
+                self._unarchive(conn, user_id, ids)
+            rows = conn.execute(f'SELECT id, completed FROM todos WHERE {clause}', params).fetchall()
+            deleted_ids = [row["id"] for row in rows]
+            cursor = conn.execute(f'DELETE FROM todos WHERE {clause}', params)
+            self._add_tombstones(conn, user_id, deleted_ids)
+            self._adjust_stats(conn, user_id, -len(rows), -sum(bool(row["completed"]) for row in rows))
+            return cursor.rowcount, deleted_ids
+        return await self._write(delete)
+
+    async def apply_todo_writes(self, writes: List[tuple]) -> list:
+        # Insert ids are assigned up front, off the writer thread
+        prepared = [
+            (kind, self._todo_row(args[0]), args[0]) if kind == "insert" else (kind, *args)
+            for kind, *args in writes
+        ]
+
+        def apply(conn):
+            # One transaction (one commit) for the whole group; a savepoint per
+            # write keeps a failing write from undoing the others
+            conn.execute('BEGIN IMMEDIATE')
+            results = []
+            for kind, *args in prepared:
+                conn.execute('SAVEPOINT todo_write')
+                try:
+                    if kind == "insert":
+                        self._insert_rows(conn, [args[0]], [args[1]])
+                        results.append(args[1])
+                    elif kind == "update":
+                        results.append(self._update_todo(conn, *args))
+                    else:
+                        results.append(self._delete_todo(conn, *args))
+                    conn.execute('RELEASE todo_write')
+                except sqlite3.Error as e:
+                    conn.execute('ROLLBACK TO todo_write')
+                    conn.execute('RELEASE todo_write')
+                    results.append(e)
+            return results
+        return await self._write(apply)
+
+    def _unarchive(self, conn, user_id: str, todo_ids: List[str]) -> List[str]:
+        """Move archived todos back ahead of a write that addresses them.
+
+        They are stamped as changed, so delta sync brings back what it saw as
+        deleted. Returns the ids that were moved.
+        """
+        placeholders = ",".join("?" * len(todo_ids))
+        rows = conn.execute(
+            f'SELECT id, completed FROM todos_archive WHERE user_id = ? AND id IN ({placeholders})',
+            (user_id, *todo_ids),
+        ).fetchall()
+        if not rows:
+            return []
+        moved = [row["id"] for row in rows]
+        placeholders = ",".join("?" * len(moved))
+        conn.execute(
+            f'INSERT INTO todos ({SQLITE_TODO_COLUMNS}) '
+            f'SELECT {SQLITE_TODO_COLUMNS} FROM todos_archive WHERE id IN ({placeholders})',
+            moved,
+        )
+        conn.execute(
+            f'UPDATE todos SET updated_at = ? WHERE id IN ({placeholders})',
+            (self._format_timestamp(utcnow()), *moved),
+        )
+        conn.execute(f'DELETE FROM todos_archive WHERE id IN ({placeholders})', moved)
+        conn.execute(f'DELETE FROM todo_tombstones WHERE todo_id IN ({placeholders})', moved)
+        self._adjust_stats(conn, user_id, len(rows), sum(bool(row["completed"]) for row in rows))
+        return moved
+
+    async def archive_completed_todos(self, before, batch_size):
+        def archive(conn):
+            rows = conn.execute(
+                'SELECT id, user_id FROM todos WHERE completed = 1 AND updated_at < ? ORDER BY updated_at LIMIT ?',
+                (self._format_timestamp(before), batch_size),
+            ).fetchall()
+            if not rows:
+                return {}
+            ids = [row["id"] for row in rows]
+            placeholders = ",".join("?" * len(ids))
+            conn.execute(
+                f'INSERT OR REPLACE INTO todos_archive ({SQLITE_TODO_COLUMNS}, archived_at) '
+                f'SELECT {SQLITE_TODO_COLUMNS}, ? FROM todos WHERE id IN ({placeholders})',
+                (self._format_timestamp(utcnow()), *ids),
+            )
+            conn.execute(f'DELETE FROM todos WHERE id IN ({placeholders})', ids)
+            archived = {}
+            for row in rows:
+                archived.setdefault(row["user_id"], []).append(row["id"])
+            for user_id, todo_ids in archived.items():
+                self._add_tombstones(conn, user_id, todo_ids)
+                self._adjust_stats(conn, user_id, -len(todo_ids), -len(todo_ids))
+            return archived
+        return await self._write(archive)
+
+    async def get_todo_stats(self, user_id: str) -> dict:
+        def query(conn):
+            row = conn.execute('SELECT todos_total, todos_completed FROM users WHERE id = ?', (user_id,)).fetchone()
+            return {"total": row[0], "completed": row[1]} if row else {"total": 0, "completed": 0}
+        return await self._read(query)
+
+    async def repair_todo_stats(self, user_ids=None) -> int:
+        # Correlated counts use the (user_id, ...) todo indexes, one user at a time
+        total = '(SELECT COUNT(*) FROM todos WHERE todos.user_id = users.id)'
+        completed = '(SELECT COUNT(*) FROM todos WHERE todos.user_id = users.id AND completed)'
+        sql = (
+            f'UPDATE users SET todos_total = {total}, todos_completed = {completed} '
+            f'WHERE (todos_total != {total} OR todos_completed != {completed})'
+        )
+        params = []
+        if user_ids is not None:
+            sql += f' AND id IN ({", ".join("?" * len(user_ids))})'
+            params = list(user_ids)
+
+        def repair(conn):
+            return conn.execute(sql, params).rowcount
+        return await self._write(repair)
+
+    def _changes_queries(self, user_id: str, limit: int, after) -> Tuple[str, str, list]:
+        """SQL of the changed todos and of the tombstones after a sync key, sharing one parameter list"""
+        todo_sql = 'SELECT * FROM todos WHERE user_id = ?'
+        tombstone_sql = 'SELECT todo_id AS id, deleted_at FROM todo_tombstones WHERE user_id = ?'
+        params = [user_id]
+        if after is not None:
+            todo_sql += ' AND (updated_at, id) > (?, ?)'
+            tombstone_sql += ' AND (deleted_at, todo_id) > (?, ?)'
+            params.extend([self._format_timestamp(after[0]), after[1]])
+        todo_sql += ' ORDER BY updated_at, id LIMIT ?'
+        tombstone_sql += ' ORDER BY deleted_at, todo_id LIMIT ?'
+        params.append(limit)
+        return todo_sql, tombstone_sql, params
+
+    async def list_changes(self, user_id, limit, after=None):
+        todo_sql, tombstone_sql, params = self._changes_queries(user_id, limit, after)
+
+        def query(conn):
+            todos = [self._todo_from_row(row) for row in conn.execute(todo_sql, params)]
+            tombstones = [self._todo_from_row(row) for row in conn.execute(tombstone_sql, params)]
+            return merge_changes(todos, tombstones, limit)
+        return await self._read(query)
+
+    def _search_query(self, user_id, words, prefix, limit, offset=0) -> Tuple[str, list]:
+        """FTS5 query of ``search_todos``; shared with index_report"""
+        # Every term is quoted, so user input is never parsed as FTS5 syntax;
+        # terms only match title and description, the owner token picks the user
+        terms = " ".join([*(f'"{word}"' for word in words), *([f'"{prefix}"*'] if prefix else [])])
+        match = f'owner : "{user_id.encode().hex()}" AND {{title description}} : ({terms})'
+        rank = f'bm25(todos_fts, {SEARCH_TITLE_WEIGHT}.0, 1.0, 0.0)'
+        sql = (
+            f'SELECT todos.*, -{rank} AS score FROM todos_fts JOIN todos ON todos.rowid = todos_fts.rowid '
+            f'WHERE todos_fts MATCH ? AND todos.user_id = ? ORDER BY {rank}, todos.id LIMIT ? OFFSET ?'
+        )
+        return sql, [match, user_id, limit, offset]
+
+    async def search_todos(self, user_id, words, prefix, limit, offset=0):
+        if not self.fts:
+            return await self._scan_todos(user_id, words, prefix, limit, offset)
+        sql, params = self._search_query(user_id, words, prefix, limit, offset)
+
+        def query(conn):
+            return [self._todo_from_row(row) for row in conn.execute(sql, params)]
+        return await self._read(query)
+
+    async def _scan_todos(self, user_id, words, prefix, limit, offset):
+        conditions, params = [], [user_id]
+        for term in [*words, *([prefix] if prefix else [])]:
+            conditions.append("(title LIKE ? OR description LIKE ?)")
+            params.extend([f"%{term}%"] * 2)
+        sql = (
+            f'SELECT *, 0.0 AS score FROM todos WHERE user_id = ? AND {" AND ".join(conditions) or "1"} '
+            f'ORDER BY created_at, id LIMIT ? OFFSET ?'
+        )
+
+        def query(conn):
+            return [self._todo_from_row(row) for row in conn.execute(sql, (*params, limit, offset))]
+        return await self._read(query)
+
+    async def prune_tombstones(self, before: datetime) -> int:
+        def delete(conn):
+            return conn.execute(
+                'DELETE FROM todo_tombstones WHERE deleted_at < ?', (self._format_timestamp(before),)
+            ).rowcount
+        return await self._write(delete)
+
+    # Maintenance
+    async def ensure_indexes(self):
+        await self._write(lambda conn: [conn.execute(statement) for statement in SQLITE_INDEXES])
+
+    async def warm_up(self, connections: int):
+        # Park one task on each reader thread at once, so every thread (not just
+        # the first idle one) opens its connection
+        threads = min(connections, self.reader_threads)
+        if threads <= 0:
+            return
+        barrier = threading.Barrier(threads)
+
+        def open_connection(conn):
+            conn.execute('SELECT 1').fetchone()
+            try:
+                barrier.wait(timeout=5)
+            except threading.BrokenBarrierError:
+                pass
+        await asyncio.gather(*(self._read(open_connection) for _ in range(threads)))
+
+    async def close(self):
+        self.readers.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+
+    async def health(self) -> dict:
+        user_count = await self._read(lambda conn: conn.execute('SELECT COUNT(*) FROM users').fetchone()[0])
+        return {"user_count": user_count}
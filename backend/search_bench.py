@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark todo search on large per-user lists.
+
+Seeds one user with N todos (plus other users' todos, spread over many users
+like a real deployment, which every query must skip) straight through the
+repository, then compares the indexed search
+(``search_todos``: FTS5 on SQLite, the text index on MongoDB) with what
+clients had to do before: fetch every todo and filter them locally.
+
+Usage:
+    python search_bench.py --sizes 1000,10000,100000 --queries 100
+    python search_bench.py --other-users 5000 --other-todos 500000
+    python search_bench.py --backend mongodb --mongodb-url mongodb://localhost:27017
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from loadtest import percentile
+from repository import SQLiteRepository
+
+WORDS = (
+    "buy milk eggs bread call mom dad dentist doctor write report review budget plan trip book "
+    "flights hotel clean kitchen garage garden water plants pay rent invoice taxes renew passport "
+    "fix bike car service email team meeting notes prepare slides update resume gym run yoga read"
+).split()
+
+
+def make_todo(rng, user_id, created_at):
+    return {
+        "title": " ".join(rng.choices(WORDS, k=rng.randint(2, 5))).capitalize(),
+        "description": " ".join(rng.choices(WORDS, k=rng.randint(0, 12))) or None,
+        "completed": rng.random() < 0.3,
+        "created_at": created_at,
+        "user_id": user_id,
+    }
+
+
+def make_queries(rng, count):
+    queries = []
+    for _ in range(count):
+        words = rng.sample(WORDS, rng.randint(1, 2))
+        prefix = rng.choice(WORDS)[:rng.randint(2, 4)]
+        queries.append((words[:-1] if rng.random() < 0.5 else words, prefix))
+    return queries
+
+
+async def seed(repository, user_ids, count, rng):
+    now = datetime.now(timezone.utc)
+    for start in range(0, count, 1000):
+        await repository.insert_todos([
+            make_todo(rng, user_ids[(start + i) % len(user_ids)], now) for i in range(min(1000, count - start))
+        ])
+
+
+def matches(todo, words, prefix):
+    tokens = f"{todo['title']} {todo.get('description') or ''}".lower().split()
+    return all(word in tokens for word in words) and any(token.startswith(prefix) for token in tokens)
+
+
+async def client_side_search(repository, user_id, words, prefix, limit):
+    found = []
+    async for todo in repository.iter_todos(user_id):
+        if matches(todo, words, prefix):
+            found.append(todo)
+    return found[:limit]
+
+
+async def measure(fn, queries):
+    samples = []
+    for words, prefix in queries:
+        started = time.perf_counter()
+        await fn(words, prefix)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def open_repository(args, workdir):
+    if args.backend == "mongodb":
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from mongo_repository import MongoRepository
+        return MongoRepository(AsyncIOMotorClient(args.mongodb_url), f"search_bench_{os.getpid()}")
+    return SQLiteRepository(os.path.join(workdir, "search_bench.db"))
+
+
+async def run(args, workdir):
+    rng = random.Random(args.seed)
+    repository = open_repository(args, workdir)
+    await repository.ensure_indexes()
+    other_users = [f"other-user-{i}" for i in range(args.other_users)]
+    await seed(repository, other_users, args.other_todos, rng)
+
+    print(f"📊 Search latency per query ({args.backend}, {args.queries} queries, limit {args.limit}, "
+          f"{args.other_todos} todos of {args.other_users} other users)")
+    print(f"   {'todos':>8} {'indexed p50':>12} {'p95':>8} {'client-side p50':>16} {'p95':>8}")
+    seeded = 0
+    user_id = "bench-user"
+    for size in args.sizes:
+        await seed(repository, [user_id], size - seeded, rng)
+        seeded = size
+        queries = make_queries(rng, args.queries)
+        indexed = await measure(
+            lambda words, prefix: repository.search_todos(user_id, words, prefix, args.limit), queries
+        )
+        client_queries = queries[:max(1, args.queries // 10)] if size > 10000 else queries
+        client_side = await measure(
+            lambda words, prefix: client_side_search(repository, user_id, words, prefix, args.limit),
+            client_queries,
+        )
+        print(f"   {size:>8} {percentile(indexed, 50) * 1000:>10.2f}ms {percentile(indexed, 95) * 1000:>6.2f}ms "
+              f"{percentile(client_side, 50) * 1000:>14.2f}ms {percentile(client_side, 95) * 1000:>6.2f}ms")
+
+    if args.backend == "mongodb":
+        await repository.client.drop_database(repository.db.name)
+    await repository.close()
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="Benchmark todo search on large per-user lists")
+    parser.add_argument("--backend", choices=["sqlite", "mongodb"], default="sqlite")
+    parser.add_argument("--mongodb-url", default="mongodb://localhost:27017")
+    parser.add_argument("--sizes", type=lambda v: sorted(int(n) for n in v.split(",")),
+                        default=[1000, 10000, 100000], help="todos per user, comma-separated")
+    parser.add_argument("--other-todos", type=int, default=10000, help="todos belonging to other users")
+    parser.add_argument("--other-users", type=int, default=1000, help="users the other todos are spread over")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        asyncio.run(run(args, workdir))
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for todo response serialization.
+
+Compares the per-item cost of the old path (build TodoListItem/TodoResponse
+models, let FastAPI validate them against response_model and encode with
+JSONResponse) with the fast path (render_todo + dumps_json).
+
+Usage:
+    python serialization_bench.py --items 1000 --rounds 50
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+import main
+
+
+def sample_todos(count):
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": f"{i:024x}",
+            "title": f"Todo number {i}",
+            "description": "Something that needs doing " * 3,
+            "completed": i % 3 == 0,
+            "tags": ["home", "errands"] if i % 2 else [],
+            "created_at": now,
+            "user_id": "65a1b2c3d4e5f60718293a4b",
+        }
+        for i in range(count)
+    ]
+
+
+def route_field(path, method):
+    for route in main.app.routes:
+        if getattr(route, "path", None) == path and method in getattr(route, "methods", ()):
+            return route.response_field
+    raise LookupError(f"{method} {path} not found")
+
+
+async def old_list(todos, field):
+    items = [main.TodoListItem(**todo) for todo in todos]
+    content = await serialize_response(field=field, response_content=items, exclude_unset=True)
+    return JSONResponse(content).body
+
+
+async def old_single(todo, field):
+    content = await serialize_response(field=field, response_content=main.TodoResponse(**todo))
+    return JSONResponse(content).body
+
+
+def new_list(todos):
+    return main.FastJSONResponse([main.render_todo(todo) for todo in todos]).body
+
+
+def new_single(todo):
+    return main.FastJSONResponse(main.render_todo(todo)).body
+
+
+def measure(fn, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="Benchmark todo serialization")
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    todos = sample_todos(args.items)
+    list_field = route_field("/todos", "GET")
+    single_field = route_field("/todos/{todo_id}", "GET")
+    loop = asyncio.new_event_loop()
+
+    results = {
+        "GET /todos (old)": measure(lambda: loop.run_until_complete(old_list(todos, list_field)), args.rounds)
+        / args.items,
+        "GET /todos (fast)": measure(lambda: new_list(todos), args.rounds) / args.items,
+        "GET /todos/{id} (old)": measure(
+            lambda: [loop.run_until_complete(old_single(todo, single_field)) for todo in todos], args.rounds
+        ) / args.items,
+        "GET /todos/{id} (fast)": measure(
+            lambda: [new_single(todo) for todo in todos], args.rounds
+        ) / args.items,
+    }
+    print(f"📊 Per-item serialization cost ({args.items} items x {args.rounds} rounds, "
+          f"encoder: {'orjson' if main.orjson else 'json'})")
+    for name, seconds in results.items():
+        print(f"   {name:<24} {seconds * 1e6:8.2f} µs/item")
+
+
+if __name__ == "__main__":
+    main_bench()
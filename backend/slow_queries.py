@@ -0,0 +1,110 @@
+"""
+Slow-query log shared by the storage backends.
+
+Backends time every database call and report the ones slower than the
+threshold with ``record``, keyed by the query's shape: the SQL text with its
+``?`` placeholders on SQLite, or the command with every filter value redacted
+on MongoDB. The first time a shape turns up slow the backend captures its
+plan (``EXPLAIN QUERY PLAN`` / ``explain``) and stores it with ``set_plan``, so
+a query that stopped using an index shows up in ``report`` with the plan that
+says so.
+
+Records arrive from SQLite worker threads and driver threads alike, so the
+log is guarded by a lock.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+REDACTED = "?"
+
+# Fields whose values are structure rather than data and are kept as they are
+_STRUCTURAL_KEYS = {"sort", "$sort", "projection", "$project", "hint"}
+
+# Runs of placeholders from IN (...) lists built for a variable number of ids
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def redact(value):
+    """Replace every value inside a filter or pipeline, keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: value[key] if key in _STRUCTURAL_KEYS else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Lists whose items all redact alike ($in values, bulk statements)
+        # collapse to one item, so batch sizes do not split a shape
+        items = [redact(item) for item in value]
+        if all(item == items[0] for item in items):
+            return items[:1]
+        return items
+    return REDACTED
+
+
+def sql_shape(sql: str) -> str:
+    return _PLACEHOLDER_LIST.sub("?, ...", " ".join(sql.split()))
+
+
+class SlowQueryLog:
+    def __init__(self, threshold: float, max_shapes: int = 200):
+        self.threshold = threshold
+        self.max_shapes = max_shapes
+        self.lock = threading.Lock()
+        # (backend, shape key) -> stats, least recently slow first
+        self.shapes: "OrderedDict[tuple, dict]" = OrderedDict()
+        self.slow_count = 0
+
+    def record(self, backend: str, shape_key: str, shape, duration: float) -> bool:
+        """Count a slow query; True when its shape is new and needs a plan captured"""
+        key = (backend, shape_key)
+        with self.lock:
+            self.slow_count += 1
+            entry = self.shapes.get(key)
+            new = entry is None
+            if new:
+                entry = self.shapes[key] = {
+                    "backend": backend, "shape": shape, "count": 0, "total": 0.0, "max": 0.0,
+                    "plan": None, "plan_summary": None,
+                }
+                if len(self.shapes) > self.max_shapes:
+                    self.shapes.popitem(last=False)
+            else:
+                self.shapes.move_to_end(key)
+            entry["count"] += 1
+            entry["total"] += duration
+            entry["max"] = max(entry["max"], duration)
+            entry["last_seen"] = time.time()
+        print(f"🐢 Slow {backend} query ({duration * 1000:.1f}ms): {shape_key}")
+        return new
+
+    def set_plan(self, backend: str, shape_key: str, plan, summary: Optional[str]):
+        with self.lock:
+            entry = self.shapes.get((backend, shape_key))
+            if entry is not None:
+                entry["plan"] = plan
+                entry["plan_summary"] = summary
+        if summary:
+            print(f"🔎 Plan for slow {backend} query: {summary}")
+
+    def report(self, limit: int) -> dict:
+        """The ``limit`` shapes with the most total slow time"""
+        with self.lock:
+            entries = sorted(self.shapes.values(), key=lambda e: e["total"], reverse=True)[:limit]
+            shapes = [{
+                "backend": e["backend"],
+                "shape": e["shape"],
+                "count": e["count"],
+                "total_ms": round(e["total"] * 1000, 3),
+                "mean_ms": round(e["total"] / e["count"] * 1000, 3),
+                "max_ms": round(e["max"] * 1000, 3),
+                "last_seen": e["last_seen"],
+                "plan_summary": e["plan_summary"],
+                "plan": e["plan"],
+            } for e in entries]
+        return {"threshold_ms": self.threshold * 1000, "slow_queries": self.slow_count, "shapes": shapes}
+
+
+def shape_key(shape) -> str:
+    return shape if isinstance(shape, str) else json.dumps(shape, sort_keys=True, default=str)
@@ -0,0 +1,77 @@
+"""
+Shared fixtures: every test taking ``repository`` or ``api`` runs once against
+SQLite (a fresh file per test) and once against MongoDB through
+mongomock-motor.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Configuration is read when main is imported
+os.environ.update(
+    DATABASE_BACKEND="sqlite",
+    TODOS_ARCHIVE_AFTER_DAYS="0",
+    AUTH_IP_BURST="10000",
+    AUTH_USERNAME_BURST="10000",
+    SLOW_QUERY_THRESHOLD_MS="0",
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKENDS = ["sqlite", "mongodb"]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+def make_repository(backend, tmp_path):
+    if backend == "sqlite":
+        from repository import SQLiteRepository
+        return SQLiteRepository(str(tmp_path / "todos.db"), reader_threads=2)
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from mongo_repository import MongoRepository
+    return MongoRepository(mongomock_motor.AsyncMongoMockClient(), "todoapp_test")
+
+
+@pytest.fixture(params=BACKENDS)
+async def repository(request, tmp_path, anyio_backend):
+    repo = make_repository(request.param, tmp_path)
+    await repo.ensure_indexes()
+    yield repo
+    await repo.close()
+
+
+class Api:
+    """TestClient plus helpers to register users and send their requests"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def login(self, username: str) -> dict:
+        self.client.post("/register", json={"username": username, "email": f"{username}@example.com",
+                                            "password": "secret"})
+        response = self.client.post("/token", data={"username": username, "password": "secret"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(params=BACKENDS)
+def api(request, tmp_path, monkeypatch):
+    import main
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(main, "SQLITE_PATH", str(tmp_path / "todos.db"))
+    if request.param == "mongodb":
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        from mongo_repository import MongoRepository
+
+        async def connect_mongodb():
+            return MongoRepository(mongomock_motor.AsyncMongoMockClient(), main.DATABASE_NAME)
+        monkeypatch.setattr(main, "DATABASE_BACKEND", "auto")
+        monkeypatch.setattr(main, "connect_mongodb", connect_mongodb)
+    # Tokens for the same username issued within a second are identical
+    main.principal_cache.clear()
+    with TestClient(main.app) as client:
+        yield Api(client)
@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from admission import AdmissionControlMiddleware, InMemoryRateLimitStore, Rate, RouteLimit
+
+pytestmark = pytest.mark.anyio
+
+
+def make_app(limit: RouteLimit, release: asyncio.Event = None):
+    app = FastAPI()
+
+    @app.post("/token")
+    async def token(request: Request):
+        if release is not None:
+            await release.wait()
+        form = await request.form()
+        return {"username": form.get("username")}
+
+    @app.post("/register")
+    async def register(request: Request):
+        return await request.json()
+
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        limits={("POST", "/token"): limit, ("POST", "/register"): limit},
+        store=InMemoryRateLimitStore(),
+    )
+    return app
+
+
+def client(app, ip="10.0.0.1"):
+    transport = httpx.ASGITransport(app=app, client=(ip, 1234))
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+
+async def test_ip_buckets_answer_429_with_retry_after():
+    app = make_app(RouteLimit(10, 10, 1, ip_rate=Rate(60, 2)))
+    async with client(app) as first, client(app, "10.0.0.2") as second:
+        assert [(await first.post("/token", data={"username": "a"})).status_code for _ in range(3)] == [200, 200, 429]
+        rejected = await first.post("/token", data={"username": "a"})
+        assert rejected.status_code == 429 and rejected.headers["Retry-After"] == "1"
+        # Another address has its own bucket
+        assert (await second.post("/token", data={"username": "a"})).status_code == 200
+
+
+async def test_username_buckets_read_form_and_json_bodies():
+    app = make_app(RouteLimit(10, 10, 1, username_rate=Rate(60, 1)))
+    async with client(app) as http:
+        response = await http.post("/token", data={"username": "Alice"})
+        # The body read for the username still reaches the route
+        assert response.status_code == 200 and response.json() == {"username": "Alice"}
+        rejected = await http.post("/token", data={"username": " alice "})
+        assert rejected.status_code == 429 and rejected.headers["Retry-After"] == "1"
+        assert (await http.post("/token", data={"username": "bob"})).status_code == 200
+        assert (await http.post("/register", json={"username": "carol"})).json() == {"username": "carol"}
+        assert (await http.post("/register", json={"username": "CAROL"})).status_code == 429
+        assert (await http.post("/token", content=b"x" * (65 * 1024))).status_code == 413
+
+
+async def test_full_queues_answer_503_with_retry_after():
+    release = asyncio.Event()
+    app = make_app(RouteLimit(1, 1, 0.5), release)
+    async with client(app) as http:
+        running = asyncio.create_task(http.post("/token", data={"username": "a"}))
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(http.post("/token", data={"username": "b"}))
+        await asyncio.sleep(0.05)
+        # One running and one waiting: the next is shed at once
+        shed = await http.post("/token", data={"username": "c"})
+        assert shed.status_code == 503 and shed.headers["Retry-After"] in ("1", "2")
+        # The waiting one gives up after the queue timeout
+        timed_out = await queued
+        assert timed_out.status_code == 503 and "Retry-After" in timed_out.headers
+
+        release.set()
+        assert (await running).status_code == 200
+        assert (await http.post("/token", data={"username": "d"})).status_code == 200
@@ -0,0 +1,283 @@
+import base64
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import main
+
+
+def parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def todos_by_title(lines):
+    return {
+        todo["title"]: (todo["description"], todo["completed"], todo["tags"], parse_time(todo["created_at"]))
+        for todo in map(json.loads, lines)
+    }
+
+
+def test_import_export_round_trip(api):
+    alice = api.login("alice")
+    lines = [
+        json.dumps({"title": f"todo {i}", "description": f"about {i}" if i % 2 else None, "completed": i % 3 == 0,
+                    "tags": ["work"] if i % 2 else [], "created_at": f"2024-01-0{1 + i % 9}T10:00:00+00:00"})
+        for i in range(12)
+    ]
+    body = "\n".join([*lines[:5], "not json", *lines[5:]]) + "\n"
+    result = api.client.post("/todos/import", content=body, headers=alice).json()
+    assert (result["imported"], result["failed"], result["errors"][0]["line"]) == (12, 1, 6)
+
+    exported = api.client.get("/todos/export", headers=alice).text.splitlines()
+    assert todos_by_title(exported) == todos_by_title(lines)
+
+    # Importing the export elsewhere reproduces the same todos
+    bob = api.login("bob")
+    api.client.post("/todos/import", content="\n".join(exported), headers=bob)
+    assert todos_by_title(api.client.get("/todos/export", headers=bob).text.splitlines()) == todos_by_title(lines)
+
+
+def test_import_normalizes_offsets_to_utc(api):
+    alice = api.login("alice")
+    # Listed in time order, which is not the order of their local wall clocks
+    created = ["2024-01-01T11:00:00+05:00", "2024-01-01T09:00:00+02:00", "2024-01-01T08:00:00+00:00",
+               "2024-01-01T05:00:00-04:00"]
+    body = "\n".join(json.dumps({"title": f"todo {i}", "created_at": value}) for i, value in enumerate(created))
+    api.client.post("/todos/import", content=body, headers=alice)
+
+    todos = api.client.get("/todos", headers=alice).json()
+    assert [todo["title"] for todo in todos] == [f"todo {i}" for i in range(len(created))]
+    assert [parse_time(todo["created_at"]) for todo in todos] == [parse_time(value) for value in created]
+    assert all(parse_time(todo["created_at"]).utcoffset().total_seconds() == 0 for todo in todos)
+
+
+def test_failed_imports_still_publish_what_they_stored(api, monkeypatch):
+    monkeypatch.setattr(main, "TODOS_IMPORT_BATCH_SIZE", 1)
+    monkeypatch.setattr(main, "TODOS_IMPORT_MAX_LINE_BYTES", 100)
+    alice = api.login("alice")
+    before = api.client.get("/todos", headers=alice)
+    body = "\n".join(json.dumps({"title": f"todo {i}"}) for i in range(2)) + "\n" + "x" * 200
+    assert api.client.post("/todos/import", content=body, headers=alice).status_code == 413
+
+    after = api.client.get("/todos", headers={**alice, "If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200 and [todo["title"] for todo in after.json()] == ["todo 0", "todo 1"]
+
+
+def test_list_pages_follow_the_cursor(api):
+    alice = api.login("alice")
+    created = [api.client.post("/todos", json={"title": f"todo {i}"}, headers=alice).json()["id"] for i in range(7)]
+
+    seen, cursor = [], None
+    while True:
+        response = api.client.get("/todos", params={"limit": 3, **({"cursor": cursor} if cursor else {})},
+                                  headers=alice)
+        assert response.status_code == 200
+        seen.extend(todo["id"] for todo in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == created
+
+
+def test_changes_since_a_sync_token(api, monkeypatch):
+    monkeypatch.setattr(main, "TODOS_SYNC_LAG_SECONDS", 0.2)
+    alice = api.login("alice")
+    ids = [api.client.post("/todos", json={"title": f"todo {i}"}, headers=alice).json()["id"] for i in range(3)]
+    first = api.client.get("/todos/changes", headers=alice).json()
+    assert sorted(todo["id"] for todo in first["changed"]) == sorted(ids) and not first["has_more"]
+    # Too recent to be covered by a token yet
+    assert first["sync_token"] is None
+
+    time.sleep(0.3)
+    synced = api.client.get("/todos/changes", headers=alice).json()
+    assert sorted(todo["id"] for todo in synced["changed"]) == sorted(ids) and synced["sync_token"]
+
+    api.client.put(f"/todos/{ids[0]}", json={"completed": True}, headers=alice)
+    api.client.delete(f"/todos/{ids[1]}", headers=alice)
+    for _ in range(2):
+        # Unsettled changes come again until the lag has passed
+        changes = api.client.get("/todos/changes", params={"since": synced["sync_token"]}, headers=alice).json()
+        assert [todo["id"] for todo in changes["changed"]] == [ids[0]]
+        assert changes["deleted"] == [ids[1]]
+        assert main.decode_sync_token(changes["sync_token"])[:2] == main.decode_sync_token(synced["sync_token"])[:2]
+
+    time.sleep(0.3)
+    settled = api.client.get("/todos/changes", params={"since": synced["sync_token"]}, headers=alice).json()
+    assert settled["sync_token"] != synced["sync_token"]
+    after = api.client.get("/todos/changes", params={"since": settled["sync_token"]}, headers=alice).json()
+    assert (after["changed"], after["deleted"]) == ([], [])
+
+
+def test_quiet_users_keep_their_sync_tokens(api, monkeypatch):
+    alice = api.login("alice")
+    ids = [api.client.post("/todos", json={"title": f"todo {i}"}, headers=alice).json()["id"] for i in range(3)]
+    clock = [datetime.now(timezone.utc) + timedelta(days=40)]
+
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return clock[0]
+    monkeypatch.setattr(main, "datetime", Clock)
+
+    # A full sync pages through todos older than the retention window
+    seen, token = [], None
+    while True:
+        response = api.client.get("/todos/changes", params={"limit": 1, **({"since": token} if token else {})},
+                                  headers=alice)
+        assert response.status_code == 200
+        seen.extend(todo["id"] for todo in response.json()["changed"])
+        token = response.json()["sync_token"]
+        if not response.json()["has_more"]:
+            break
+    assert seen == ids
+
+    # Nothing has changed since, yet the token stays good while it is used
+    for _ in range(3):
+        clock[0] += timedelta(days=20)
+        response = api.client.get("/todos/changes", params={"since": token}, headers=alice)
+        assert response.status_code == 200 and response.json()["changed"] == []
+        token = response.json()["sync_token"]
+
+    # Unused for longer than the retention window, it may have missed deletions
+    clock[0] += timedelta(days=31)
+    assert api.client.get("/todos/changes", params={"since": token}, headers=alice).status_code == 410
+
+
+def test_batch_updates_bring_archived_todos_back(api, monkeypatch):
+    monkeypatch.setattr(main, "TODOS_SYNC_LAG_SECONDS", 0)
+    alice = api.login("alice")
+    ids = [api.client.post("/todos", json={"title": f"todo {i}"}, headers=alice).json()["id"] for i in range(2)]
+    api.client.put(f"/todos/{ids[0]}", json={"completed": True}, headers=alice)
+    api.client.portal.call(main.repository.archive_completed_todos, datetime.now(timezone.utc) + timedelta(seconds=5), 100)
+    listed = api.client.get("/todos", headers=alice)
+    assert [todo["id"] for todo in listed.json()] == [ids[1]]
+    token = api.client.get("/todos/changes", headers=alice).json()["sync_token"]
+
+    result = api.client.put("/todos/batch", json={"ids": [ids[0]], "update": {"completed": True}}, headers=alice).json()
+    assert (result["matched"], result["modified"], result["results"][0]["status"]) == (1, 1, "updated")
+    relisted = api.client.get("/todos", headers={**alice, "If-None-Match": listed.headers["ETag"]})
+    assert relisted.status_code == 200 and [todo["id"] for todo in relisted.json()] == ids
+    assert api.client.get("/todos/stats", headers=alice).json()["total"] == 2
+    # Delta sync clients saw the archive as a delete and get the todo back
+    changes = api.client.get("/todos/changes", params={"since": token}, headers=alice).json()
+    assert [todo["id"] for todo in changes["changed"]] == [ids[0]]
+
+
+def test_invalid_cursors_are_rejected(api):
+    alice = api.login("alice")
+    malformed = ["not-a-cursor"] + [
+        base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+        for value in (["2020-01-01", 5], [5, "x"], ["2020-01-01"], {"offset": 1}, ["yesterday", "x"])
+    ]
+    for path, name in (("/todos", "cursor"), ("/todos/archive", "cursor"), ("/todos/changes", "since")):
+        for cursor in malformed:
+            assert api.client.get(path, params={name: cursor}, headers=alice).status_code == 400, (path, cursor)
+
+
+def test_event_stream_tickets(api):
+    alice = api.login("alice")
+    ticket = api.client.post("/todos/events/ticket", headers=alice).json()["ticket"]
+    # Only good for opening streams, and access tokens are not taken from the URL
+    assert api.client.get("/todos", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+    access_token = alice["Authorization"].split()[1]
+    assert api.client.get("/todos/events", params={"access_token": access_token}).status_code == 401
+    assert api.client.get("/todos/events", params={"ticket": access_token}).status_code == 401
+
+    # The stream ends when the session it was opened for does
+    ticket = main.create_access_token({"sub": "alice", "use": "stream", "session_exp": time.time() + 0.5})
+    started = time.monotonic()
+    response = api.client.get("/todos/events", params={"ticket": ticket})
+    assert response.status_code == 200 and response.text.startswith("retry:")
+    assert time.monotonic() - started < 5
+
+
+def test_etags_answer_304_until_a_write(api):
+    alice, bob = api.login("alice"), api.login("bob")
+    todo_id = api.client.post("/todos", json={"title": "first"}, headers=alice).json()["id"]
+    listed = api.client.get("/todos", headers=alice)
+    single = api.client.get(f"/todos/{todo_id}", headers=alice)
+    assert listed.headers["ETag"] != single.headers["ETag"]
+
+    for path, response in (("/todos", listed), (f"/todos/{todo_id}", single)):
+        for tag in (response.headers["ETag"], f'W/{response.headers["ETag"]}', f'"other", {response.headers["ETag"]}'):
+            cached = api.client.get(path, headers={**alice, "If-None-Match": tag})
+            assert cached.status_code == 304 and cached.content == b""
+            assert cached.headers["ETag"] == response.headers["ETag"]
+    # Query parameters are part of the tag
+    assert api.client.get("/todos", params={"limit": 1},
+                          headers={**alice, "If-None-Match": listed.headers["ETag"]}).status_code == 200
+
+    # Other users' writes leave the tags alone, the user's own change them
+    api.client.post("/todos", json={"title": "bob's"}, headers=bob)
+    assert api.client.get("/todos", headers={**alice, "If-None-Match": listed.headers["ETag"]}).status_code == 304
+    api.client.put(f"/todos/{todo_id}", json={"title": "renamed"}, headers=alice)
+    for path, response in (("/todos", listed), (f"/todos/{todo_id}", single)):
+        fresh = api.client.get(path, headers={**alice, "If-None-Match": response.headers["ETag"]})
+        assert fresh.status_code == 200 and fresh.headers["ETag"] != response.headers["ETag"]
+    assert api.client.get(f"/todos/{todo_id}", headers=alice).json()["title"] == "renamed"
+
+
+def test_todo_pages_are_cached_until_a_write(api):
+    alice = api.login("alice")
+    api.client.post("/todos", json={"title": "first"}, headers=alice)
+
+    def lookups():
+        stats = main.todo_list_cache.stats()
+        return stats["hits"], stats["misses"]
+
+    def titles(**params):
+        before = lookups()
+        todos = api.client.get("/todos", params=params, headers=alice).json()
+        hits, misses = lookups()
+        return [todo["title"] for todo in todos], ("hit" if hits > before[0] else "miss" if misses > before[1] else None)
+
+    assert titles() == (["first"], "miss")
+    assert titles() == (["first"], "hit")
+    # Each query is its own page
+    assert titles(completed=False) == (["first"], "miss")
+
+    # A write drops the user's pages, and no stale page is served
+    user_id = api.client.get("/users/me", headers=alice).json()["id"]
+    assert user_id in main.todo_list_cache.entries
+    api.client.post("/todos", json={"title": "second"}, headers=alice)
+    assert user_id not in main.todo_list_cache.entries
+    assert titles() == (["first", "second"], "miss")
+    assert titles() == (["first", "second"], "hit")
+
+
+def test_batch_routes_report_each_id(api):
+    alice, bob = api.login("alice"), api.login("bob")
+    created = api.client.post("/todos/batch", json={"todos": [{"title": f"todo {i}"} for i in range(3)]},
+                              headers=alice).json()
+    assert [(item["status"], item["todo"]["title"]) for item in created["results"]] == [
+        ("created", f"todo {i}") for i in range(3)
+    ]
+    ids = [item["id"] for item in created["results"]]
+    bobs = api.client.post("/todos", json={"title": "bob's"}, headers=bob).json()["id"]
+    missing = api.client.post("/todos", json={"title": "gone"}, headers=alice).json()["id"]
+    api.client.delete(f"/todos/{missing}", headers=alice)
+
+    selection = [ids[0], "not-an-id", ids[1], bobs, missing, ids[0]]
+    updated = api.client.put("/todos/batch", json={"ids": selection, "update": {"completed": True}},
+                             headers=alice).json()
+    assert (updated["matched"], updated["modified"]) == (2, 2)
+    assert [(item["id"], item["status"]) for item in updated["results"]] == [
+        ("not-an-id", "invalid_id"), (ids[0], "updated"), (ids[1], "updated"), (bobs, "not_found"),
+        (missing, "not_found"),
+    ]
+    assert all(item["todo"]["completed"] for item in updated["results"] if item["status"] == "updated")
+    assert api.client.get(f"/todos/{bobs}", headers=bob).json()["completed"] is False
+
+    deleted = api.client.request("DELETE", "/todos/batch", json={"ids": selection}, headers=alice).json()
+    assert [(item["id"], item["status"]) for item in deleted["results"]] == [
+        ("not-an-id", "invalid_id"), (ids[0], "deleted"), (ids[1], "deleted"), (bobs, "not_found"),
+        (missing, "not_found"),
+    ]
+    assert [todo["id"] for todo in api.client.get("/todos", headers=alice).json()] == [ids[2]]
+
+    # Selecting by filter reports counts only
+    by_filter = api.client.put("/todos/batch", json={"filter": {}, "update": {"title": "all"}}, headers=alice).json()
+    assert (by_filter["matched"], by_filter["results"]) == (1, [])
+    assert api.client.put("/todos/batch", json={"ids": ids, "filter": {}, "update": {"title": "x"}},
+                          headers=alice).status_code == 422
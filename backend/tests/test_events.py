@@ -0,0 +1,29 @@
+import json
+
+from events import TodoEventBroker
+
+
+def test_replay_needs_every_missed_version():
+    broker = TodoEventBroker(lambda data: json.dumps(data).encode())
+    for version in (1, 2, 4):  # 3 was published by another worker
+        broker.publish("alice", version, "updated", {})
+
+    assert broker.replay("alice", 1) is None
+    assert [version for version, _ in broker.replay("alice", 3)] == [4]
+    assert broker.replay("alice", 4) == []
+    assert broker.replay("bob", 0) is None
+
+
+def test_notify_resyncs_streams_behind_the_stored_version():
+    broker = TodoEventBroker(lambda data: json.dumps(data).encode())
+    subscription = broker.subscribe("alice")
+    broker.publish("alice", 1, "updated", {})
+    broker.notify("alice", 1)  # nothing new
+    broker.notify("alice", 3)  # changed through another worker
+    broker.notify("alice", 3)
+    broker.notify("bob", 5)  # no stream here
+
+    queued = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+    assert [(version, frame is None) for version, frame in queued] == [(1, False), (3, True)]
+    broker.unsubscribe("alice", subscription)
+    assert broker.versions == {}
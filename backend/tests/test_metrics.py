@@ -0,0 +1,15 @@
+from metrics import Registry
+
+
+def test_callback_counters_render_as_counters():
+    registry = Registry()
+    lookups = {"hit": 3, "miss": 1}
+    registry.counter("cache_lookups_total", "Cache lookups by result", ["result"],
+                     callback=lambda: {(result,): count for result, count in lookups.items()})
+    registry.counter("slow_total", "Slow calls", callback=lambda: 2)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE cache_lookups_total counter" in lines
+    assert 'cache_lookups_total{result="hit"} 3' in lines
+    assert 'cache_lookups_total{result="miss"} 1' in lines
+    assert "slow_total 2" in lines
@@ -0,0 +1,325 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from repository import DuplicateUserError, change_key
+
+pytestmark = pytest.mark.anyio
+
+BASE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+async def make_user(repository, username="alice"):
+    user = await repository.create_user({
+        "username": username, "email": f"{username}@example.com", "hashed_password": "x", "created_at": BASE,
+    })
+    return user["_id"]
+
+
+async def make_todos(repository, user_id, count, completed=lambda i: i % 3 == 0, tags=lambda i: []):
+    return await repository.insert_todos([
+        {"title": f"todo {i}", "description": None, "completed": completed(i), "tags": tags(i),
+         "created_at": BASE + timedelta(minutes=i), "user_id": user_id}
+        for i in range(count)
+    ])
+
+
+async def all_pages(repository, user_id, page_size, **kwargs):
+    ids, after = [], None
+    key = kwargs.get("sort", "created_at").lstrip("-")
+    while True:
+        page = await repository.list_todos(user_id, page_size, after=after, **kwargs)
+        ids.extend(todo["id"] for todo in page)
+        if len(page) < page_size:
+            return ids
+        after = (page[-1][key], page[-1]["id"])
+
+
+async def test_create_users_reports_duplicates(repository):
+    await make_user(repository, "alice")
+    results = await repository.create_users([
+        {"username": "bob", "email": "bob@example.com", "hashed_password": "x", "created_at": BASE},
+        {"username": "alice", "email": "other@example.com", "hashed_password": "x", "created_at": BASE},
+    ])
+    assert results[0]["username"] == "bob"
+    assert isinstance(results[1], DuplicateUserError) and results[1].field == "username"
+
+
+async def test_keyset_pages_cover_every_todo_once(repository):
+    user_id = await make_user(repository)
+    other_id = await make_user(repository, "bob")
+    todos = await make_todos(repository, user_id, 23)
+    await make_todos(repository, other_id, 5)
+
+    expected = [todo["id"] for todo in todos]
+    assert await all_pages(repository, user_id, 5) == expected
+    assert await all_pages(repository, user_id, 5, sort="-created_at") == expected[::-1]
+
+
+async def test_list_todos_filters(repository):
+    user_id = await make_user(repository)
+    todos = await make_todos(repository, user_id, 12, tags=lambda i: ["work"] if i % 2 else ["home", "work"][: i % 3])
+
+    def expected(predicate):
+        return [todo["id"] for todo in todos if predicate(todo)]
+
+    assert await all_pages(repository, user_id, 4, completed=False) == expected(lambda t: not t["completed"])
+    assert await all_pages(repository, user_id, 4, tags=["work"]) == expected(lambda t: "work" in t["tags"])
+    assert await all_pages(repository, user_id, 4, tags=["home", "work"]) == expected(
+        lambda t: {"home", "work"} <= set(t["tags"]))
+    assert await all_pages(
+        repository, user_id, 4, created_after=BASE + timedelta(minutes=2), created_before=BASE + timedelta(minutes=9),
+    ) == [todo["id"] for todo in todos[3:9]]
+
+    # A tag filter in updated_at order follows later writes; todos inserted
+    # together share their updated_at and come in id order
+    for todo in reversed(todos[:6]):
+        await asyncio.sleep(0.002)
+        await repository.update_todo(user_id, todo["id"], {"title": "touched"})
+    by_id = {todo["id"]: todo for todo in todos}
+    order = [*sorted(todo["id"] for todo in todos[6:]), *(todo["id"] for todo in reversed(todos[:6]))]
+    work = [todo_id for todo_id in order if "work" in by_id[todo_id]["tags"]]
+    assert await all_pages(repository, user_id, 4, tags=["work"], sort="updated_at") == work
+    assert await all_pages(repository, user_id, 4, tags=["work"], sort="-updated_at") == work[::-1]
+
+
+async def test_sqlite_tag_tables_are_rebuilt_with_updated_at(tmp_path):
+    import sqlite3
+    from repository import SQLiteRepository
+
+    path = str(tmp_path / "todos.db")
+    repository = SQLiteRepository(path, reader_threads=1)
+    user_id = await make_user(repository)
+    todos = await make_todos(repository, user_id, 3, tags=lambda i: ["work"])
+    await repository.close()
+    # The tag table of releases before it was indexed by updated_at
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        DROP TRIGGER todo_tags_insert; DROP TRIGGER todo_tags_delete; DROP TRIGGER todo_tags_update;
+        DROP TABLE todo_tags;
+        CREATE TABLE todo_tags (user_id TEXT NOT NULL, tag TEXT NOT NULL, created_at TEXT NOT NULL,
+            todo_id TEXT NOT NULL, PRIMARY KEY (user_id, tag, created_at, todo_id)) WITHOUT ROWID;
+    ''')
+    conn.close()
+
+    repository = SQLiteRepository(path, reader_threads=1)
+    await repository.update_todo(user_id, todos[0]["id"], {"title": "touched"})
+    assert await all_pages(repository, user_id, 2, tags=["work"], sort="updated_at") == [
+        *sorted(todo["id"] for todo in todos[1:]), todos[0]["id"],
+    ]
+    await repository.close()
+
+
+async def test_todos_versions_of_several_users(repository):
+    alice, bob = await make_user(repository, "alice"), await make_user(repository, "bob")
+    for _ in range(2):
+        await repository.bump_todos_version(alice)
+    missing = "0" * 24 if repository.name == "mongodb" else "nobody"
+    assert await repository.get_todos_versions([alice, bob, missing]) == {alice: 2, bob: 0}
+
+
+async def test_update_todos_by_ids_and_by_filter(repository):
+    user_id = await make_user(repository)
+    todos = await make_todos(repository, user_id, 6)
+    ids = [todos[1]["id"], todos[2]["id"]]
+
+    matched, modified, updated = await repository.update_todos(user_id, {"title": "picked"}, ids=ids)
+    assert (matched, modified) == (2, 2)
+    assert sorted(todo["id"] for todo in updated) == sorted(ids)
+
+    matched, _, _ = await repository.update_todos(user_id, {"title": "open"}, completed=False)
+    assert matched == 4
+    listed = await repository.list_todos(user_id, 10)
+    assert [todo["title"] == "open" for todo in listed] == [not todo["completed"] for todo in listed]
+
+    await repository.update_todos(user_id, {"completed": True}, completed=False)
+    assert await repository.get_todo_stats(user_id) == {"total": 6, "completed": 6}
+    assert await repository.repair_todo_stats() == 0
+
+
+async def test_update_todos_keeps_to_the_selection(repository):
+    user_id = await make_user(repository)
+    todos = await make_todos(repository, user_id, 6)
+    done = sorted(todo["id"] for todo in todos if todo["completed"])
+
+    # Reopening the completed todos must not touch the open ones
+    matched, modified, _ = await repository.update_todos(user_id, {"completed": False, "title": "reopened"},
+                                                         completed=True)
+    assert (matched, modified) == (len(done), len(done))
+    listed = await repository.list_todos(user_id, 10)
+    assert sorted(todo["id"] for todo in listed if todo["title"] == "reopened") == done
+    assert not any(todo["completed"] for todo in listed)
+    assert await repository.get_todo_stats(user_id) == {"total": 6, "completed": 0}
+
+    # Marking everything complete leaves already-complete todos untouched
+    await repository.update_todos(user_id, {"completed": True}, ids=done)
+    stamps = {entry["id"]: entry["updated_at"] for entry in await repository.list_changes(user_id, 100)}
+    await asyncio.sleep(0.01)
+    matched, modified, _ = await repository.update_todos(user_id, {"completed": True})
+    assert (matched, modified) == (6, 6 - len(done))
+    changes = {entry["id"]: entry["updated_at"] for entry in await repository.list_changes(user_id, 100)}
+    assert sorted(todo_id for todo_id in changes if changes[todo_id] == stamps[todo_id]) == done
+    assert await repository.get_todo_stats(user_id) == {"total": 6, "completed": 6}
+
+
+async def test_delete_todos_by_filter_records_tombstones(repository):
+    user_id = await make_user(repository)
+    todos = await make_todos(repository, user_id, 6)
+    done = [todo["id"] for todo in todos if todo["completed"]]
+
+    deleted, deleted_ids = await repository.delete_todos(user_id, completed=True)
+    assert deleted == len(done) and sorted(deleted_ids) == sorted(done)
+    assert await repository.get_todo_stats(user_id) == {"total": 4, "completed": 0}
+    changes = await repository.list_changes(user_id, 100)
+    assert sorted(entry["id"] for entry in changes if "deleted_at" in entry) == sorted(done)
+
+    deleted, deleted_ids = await repository.delete_todos(user_id, ids=[todos[1]["id"], done[0]])
+    assert (deleted, deleted_ids) == (1, [todos[1]["id"]])
+
+
+async def test_list_changes_after_a_sync_key(repository):
+    user_id = await make_user(repository)
+    todos = await make_todos(repository, user_id, 4)
+    synced = await repository.list_changes(user_id, 100)
+    assert [entry["id"] for entry in synced] and len(synced) == 4
+    since = change_key(synced[-1])
+    # Keys are exact here; holding tokens back from same-instant writes is the API's job
+    await asyncio.sleep(0.01)
+
+    await repository.update_todo(user_id, todos[0]["id"], {"title": "renamed"})
+    await repository.delete_todo(user_id, todos[1]["id"])
+    changes = await repository.list_changes(user_id, 100, after=since)
+    assert [(entry["id"], "deleted_at" in entry) for entry in changes] == [
+        (todos[0]["id"], False), (todos[1]["id"], True),
+    ]
+    # Paged one entry at a time, the same changes come back in the same order
+    paged, after = [], since
+    while page := await repository.list_changes(user_id, 1, after=after):
+        paged.extend(page)
+        after = change_key(page[-1])
+    assert [entry["id"] for entry in paged] == [entry["id"] for entry in changes]
+
+
+async def test_apply_todo_writes_reports_each_write(repository):
+    user_id = await make_user(repository)
+    todo = (await make_todos(repository, user_id, 1, completed=lambda i: False))[0]
+    missing = "00000000-0000-0000-0000-000000000000" if repository.name == "sqlite" else "0" * 24
+
+    results = await repository.apply_todo_writes([
+        ("insert", {"title": "new", "description": None, "completed": True, "tags": [],
+                    "created_at": BASE, "user_id": user_id}),
+        ("update", user_id, todo["id"], {"completed": True}),
+        ("update", user_id, missing, {"title": "x"}),
+        ("delete", user_id, missing),
+    ])
+    assert results[0]["title"] == "new"
+    assert results[1]["completed"] is True
+    assert results[2] is None and results[3] is False
+    assert await repository.get_todo_stats(user_id) == {"total": 2, "completed": 2}
+
+
+async def test_apply_todo_writes_applies_writes_to_one_todo_in_order(repository):
+    user_id = await make_user(repository)
+    todo = (await make_todos(repository, user_id, 1, completed=lambda i: False))[0]
+
+    results = await repository.apply_todo_writes([
+        ("update", user_id, todo["id"], {"completed": True}),
+        ("update", user_id, todo["id"], {"title": "renamed"}),
+        ("update", user_id, todo["id"], {"completed": False}),
+        ("update", user_id, todo["id"], {"completed": True}),
+        ("delete", user_id, todo["id"]),
+        ("update", user_id, todo["id"], {"title": "gone"}),
+        ("delete", user_id, todo["id"]),
+    ])
+    assert [(result["title"], result["completed"]) for result in results[:4]] == [
+        ("todo 0", True), ("renamed", True), ("renamed", False), ("renamed", True),
+    ]
+    assert results[4:] == [True, None, False]
+    assert await repository.get_todo_stats(user_id) == {"total": 0, "completed": 0}
+    assert await repository.repair_todo_stats() == 0
+
+
+async def test_archive_moves_completed_todos_out_and_back(repository):
+    user_id = await make_user(repository)
+    todos = await make_todos(repository, user_id, 6, tags=lambda i: ["work"])
+    done = sorted(todo["id"] for todo in todos if todo["completed"])
+
+    archived = await repository.archive_completed_todos(datetime.now(timezone.utc) + timedelta(seconds=5), 100)
+    assert sorted(archived[user_id]) == done
+    assert await repository.archive_completed_todos(datetime.now(timezone.utc) + timedelta(seconds=5), 100) == {}
+    active = [todo["id"] for todo in await repository.list_todos(user_id, 100)]
+    assert sorted(active) == sorted(todo["id"] for todo in todos if not todo["completed"])
+    assert sorted(todo["id"] for todo in await repository.list_archived_todos(user_id, 100)) == done
+    assert len(await repository.list_todos(user_id, 100, include_archived=True, tags=["work"])) == 6
+    assert await repository.get_todo_stats(user_id) == {"total": 4, "completed": 0}
+    # Exports walk both tables in one (created_at, id) order
+    exported = [todo["id"] async for todo in repository.iter_todos(user_id, batch_size=2, include_archived=True)]
+    assert exported == [todo["id"] for todo in todos]
+    assert [todo["id"] async for todo in repository.iter_todos(user_id, batch_size=2)] == active
+
+    # Addressing an archived todo by id moves it back first
+    assert (await repository.get_todo(user_id, done[0]))["id"] == done[0]
+    updated = await repository.update_todo(user_id, done[0], {"title": "back"})
+    assert updated["title"] == "back" and updated["completed"] is True
+    assert await repository.delete_todo(user_id, done[1])
+    assert await repository.get_todo(user_id, done[1]) is None
+    assert await repository.get_todo_stats(user_id) == {"total": 5, "completed": 1}
+    assert await repository.repair_todo_stats() == 0
+
+
+async def test_archive_skips_todos_deleted_while_it_runs(repository, monkeypatch):
+    if repository.name != "mongodb":
+        pytest.skip("SQLite archives in a single transaction")
+    user_id = await make_user(repository)
+    todos = await make_todos(repository, user_id, 2, completed=lambda i: True)
+    find_one_and_delete = repository.todos.find_one_and_delete
+
+    async def deleted_first(query, **kwargs):
+        # The user deletes the first todo once the archiver has read it
+        if str(query["_id"]) == todos[0]["id"]:
+            await repository.todos.delete_one({"_id": query["_id"]})
+        return await find_one_and_delete(query, **kwargs)
+    monkeypatch.setattr(repository.todos, "find_one_and_delete", deleted_first)
+
+    archived = await repository.archive_completed_todos(datetime.now(timezone.utc) + timedelta(seconds=5), 100)
+    assert archived == {user_id: [todos[1]["id"]]}
+    assert [todo["id"] for todo in await repository.list_archived_todos(user_id, 100)] == [todos[1]["id"]]
+    assert await repository.get_todo(user_id, todos[0]["id"]) is None
+
+
+async def test_backfills_run_once(repository):
+    if repository.name != "mongodb":
+        pytest.skip("SQLite migrations are keyed on missing columns")
+    user_id = await make_user(repository)
+    await repository.todos.insert_one({"title": "old", "completed": True, "created_at": BASE, "user_id": user_id})
+    # The fixture's ensure_indexes already recorded every backfill
+    assert await repository.run_backfills() == 0
+
+    await repository.meta.delete_many({})
+    await repository.users.update_many({}, {"$unset": {"todos_total": "", "todos_completed": ""}})
+    assert await repository.run_backfills() == len(repository.BACKFILLS)
+    old = await repository.todos.find_one({"title": "old"})
+    assert old["updated_at"] == old["created_at"] and old["tags"] == []
+    assert await repository.get_todo_stats(user_id) == {"total": 1, "completed": 1}
+    assert await repository.run_backfills() == 0
+
+
+async def test_search_only_matches_the_users_todos(repository):
+    if repository.name != "sqlite":
+        pytest.skip("mongomock has no $text")
+    user_id = await make_user(repository)
+    other_id = await make_user(repository, "bob")
+    for owner in (user_id, other_id):
+        await repository.insert_todos([
+            {"title": title, "description": description, "completed": False, "tags": [], "created_at": BASE,
+             "user_id": owner}
+            for title, description in (("Buy milk", None), ("Errands", "buy bread and milk"), ("Call mom", None))
+        ])
+
+    found = await repository.search_todos(user_id, [], "mil", 10)
+    assert [todo["title"] for todo in found] == ["Buy milk", "Errands"]  # title matches rank first
+    assert {todo["user_id"] for todo in found} == {user_id}
+    assert [todo["title"] for todo in await repository.search_todos(user_id, ["buy"], "bre", 10)] == ["Errands"]
+    # A user's id is not searchable text
+    assert await repository.search_todos(user_id, [], user_id.split("-")[0], 10) == []
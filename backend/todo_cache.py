@@ -0,0 +1,126 @@
+"""
+Cache of rendered ``GET /todos`` pages, per user.
+
+Every cached page is tagged with the user's todos_version it was rendered at.
+The route reads the current version anyway (it is the ETag source), so a page
+is only served when it was built from the current version: a write made
+through another worker can never be answered from a stale page here. Writes
+also drop the user's pages straight away (``invalidate``), so memory is not
+held by pages that can no longer be served.
+
+``InMemoryTodoListCache`` keeps pages per process, least recently used users
+first out once the byte budget is spent. ``load_cache`` accepts
+``"module:Class"`` for a backend shared between workers.
+"""
+
+import importlib
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Rough bookkeeping cost of one cached page on top of its body
+PAGE_OVERHEAD_BYTES = 200
+
+
+class TodoListCache:
+    async def get(self, user_id: str, version: int, page_key: str) -> Optional[Tuple[bytes, Optional[str]]]:
+        """``(body, next_cursor)`` of a page rendered at ``version``, or None"""
+        raise NotImplementedError
+
+    async def put(self, user_id: str, version: int, page_key: str, body: bytes, next_cursor: Optional[str]):
+        raise NotImplementedError
+
+    async def invalidate(self, user_id: str):
+        """Drop every cached page of ``user_id``"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class _UserPages:
+    __slots__ = ("version", "expires_at", "pages", "size")
+
+    def __init__(self, version: int, expires_at: float):
+        self.version = version
+        self.expires_at = expires_at
+        self.pages: Dict[str, Tuple[bytes, Optional[str]]] = {}
+        self.size = 0
+
+
+class InMemoryTodoListCache(TodoListCache):
+    """Per-process pages, bounded by ``max_bytes`` in total and ``ttl_seconds`` per user"""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, _UserPages]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, user_id, version, page_key):
+        entry = self.entries.get(user_id)
+        page = None
+        if entry is not None:
+            if entry.expires_at <= time.monotonic() or entry.version < version:
+                self._remove(user_id)
+            elif entry.version == version:
+                page = entry.pages.get(page_key)
+        if page is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return page
+
+    async def put(self, user_id, version, page_key, body, next_cursor):
+        page_size = len(body) + len(next_cursor or "") + PAGE_OVERHEAD_BYTES
+        if page_size > self.max_bytes or self.ttl_seconds <= 0:
+            return
+        entry = self.entries.get(user_id)
+        if entry is not None and entry.version > version:
+            return  # rendered before a write another request already cached past
+        if entry is None or entry.version < version:
+            if entry is not None:
+                self._remove(user_id)
+            entry = self.entries[user_id] = _UserPages(version, time.monotonic() + self.ttl_seconds)
+        previous = entry.pages.get(page_key)
+        if previous is not None:
+            page_size -= len(previous[0]) + len(previous[1] or "") + PAGE_OVERHEAD_BYTES
+        entry.pages[page_key] = (body, next_cursor)
+        entry.size += page_size
+        self.size += page_size
+        self.entries.move_to_end(user_id)
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    async def invalidate(self, user_id):
+        if user_id in self.entries:
+            self._remove(user_id)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, user_id: str):
+        self.size -= self.entries.pop(user_id).size
+
+
+def load_cache(spec: str, max_bytes: int, ttl_seconds: float) -> Optional[TodoListCache]:
+    """``"memory"``, ``"none"`` (no caching) or an importable ``"module:Class"``
+    taking no arguments, which must not open connections before first use"""
+    if spec == "none":
+        return None
+    if spec == "memory":
+        return InMemoryTodoListCache(max_bytes, ttl_seconds)
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
@@ -1,5 +1,6 @@
 import { useState, useEffect } from 'react'
 import axios from 'axios'
+import config from '../config'
 import { PlusIcon, PencilIcon, TrashIcon, CheckIcon, XMarkIcon } from '@heroicons/react/24/outline'
 
 function TodoList() {
@@ -13,10 +14,76 @@ function TodoList() {
     fetchTodos()
   }, [])
 
+  // Live updates from other tabs/devices; EventSource reconnects on its own
+  // and resumes from the last event id it saw
+  useEffect(() => {
+    if (!localStorage.getItem('token')) return
+    let source = null
+    let retry = null
+    let stopped = false
+
+    const upsert = (event) => {
+      const changed = JSON.parse(event.data).todos
+      setTodos(current => {
+        const byId = new Map(changed.map(todo => [todo.id, todo]))
+        const merged = current.map(todo => {
+          const update = byId.get(todo.id)
+          byId.delete(todo.id)
+          return update || todo
+        })
+        return [...merged, ...byId.values()]
+      })
+    }
+    // Archived todos leave the active list just like deleted ones
+    const remove = (event) => {
+      const ids = new Set(JSON.parse(event.data).ids)
+      setTodos(current => current.filter(todo => !ids.has(todo.id)))
+    }
+
+    const connect = async (reconnecting) => {
+      let ticket
+      try {
+        // A short-lived ticket keeps the access token out of the URL
+        ticket = (await axios.post('/todos/events/ticket')).data.ticket
+      } catch (error) {
+        return  // Signed out or session expired
+      }
+      if (stopped) return
+      source = new EventSource(`${config.API_BASE_URL}/todos/events?ticket=${encodeURIComponent(ticket)}`)
+      source.addEventListener('created', upsert)
+      source.addEventListener('updated', upsert)
+      source.addEventListener('deleted', remove)
+      source.addEventListener('archived', remove)
+      source.addEventListener('resync', () => fetchTodos())
+      // EventSource gives up once reconnecting is refused (the ticket has
+      // expired); a new stream starts without Last-Event-ID, so refetch
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED && !stopped) {
+          retry = setTimeout(() => connect(true), 3000)
+        }
+      }
+      if (reconnecting) fetchTodos()
+    }
+    connect(false)
+
+    return () => {
+      stopped = true
+      clearTimeout(retry)
+      if (source) source.close()
+    }
+  }, [])
+
   const fetchTodos = async () => {
     try {
-      const response = await axios.get('/todos')
-      setTodos(response.data)
+      // GET /todos is paginated; follow X-Next-Cursor until the last page
+      const allTodos = []
+      let cursor = null
+      do {
+        const response = await axios.get('/todos', { params: cursor ? { cursor } : {} })
+        allTodos.push(...response.data)
+        cursor = response.headers['x-next-cursor']
+      } while (cursor)
+      setTodos(allTodos)
     } catch (error) {
       setError('Failed to fetch todos')
     } finally {
@@ -30,7 +97,9 @@ function TodoList() {
 
     try {
       const response = await axios.post('/todos', newTodo)
-      setTodos([...todos, response.data])
+      setTodos(current => current.some(todo => todo.id === response.data.id)
+        ? current
+        : [...current, response.data])
       setNewTodo({ title: '', description: '' })
       setError('')
     } catch (error) {
@@ -41,7 +110,7 @@ function TodoList() {
   const updateTodo = async (id, updates) => {
     try {
       const response = await axios.put(`/todos/${id}`, updates)
-      setTodos(todos.map(todo => todo.id === id ? response.data : todo))
+      setTodos(current => current.map(todo => todo.id === id ? response.data : todo))
       setEditingTodo(null)
       setError('')
     } catch (error) {
@@ -52,7 +121,7 @@ function TodoList() {
   const deleteTodo = async (id) => {
     try {
       await axios.delete(`/todos/${id}`)
-      setTodos(todos.filter(todo => todo.id !== id))
+      setTodos(current => current.filter(todo => todo.id !== id))
       setError('')
     } catch (error) {
       setError('Failed to delete todo')